@@ -0,0 +1,70 @@
+"""Measure the per-request overhead of creating a `BatchedInferencePipeline` for every request compared to reusing the one created by the model manager.
+
+Both variants transcribe the same short clip, so the difference between them is the cost of building the pipeline (and whatever it sets up lazily on its first use). The model has to be downloaded beforehand.
+
+Usage:
+    python scripts/benchmark_batched_pipeline.py Systran/faster-whisper-tiny.en --requests 50
+"""
+
+import argparse
+from collections.abc import Callable
+import statistics
+import time
+
+from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+from faster_whisper.transcribe import BatchedInferencePipeline
+import numpy as np
+from numpy.typing import NDArray
+
+from speaches.batching import SharedBatchedInferencePipeline
+
+
+def time_requests(
+    get_pipeline: Callable[[], BatchedInferencePipeline],
+    audio: NDArray[np.float32],
+    requests: int,
+    batch_size: int,
+) -> list[float]:
+    timings: list[float] = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        segments, _ = get_pipeline().transcribe(audio, batch_size=batch_size)
+        list(segments)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_id")
+    parser.add_argument("--audio", default="audio.wav")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Length of the clip transcribed by every request")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--compute-type", default="default")
+    args = parser.parse_args()
+
+    model = WhisperModel(args.model_id, device=args.device, compute_type=args.compute_type, local_files_only=True)
+    audio = decode_audio(args.audio)[: int(args.seconds * 16000)]
+    shared_pipeline = SharedBatchedInferencePipeline(model)
+    # the first transcription loads the VAD model and warms up the model
+    list(shared_pipeline.transcribe(audio)[0])
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        BatchedInferencePipeline(model=model)
+    construction = (time.perf_counter() - start) / args.requests
+
+    per_request = time_requests(lambda: BatchedInferencePipeline(model=model), audio, args.requests, args.batch_size)
+    reused = time_requests(lambda: shared_pipeline, audio, args.requests, args.batch_size)
+
+    print(f"pipeline construction: {construction * 1e6:.1f}µs")
+    print(f"new pipeline per request: median {statistics.median(per_request) * 1000:.2f}ms")
+    print(f"reused pipeline:          median {statistics.median(reused) * 1000:.2f}ms")
+    print(f"difference: {(statistics.median(per_request) - statistics.median(reused)) * 1000:.2f}ms per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Measure the latency of many concurrent transcription requests against a running server.
+
+`--concurrency` requests are kept in flight at all times until `--requests` have completed, and the latency percentiles and throughput are printed. Run it against a server started from each revision being compared, with the same model preloaded (see `PRELOAD_MODELS`) so that the first requests don't include loading it.
+Requests to `/v1/audio/speech/timestamps` can be mixed in with `--vad-ratio`, which shows whether voice activity detection gets held up by transcriptions.
+
+Usage:
+    python scripts/benchmark_concurrent_requests.py Systran/faster-whisper-tiny.en --concurrency 64 --requests 512
+"""
+
+import argparse
+import asyncio
+from pathlib import Path
+import random
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+
+async def send_request(client: httpx.AsyncClient, args: argparse.Namespace, audio: bytes, *, vad: bool) -> float:
+    start = time.perf_counter()
+    if vad:
+        response = await client.post("/v1/audio/speech/timestamps", files={"file": ("audio.wav", audio)})
+    else:
+        response = await client.post(
+            "/v1/audio/transcriptions",
+            files={"file": ("audio.wav", audio)},
+            data={"model": args.model_id, "response_format": args.response_format},
+        )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(args: argparse.Namespace) -> None:
+    audio = Path(args.audio).read_bytes()
+    timings: dict[bool, list[float]] = {False: [], True: []}
+    remaining = args.requests
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            vad = random.random() < args.vad_ratio  # noqa: S311
+            timings[vad].append(await send_request(client, args, audio, vad=vad))
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"{args.requests} requests, {args.concurrency} concurrent, {elapsed:.1f}s ({args.requests / elapsed:.2f} req/s)"
+    )
+    for vad, name in ((False, "transcription"), (True, "vad")):
+        if len(timings[vad]) == 0:
+            continue
+        values = timings[vad]
+        print(
+            f"{name:>13}: n={len(values)} mean={statistics.mean(values) * 1000:.0f}ms "
+            f"p50={percentile(values, 50) * 1000:.0f}ms p90={percentile(values, 90) * 1000:.0f}ms "
+            f"p99={percentile(values, 99) * 1000:.0f}ms max={max(values) * 1000:.0f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_id")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--audio", default="audio.wav")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--response-format", default="json")
+    parser.add_argument("--vad-ratio", type=float, default=0.0, help="Fraction of requests made to the VAD endpoint")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Compare the throughput of decoding uploads on threads (`EXECUTORS__DECODE_PROCESSES=0`) with decoding them on a process pool.
+
+A mixed-format corpus is generated by encoding `--audio` as MP3, M4A (AAC), Opus, FLAC and WAV, and `--files` uploads (cycling through the formats) are decoded by `--concurrency` threads, the same way `audio_file_dependency` does (so the WAV files are read with NumPy in both modes). Besides the throughput, the worst delay seen by a pure Python thread which wakes up every millisecond is reported, as a proxy for how much the decoding gets in the way of request handling by holding the GIL.
+
+Usage:
+    python scripts/benchmark_decode_processes.py --files 200 --concurrency 16 --processes 8
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import io
+import threading
+import time
+
+import av
+from faster_whisper.audio import decode_audio
+import numpy as np
+
+from speaches.audio import decode_audio_file
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.executors import RestartingProcessPoolExecutor
+
+FORMATS = {
+    # extension: (container, codec)
+    "mp3": ("mp3", "libmp3lame"),
+    "m4a": ("mp4", "aac"),
+    "opus": ("ogg", "libopus"),
+    "flac": ("flac", "flac"),
+    "wav": ("wav", "pcm_s16le"),
+}
+
+
+def encode(audio: np.ndarray, container_format: str, codec: str) -> bytes:
+    pcm = (audio * 32768).clip(-32768, 32767).astype(np.int16).reshape(1, -1)
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format=container_format) as container:
+        stream = container.add_stream(codec, rate=48000 if codec == "libopus" else SAMPLES_PER_SECOND)
+        frame = av.AudioFrame.from_ndarray(pcm, format="s16", layout="mono")
+        frame.sample_rate = SAMPLES_PER_SECOND
+        # NOTE: the frame gets converted to the format, sample rate and frame size expected by the encoder
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+class SchedulingProbe:
+    """Measures how late a thread sleeping for 1ms gets woken up."""
+
+    def __init__(self) -> None:
+        self.worst_delay = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.001)
+            self.worst_delay = max(self.worst_delay, time.perf_counter() - start - 0.001)
+
+    def __enter__(self) -> "SchedulingProbe":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run(corpus: list[bytes], concurrency: int, process_pool: RestartingProcessPoolExecutor | None) -> None:
+    def decode(data: bytes) -> int:
+        return len(decode_audio_file(io.BytesIO(data), process_pool=process_pool))
+
+    with ThreadPoolExecutor(concurrency) as threads:
+        # warm up (e.g. spawn the processes and import PyAV in them)
+        list(threads.map(decode, corpus[: len(FORMATS)] * concurrency))
+        with SchedulingProbe() as probe:
+            start = time.perf_counter()
+            samples = sum(threads.map(decode, corpus))
+            elapsed = time.perf_counter() - start
+    mode = "threads" if process_pool is None else f"{process_pool.max_workers} processes"
+    print(
+        f"{mode:>12}: {len(corpus) / elapsed:8.1f} files/s {samples / SAMPLES_PER_SECOND / elapsed:8.0f}x realtime "
+        f"{probe.worst_delay * 1000:8.1f}ms worst scheduling delay"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", default="audio.wav")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--processes", type=int, nargs="+", default=[4, 8])
+    args = parser.parse_args()
+
+    clip = decode_audio(args.audio)
+    encoded = {extension: encode(clip, *FORMATS[extension]) for extension in FORMATS}
+    for extension, data in encoded.items():
+        print(f"{extension:>5}: {len(data) / 1024:8.0f}KB")
+    extensions = list(encoded)
+    corpus = [encoded[extensions[i % len(extensions)]] for i in range(args.files)]
+
+    run(corpus, args.concurrency, None)
+    for processes in args.processes:
+        process_pool = RestartingProcessPoolExecutor(processes)
+        try:
+            run(corpus, args.concurrency, process_pool)
+        finally:
+            process_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure the real-time factor (RTF) and word error rate (WER) of each decoding profile (see `WhisperConfig.decoding_profiles`).
+
+Every profile transcribes `--audio` `--repeat` times with the same options as the server passes to `WhisperModel.transcribe` and the fastest run is reported. The RTF is the transcription time divided by the duration of the audio, so lower is faster. The WER is computed against the text in `--reference` after lowercasing and removing punctuation. Without a reference, it's computed against the transcript of the `accurate` profile instead, which only shows how far the faster profiles drift from it. The numbers depend heavily on the model, device, compute type and audio, so they should be measured on the deployment's own setup, which gets printed along with them as a Markdown table. The model has to be downloaded beforehand.
+
+Usage:
+    python scripts/benchmark_decoding_profiles.py Systran/faster-whisper-small --reference reference.txt
+"""
+
+import argparse
+import os
+from pathlib import Path
+import platform
+import re
+import time
+
+import ctranslate2
+import faster_whisper
+from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+
+from speaches.config import SAMPLES_PER_SECOND, WhisperConfig
+
+
+def normalize(text: str) -> list[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: list[str], hypothesis: list[str]) -> float:
+    """Word-level Levenshtein distance divided by the length of the reference."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, reference_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hypothesis_word in enumerate(hypothesis, start=1):
+            current.append(
+                min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (reference_word != hypothesis_word))
+            )
+        previous = current
+    return previous[-1] / max(len(reference), 1)
+
+
+def processor_name() -> str:
+    try:
+        cpuinfo = Path("/proc/cpuinfo").read_text()
+    except OSError:
+        return platform.processor() or platform.machine()
+    match = re.search(r"^model name\s*:\s*(.+)$", cpuinfo, re.MULTILINE)
+    return match.group(1) if match is not None else platform.machine()
+
+
+def describe_setup(model: WhisperModel) -> str:
+    device = model.model.device
+    if device == "cuda":
+        device = f"cuda:{model.model.device_index[0]}"
+    return (
+        f"device {device} ({processor_name()}, {os.cpu_count()} CPUs), compute type {model.model.compute_type}, "
+        f"faster-whisper {faster_whisper.__version__}, CTranslate2 {ctranslate2.__version__}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_id")
+    parser.add_argument("--audio", default="audio.wav")
+    parser.add_argument("--reference", type=Path, help="File with the reference transcript of `--audio`")
+    parser.add_argument("--language", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--compute-type", default="default")
+    args = parser.parse_args()
+
+    model = WhisperModel(args.model_id, device=args.device, compute_type=args.compute_type, local_files_only=True)
+    audio = decode_audio(args.audio)
+    duration = len(audio) / SAMPLES_PER_SECOND
+    # warm up
+    list(model.transcribe(audio[: 5 * SAMPLES_PER_SECOND], language=args.language)[0])
+
+    transcripts: dict[str, str] = {}
+    rtfs: dict[str, float] = {}
+    for name, profile in WhisperConfig().decoding_profiles.items():
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            segments, _ = model.transcribe(audio, language=args.language, **profile.model_dump(exclude_unset=True))
+            transcripts[name] = "".join(segment.text for segment in segments)
+            best = min(best, time.perf_counter() - start)
+        rtfs[name] = best / duration
+
+    if args.reference is not None:
+        reference, reference_name = args.reference.read_text(), args.reference.name
+    else:
+        reference, reference_name = transcripts["accurate"], "the accurate profile"
+    print(f"`{args.model_id}` on `{args.audio}` ({duration:.1f}s), WER against {reference_name}")
+    print(f"{describe_setup(model)}\n")
+    print("| Profile    | RTF    | WER    |")
+    print("| ---------- | ------ | ------ |")
+    for name, rtf in rtfs.items():
+        wer = word_error_rate(normalize(reference), normalize(transcripts[name]))
+        print(f"| {f'`{name}`':<10} | {rtf:<6.3f} | {f'{wer * 100:.1f}%':<6} |")
+
+
+if __name__ == "__main__":
+    main()
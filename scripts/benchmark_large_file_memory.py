@@ -0,0 +1,96 @@
+"""Compare the peak memory (RSS) of decoding long files into memory with spilling them to a memory-mapped temporary file.
+
+For every duration a WAV file is generated by repeating `--audio`, and each mode runs in a fresh process which decodes it and iterates over it in 30 second windows (transcribing them when `--model` is given). With spilling, the peak should stay flat as the duration grows, while decoding into memory grows by about 230MB per hour.
+
+Usage:
+    python scripts/benchmark_large_file_memory.py --hours 0.5 1 2 4
+    python scripts/benchmark_large_file_memory.py --hours 1 2 --model Systran/faster-whisper-tiny.en
+"""
+
+import argparse
+import multiprocessing
+from pathlib import Path
+import resource
+import tempfile
+
+from faster_whisper.audio import decode_audio
+import numpy as np
+import soundfile as sf
+
+from speaches.audio import SpilledAudio
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.windowed_transcription import WINDOW_SECONDS, WindowedTranscription
+
+
+def peak_rss_mb() -> float:
+    # NOTE: `ru_maxrss` is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_long_wav(path: Path, clip: np.ndarray, seconds: float) -> None:
+    remaining = int(seconds * SAMPLES_PER_SECOND)
+    with sf.SoundFile(path, "w", samplerate=SAMPLES_PER_SECOND, channels=1, subtype="PCM_16") as f:
+        while remaining > 0:
+            block = clip[:remaining]
+            f.write(block)
+            remaining -= len(block)
+
+
+def run(mode: str, path: Path, model_id: str | None, result: multiprocessing.Queue) -> None:
+    baseline = peak_rss_mb()
+    if mode == "memory":
+        audio = decode_audio(str(path))
+        chunks = (
+            audio[i : i + WINDOW_SECONDS * SAMPLES_PER_SECOND]
+            for i in range(0, len(audio), WINDOW_SECONDS * SAMPLES_PER_SECOND)
+        )
+    else:
+        with path.open("rb") as f:
+            spilled = SpilledAudio.decode(f)
+        chunks = spilled.chunks(WINDOW_SECONDS)
+
+    if model_id is None:
+        for _ in chunks:
+            pass
+    else:
+        from faster_whisper import WhisperModel
+
+        from speaches.segments import Segment
+
+        model = WhisperModel(model_id, local_files_only=True)
+
+        def transcribe_window(window: np.ndarray, **kwargs) -> tuple[list[Segment], object]:
+            segments, info = model.transcribe(window, **kwargs)
+            return list(Segment.from_faster_whisper_segments(segments)), info
+
+        for _ in WindowedTranscription(transcribe_window, chunks, {}).start():  # pyright: ignore[reportArgumentType]
+            pass
+    result.put((baseline, peak_rss_mb()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--audio", default="audio.wav", help="Clip which gets repeated to the requested duration")
+    parser.add_argument("--hours", type=float, nargs="+", default=[0.5, 1.0, 2.0])
+    parser.add_argument("--model", help="Also transcribe the windows with this (already downloaded) model")
+    args = parser.parse_args()
+
+    clip = decode_audio(args.audio)
+    context = multiprocessing.get_context("spawn")
+    print(f"{'hours':>6} {'mode':>7} {'baseline':>10} {'peak':>10} {'increase':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for hours in args.hours:
+            path = Path(tmp_dir) / f"{hours}h.wav"
+            write_long_wav(path, clip, hours * 3600)
+            for mode in ("memory", "spill"):
+                result = context.Queue()
+                process = context.Process(target=run, args=(mode, path, args.model, result))
+                process.start()
+                baseline, peak = result.get()
+                process.join()
+                print(f"{hours:>6} {mode:>7} {baseline:>8.0f}MB {peak:>8.0f}MB {peak - baseline:>8.0f}MB")
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
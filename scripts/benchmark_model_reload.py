@@ -0,0 +1,75 @@
+"""Measure how much faster a Whisper model reloads when its files are kept in the page cache by `ModelWarmer`.
+
+Each round loads the model twice: once after evicting its files from the page cache ("cold") and once after warming them ("warm"). The model has to be downloaded beforehand.
+
+Usage:
+    python scripts/benchmark_model_reload.py Systran/faster-whisper-large-v3 --rounds 5
+"""
+
+import argparse
+import gc
+import os
+from pathlib import Path
+import statistics
+import time
+
+from faster_whisper import WhisperModel
+
+from speaches.model_manager import ModelWarmer, list_model_weight_files
+
+
+def evict_from_page_cache(files: list[Path]) -> None:
+    for file in files:
+        fd = os.open(file, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def time_load(model_id: str, device: str, compute_type: str) -> float:
+    start = time.perf_counter()
+    model = WhisperModel(model_id, device=device, compute_type=compute_type, local_files_only=True)
+    elapsed = time.perf_counter() - start
+    del model
+    gc.collect()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_id")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--device", default="auto")
+    parser.add_argument("--compute-type", default="default")
+    args = parser.parse_args()
+
+    files = list_model_weight_files(args.model_id)
+    if len(files) == 0:
+        raise SystemExit(f"{args.model_id} isn't downloaded. Run `huggingface-cli download {args.model_id}` first")
+    size = sum(file.stat().st_size for file in files)
+    warmer = ModelWarmer(budget=size)
+    print(f"{args.model_id}: {len(files)} files, {size / 1024**2:.0f} MB")
+
+    cold_load_times: list[float] = []
+    warm_load_times: list[float] = []
+    for i in range(args.rounds):
+        evict_from_page_cache(files)
+        cold_load_times.append(time_load(args.model_id, args.device, args.compute_type))
+
+        evict_from_page_cache(files)
+        warmer.warm(args.model_id)
+        time.sleep(1)  # `MADV_WILLNEED` reads the files ahead asynchronously
+        warm_load_times.append(time_load(args.model_id, args.device, args.compute_type))
+        warmer.release(args.model_id)
+        print(f"round {i + 1}: cold {cold_load_times[-1]:.2f}s, warm {warm_load_times[-1]:.2f}s")
+
+    cold = statistics.median(cold_load_times)
+    warm = statistics.median(warm_load_times)
+    print(f"median cold load: {cold:.2f}s")
+    print(f"median warm load: {warm:.2f}s")
+    print(f"saved: {cold - warm:.2f}s ({(cold - warm) / cold:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Compare building and serializing responses from the Pydantic models in `speaches.api_types` with doing so from `speaches.segments`.
+
+The segments of `--hours` of speech with word timestamps (`--words-per-minute` words, in 5 second segments) are generated as `faster_whisper` would return them, and each response format is produced from them `--repeat` times. The times include converting the `faster_whisper` segments, since that's where the Pydantic models were built (and validated).
+
+Usage:
+    python scripts/benchmark_segment_serialization.py --hours 1
+"""
+
+import argparse
+from collections.abc import Callable
+import random
+import time
+from types import SimpleNamespace
+
+from faster_whisper.transcribe import Segment as FasterWhisperSegment
+from faster_whisper.transcribe import Word
+
+from speaches.api_types import (
+    CreateTranscriptionResponseJson,
+    CreateTranscriptionResponseVerboseJson,
+    TranscriptionSegment,
+)
+from speaches.segments import Segment, segments_to_json, segments_to_subtitles, segments_to_verbose_json
+from speaches.text_utils import segments_to_srt, segments_to_vtt
+
+SEGMENT_SECONDS = 5
+
+
+def generate_segments(hours: float, words_per_minute: int) -> list[FasterWhisperSegment]:
+    rng = random.Random(0)  # noqa: S311
+    words_per_segment = words_per_minute * SEGMENT_SECONDS // 60
+    segments: list[FasterWhisperSegment] = []
+    for i in range(int(hours * 3600 / SEGMENT_SECONDS)):
+        start = i * SEGMENT_SECONDS
+        step = SEGMENT_SECONDS / words_per_segment
+        words = [
+            Word(
+                start=round(start + j * step, 2),
+                end=round(start + (j + 1) * step, 2),
+                word=" " + "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 9))),
+                probability=rng.random(),
+            )
+            for j in range(words_per_segment)
+        ]
+        segments.append(
+            FasterWhisperSegment(
+                id=i + 1,
+                seek=start * 100,
+                start=start,
+                end=start + SEGMENT_SECONDS,
+                text="".join(word.word for word in words),
+                tokens=[rng.randint(0, 50000) for _ in range(words_per_segment * 2)],
+                avg_logprob=-rng.random(),
+                compression_ratio=1 + rng.random(),
+                no_speech_prob=rng.random(),
+                words=words,
+                temperature=0.0,
+            )
+        )
+    return segments
+
+
+def measure(fn: Callable[[], str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=1.0)
+    parser.add_argument("--words-per-minute", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fw_segments = generate_segments(args.hours, args.words_per_minute)
+    info = SimpleNamespace(
+        language="en", duration=args.hours * 3600, transcription_options=SimpleNamespace(word_timestamps=True)
+    )
+
+    def models() -> list[TranscriptionSegment]:
+        return list(TranscriptionSegment.from_faster_whisper_segments(fw_segments))
+
+    def segments() -> list[Segment]:
+        return list(Segment.from_faster_whisper_segments(fw_segments))
+
+    cases: dict[str, tuple[Callable[[], str], Callable[[], str]]] = {
+        "json": (
+            lambda: CreateTranscriptionResponseJson.from_segments(models()).model_dump_json(),
+            lambda: segments_to_json(segments()),
+        ),
+        "verbose_json": (
+            lambda: CreateTranscriptionResponseVerboseJson.from_segments(models(), info).model_dump_json(),  # pyright: ignore[reportArgumentType]
+            lambda: segments_to_verbose_json(segments(), info),  # pyright: ignore[reportArgumentType]
+        ),
+        "srt": (
+            lambda: "".join(segments_to_srt(s, i) for i, s in enumerate(models())),
+            lambda: segments_to_subtitles(segments(), "srt"),
+        ),
+        "vtt": (
+            lambda: "".join(segments_to_vtt(s, i) for i, s in enumerate(models())),
+            lambda: segments_to_subtitles(segments(), "vtt"),
+        ),
+    }
+    words = sum(len(segment.words or []) for segment in fw_segments)
+    print(f"{len(fw_segments)} segments, {words} words")
+    print(f"{'format':>13} {'pydantic':>10} {'segments':>10} {'speedup':>8}")
+    for response_format, (pydantic, compact) in cases.items():
+        pydantic_time = measure(pydantic, args.repeat)
+        compact_time = measure(compact, args.repeat)
+        print(
+            f"{response_format:>13} {pydantic_time * 1000:>8.1f}ms {compact_time * 1000:>8.1f}ms "
+            f"{pydantic_time / compact_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
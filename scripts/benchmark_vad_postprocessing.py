@@ -0,0 +1,105 @@
+"""Compare turning speech probabilities into speech timestamps with `faster_whisper.vad.get_speech_timestamps` (a Python loop over every window) with doing so with `speaches.vad.speech_timestamp_arrays`, and building the `/v1/audio/speech/timestamps` response from Pydantic models with writing it directly.
+
+The "before" column is the former and the "after" column the latter. The probabilities of `--hours` of audio are generated as alternating runs of noisy speech (2 to 8 seconds) and silence (0.3 to 3 seconds), so no model is needed. `get_speech_timestamps` is given them in place of running the model, so only the post-processing is timed. The times are the best of `--repeat` runs.
+
+Usage:
+    python scripts/benchmark_vad_postprocessing.py --hours 3
+"""
+
+import argparse
+from collections.abc import Callable
+import time
+
+import faster_whisper.vad
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+import numpy as np
+from pydantic import TypeAdapter
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.routers.vad import MS_SAMPLE_RATE, SpeechTimestamp, speech_timestamps_to_json
+from speaches.vad import WINDOW_SIZE_SAMPLES, speech_timestamp_arrays
+
+WINDOWS_PER_SECOND = SAMPLES_PER_SECOND / WINDOW_SIZE_SAMPLES
+CASES = {
+    "defaults": VadOptions(),
+    "speech_pad_ms=200": VadOptions(min_silence_duration_ms=500, speech_pad_ms=200),
+    "max_speech_duration_s=30": VadOptions(max_speech_duration_s=30),
+    "max_speech_duration_s=5": VadOptions(max_speech_duration_s=5),
+}
+
+
+def generate_probabilities(hours: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    windows = int(hours * 3600 * WINDOWS_PER_SECOND)
+    probabilities = np.empty(windows, dtype=np.float32)
+    i = 0
+    speech = True
+    while i < windows:
+        seconds = rng.uniform(2, 8) if speech else rng.uniform(0.3, 3)
+        run = probabilities[i : i + int(seconds * WINDOWS_PER_SECOND)]
+        run[:] = np.clip((0.9 if speech else 0.05) + rng.normal(0, 0.15, len(run)), 0, 1)
+        i += len(run)
+        speech = not speech
+    return probabilities
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hours", type=float, default=3.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    probabilities = generate_probabilities(args.hours)
+    audio = np.zeros(len(probabilities) * WINDOW_SIZE_SAMPLES, dtype=np.float32)
+    # NOTE: `get_speech_timestamps` only uses the model to compute the probabilities
+    faster_whisper.vad.get_vad_model = lambda: lambda _: probabilities[np.newaxis]
+    adapter = TypeAdapter(list[SpeechTimestamp])
+
+    print(f"{len(probabilities)} windows ({args.hours} hours)")
+    print(f"{'options':>26} {'speeches':>8} {'before':>10} {'after':>10} {'speedup':>8}")
+    for name, vad_options in CASES.items():
+        starts, ends = speech_timestamp_arrays(probabilities, len(audio), vad_options)
+        assert get_speech_timestamps(audio, vad_options) == [
+            {"start": start, "end": end} for start, end in zip(starts.tolist(), ends.tolist(), strict=True)
+        ]
+        loop_time = measure(lambda vad_options=vad_options: get_speech_timestamps(audio, vad_options), args.repeat)
+        arrays_time = measure(
+            lambda vad_options=vad_options: speech_timestamp_arrays(probabilities, len(audio), vad_options),
+            args.repeat,
+        )
+        print(
+            f"{name:>26} {len(starts):>8} {loop_time * 1000:>8.1f}ms {arrays_time * 1000:>8.1f}ms "
+            f"{loop_time / arrays_time:>7.1f}x"
+        )
+
+    starts, ends = speech_timestamp_arrays(probabilities, len(audio), VadOptions())
+    raw_speech_timestamps = [
+        {"start": start, "end": end} for start, end in zip(starts.tolist(), ends.tolist(), strict=True)
+    ]
+
+    def pydantic() -> bytes:
+        speech_timestamps = [SpeechTimestamp.model_validate(x) for x in raw_speech_timestamps]
+        for speech_timestamp in speech_timestamps:
+            speech_timestamp.start //= MS_SAMPLE_RATE
+            speech_timestamp.end //= MS_SAMPLE_RATE
+        return adapter.dump_json(speech_timestamps)
+
+    pydantic_time = measure(pydantic, args.repeat)
+    direct_time = measure(lambda: speech_timestamps_to_json(starts, ends), args.repeat)
+    print(
+        f"{'response (defaults)':>26} {len(starts):>8} {pydantic_time * 1000:>8.1f}ms {direct_time * 1000:>8.1f}ms "
+        f"{pydantic_time / direct_time:>7.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
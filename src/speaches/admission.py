@@ -0,0 +1,230 @@
+"""Admission control for inference requests.
+
+Each model gets a FIFO queue in front of it. At most `max_concurrency` requests are admitted at once, up to `max_queued` more wait for their turn and the rest get rejected right away instead of piling onto the threadpool. Requests which wait longer than `max_queue_wait` seconds get rejected as well.
+A request holds its slot until it's done. For streamed responses that's once the body has been sent, which is after the endpoint has returned (see `AdmissionSlot.hold`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+import logging
+import math
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, AsyncIterable, AsyncIterator, Callable
+
+    from speaches.config import AdmissionConfig
+
+logger = logging.getLogger(__name__)
+
+SERVICE_TIME_SMOOTHING = 0.2
+"""Weight of the latest request in the exponential moving average of the service time."""
+
+
+class AdmissionRejectedError(Exception):
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        """Suggested number of seconds to wait before retrying."""
+
+
+class QueueFullError(AdmissionRejectedError):
+    pass
+
+
+class QueueTimeoutError(AdmissionRejectedError):
+    pass
+
+
+class RequestQueue:
+    """Must only be used from a single event loop."""
+
+    def __init__(self, model_id: str, max_concurrency: int, max_queued: int, max_queue_wait: float) -> None:
+        self.model_id = model_id
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_queue_wait = max_queue_wait
+        self.active = 0
+        self.waiters: deque[asyncio.Future[None]] = deque()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        """Seconds spent in the queue by all admitted requests."""
+        self.service_time: float | None = None
+        """Exponential moving average of how long (in seconds) admitted requests hold their slot."""
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.waiters)
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.admitted if self.admitted > 0 else 0.0
+
+    def retry_after(self) -> int:
+        """Estimate of how long it takes for the current queue to drain."""
+        service_time = self.service_time if self.service_time is not None else 1.0
+        return max(math.ceil(service_time * (self.queue_depth + 1) / self.max_concurrency), 1)
+
+    async def acquire(self) -> None:
+        if self.active < self.max_concurrency and len(self.waiters) == 0:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.max_queued:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Too many requests for {self.model_id}: {self.active} in progress and {len(self.waiters)} queued",
+                self.retry_after(),
+            )
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_queue_wait)
+        except TimeoutError as e:
+            self._abandon(waiter)
+            self.timed_out += 1
+            raise QueueTimeoutError(
+                f"Request for {self.model_id} waited in the queue for more than {self.max_queue_wait}s",
+                self.retry_after(),
+            ) from e
+        except asyncio.CancelledError:
+            # e.g. the client disconnected
+            self._abandon(waiter)
+            raise
+        self.admitted += 1
+        self.total_wait += time.perf_counter() - start
+
+    def _abandon(self, waiter: asyncio.Future[None]) -> None:
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+        elif waiter.done():
+            # the slot was granted right as the wait got cut short
+            self.release(None)
+
+    def release(self, service_time: float | None) -> None:
+        self.active -= 1
+        if service_time is not None:
+            self.service_time = (
+                service_time
+                if self.service_time is None
+                else SERVICE_TIME_SMOOTHING * service_time + (1 - SERVICE_TIME_SMOOTHING) * self.service_time
+            )
+        while len(self.waiters) > 0 and self.active < self.max_concurrency:
+            waiter = self.waiters.popleft()
+            self.active += 1
+            waiter.set_result(None)
+
+
+class AdmissionSlot:
+    """Yielded by `AdmissionController.admit`. The slot gets released when the `admit` block exits, unless `hold` was called."""
+
+    def __init__(self, release: Callable[[], None]) -> None:
+        self._release = release
+        self.held = False
+        self.released = False
+
+    def hold(self) -> None:
+        """Keep the slot past the `admit` block, until `release` is called (e.g. by `release_after`)."""
+        self.held = True
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._release()
+
+    def release_after[T](self, iterable: AsyncIterable[T]) -> AsyncIterator[T]:
+        """Pass the items through and release the slot once they've all been produced, producing them failed or got cancelled, or the iterator is dropped (e.g. the response never got sent)."""
+        return _ReleasingIterator(self, iterable)
+
+
+class _ReleasingIterator[T]:
+    def __init__(self, slot: AdmissionSlot, iterable: AsyncIterable[T]) -> None:
+        self.slot = slot
+        self.iterator = aiter(iterable)
+        self.loop = asyncio.get_running_loop()
+
+    def __aiter__(self) -> AsyncIterator[T]:
+        return self
+
+    async def __anext__(self) -> T:
+        try:
+            return await anext(self.iterator)
+        except BaseException:
+            self.slot.release()
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            if hasattr(self.iterator, "aclose"):
+                await self.iterator.aclose()  # pyright: ignore[reportAttributeAccessIssue]
+        finally:
+            self.slot.release()
+
+    def __del__(self) -> None:
+        # NOTE: finalizers can run on any thread (e.g. during the `gc.collect` of the model reaper), while the queue must only be used from its event loop
+        if not self.slot.released and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.slot.release)
+
+
+class AdmissionController:
+    def __init__(self, config: AdmissionConfig) -> None:
+        self.config = config
+        self.queues: dict[str, RequestQueue] = {}
+        self.in_flight = Counter[str]()
+        """Number of admitted requests being processed per model, including models without a concurrency limit."""
+
+    def _max_concurrency(self, model_id: str) -> int | None:
+        return self.config.model_max_concurrent_requests.get(model_id, self.config.max_concurrent_requests)
+
+    def get_queue(self, model_id: str) -> RequestQueue | None:
+        """`None` if requests for `model_id` aren't limited."""
+        max_concurrency = self._max_concurrency(model_id)
+        if max_concurrency is None:
+            return None
+        if model_id not in self.queues:
+            self.queues[model_id] = RequestQueue(
+                model_id, max_concurrency, self.config.max_queued_requests, self.config.max_queue_wait
+            )
+        return self.queues[model_id]
+
+    def is_saturated(self) -> bool:
+        """Whether any model's queue is full, meaning that its next request would be rejected."""
+        return any(
+            queue.active >= queue.max_concurrency and queue.queue_depth >= queue.max_queued
+            for _, queue in list(self.queues.items())
+        )
+
+    @asynccontextmanager
+    async def admit(self, model_id: str) -> AsyncGenerator[AdmissionSlot, None]:
+        queue = self.get_queue(model_id)
+        if queue is not None:
+            try:
+                await queue.acquire()
+            except AdmissionRejectedError as e:
+                logger.warning(str(e))
+                raise
+        self.in_flight[model_id] += 1
+        start = time.perf_counter()
+
+        def release() -> None:
+            self.in_flight[model_id] -= 1
+            if self.in_flight[model_id] == 0:
+                del self.in_flight[model_id]
+            if queue is not None:
+                queue.release(time.perf_counter() - start)
+
+        slot = AdmissionSlot(release)
+        try:
+            yield slot
+        except BaseException:
+            slot.release()
+            raise
+        if not slot.held:
+            slot.release()
@@ -6,6 +6,7 @@ from typing import Literal
 import faster_whisper.transcribe
 from pydantic import BaseModel, Field, computed_field
 
+from speaches.segments import SEEK_FRAMES_PER_SECOND
 from speaches.text_utils import segments_to_text
 
 
@@ -47,6 +48,13 @@ class TranscriptionSegment(BaseModel):
     no_speech_prob: float
     words: list[TranscriptionWord] | None
 
+    def offset(self, seconds: float) -> None:
+        self.seek += round(seconds * SEEK_FRAMES_PER_SECOND)
+        self.start += seconds
+        self.end += seconds
+        for word in self.words or []:
+            word.offset(seconds)
+
     @classmethod
     def from_faster_whisper_segments(
         cls, segments: Iterable[faster_whisper.transcribe.Segment]
@@ -1,15 +1,32 @@
 from __future__ import annotations
 
+import contextlib
+from dataclasses import dataclass
+import gc
+import hashlib
 import io
 import logging
-from typing import TYPE_CHECKING, BinaryIO
+import mmap
+from multiprocessing import resource_tracker, shared_memory
+import secrets
+import struct
+import tempfile
+from typing import TYPE_CHECKING, BinaryIO, Self
+import weakref
 
+import av
+import av.audio.resampler
+from faster_whisper.audio import decode_audio
 import numpy as np
 import soundfile as sf
 
 from speaches.config import SAMPLES_PER_SECOND
 
 if TYPE_CHECKING:
+    from collections.abc import Generator
+    from concurrent.futures import Executor
+    from pathlib import Path
+
     from numpy.typing import NDArray
 
     from speaches.routers.speech import ResponseFormat
@@ -65,6 +82,313 @@ def audio_samples_from_file(file: BinaryIO) -> NDArray[np.float32]:
     return audio  # pyright: ignore[reportReturnType]
 
 
+def decode_pcm16_incrementally(
+    file: BinaryIO, sampling_rate: int = SAMPLES_PER_SECOND
+) -> Generator[NDArray[np.int16], None, None]:
+    """Same as `faster_whisper.audio.decode_audio`, except that the audio is yielded (as 16-bit PCM) as it gets decoded rather than once the whole file has been read. `file` only needs to be readable, which allows decoding formats that can be read sequentially (e.g. WAV, MP3, OGG, FLAC or WebM) while the file is still being received."""
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    try:
+        with av.open(file, mode="r", metadata_errors="ignore") as container:
+            frames = container.decode(audio=0)
+            while True:
+                try:
+                    frame = next(frames)
+                except StopIteration:
+                    break
+                except av.error.InvalidDataError:
+                    continue
+                frame.pts = None  # ignore the timestamp check, same as `decode_audio`
+                for resampled_frame in resampler.resample(frame):
+                    yield resampled_frame.to_ndarray().reshape(-1)
+            # flush the resampler
+            for resampled_frame in resampler.resample(None):
+                yield resampled_frame.to_ndarray().reshape(-1)
+    finally:
+        # https://github.com/SYSTRAN/faster-whisper/issues/390
+        del resampler
+        gc.collect()
+
+
+def pcm16_to_float32(pcm: NDArray[np.int16]) -> NDArray[np.float32]:
+    # NOTE: a single pass (and allocation), unlike `pcm.astype(np.float32) / 32768.0`. The result is the same since 1 / 32768 is exact
+    return np.multiply(pcm, 1 / 32768, dtype=np.float32)
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# NOTE: sizes of 0 and 0xFFFFFFFF are written by encoders which don't know the length up front (e.g. when streaming)
+_UNKNOWN_DATA_SIZES = (0, 0xFFFFFFFF)
+_WAV_SAMPLE_DTYPES = {(WAVE_FORMAT_PCM, 16): "<i2", (WAVE_FORMAT_IEEE_FLOAT, 32): "<f4"}
+
+
+@dataclass(frozen=True, slots=True)
+class PcmFormat:
+    """Layout of uncompressed, interleaved, little-endian samples, which can be read with `np.frombuffer` rather than decoded."""
+
+    sample_rate: int
+    channels: int = 1
+    dtype: str = "<i2"
+    """`<i2` for 16-bit PCM or `<f4` for 32-bit float."""
+    size: int | None = None
+    """Number of bytes of samples following the header. `None` means until the end of the file."""
+
+    @property
+    def frame_size(self) -> int:
+        return np.dtype(self.dtype).itemsize * self.channels
+
+    @property
+    def is_native(self) -> bool:
+        """Whether the samples are already in the format produced by `decode_pcm16_incrementally`."""
+        return self.sample_rate == SAMPLES_PER_SECOND and self.channels == 1 and self.dtype == "<i2"
+
+
+def sniff_wav(file: BinaryIO) -> PcmFormat | None:
+    """Parse the header of a WAV file containing 16-bit PCM or 32-bit float samples, leaving `file` positioned at the start of the samples.
+
+    `None` is returned, and `file` is rewound, for anything else (including WAV files with compressed samples, such as ADPCM or μ-law), which should be decoded with PyAV instead.
+    """
+    header = file.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        file.seek(0)
+        return None
+    fmt: tuple[int, int, int, int] | None = None
+    while len(chunk_header := file.read(8)) == 8:
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        if chunk_id == b"fmt ":
+            body = file.read(chunk_size + chunk_size % 2)
+            if len(body) < 16:
+                break
+            format_tag, channels, sample_rate, _, _, bits_per_sample = struct.unpack_from("<HHIIHH", body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # the first 2 bytes of the sub-format GUID are the actual format tag
+                (format_tag,) = struct.unpack_from("<H", body, 24)
+            fmt = (format_tag, channels, sample_rate, bits_per_sample)
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            format_tag, channels, sample_rate, bits_per_sample = fmt
+            dtype = _WAV_SAMPLE_DTYPES.get((format_tag, bits_per_sample))
+            if dtype is None or channels == 0 or sample_rate == 0:
+                break
+            size = None if chunk_size in _UNKNOWN_DATA_SIZES else chunk_size
+            return PcmFormat(sample_rate=sample_rate, channels=channels, dtype=dtype, size=size)
+        else:
+            # e.g. `LIST` or `fact`. Chunks are padded to an even size
+            file.seek(chunk_size + chunk_size % 2, io.SEEK_CUR)
+    file.seek(0)
+    return None
+
+
+def resample(audio: NDArray[np.float32], sample_rate: int, target_sample_rate: int) -> NDArray[np.float32]:
+    """Resample with NumPy. Integer downsampling factors (e.g. 48kHz or 32kHz to 16kHz) average every `factor` samples, which also acts as a (crude) anti-aliasing filter. Any other ratio (e.g. 44.1kHz or 8kHz) is linearly interpolated."""
+    if sample_rate == target_sample_rate or len(audio) == 0:
+        return audio
+    if sample_rate % target_sample_rate == 0:
+        factor = sample_rate // target_sample_rate
+        return audio[: len(audio) // factor * factor].reshape(-1, factor).mean(axis=1, dtype=np.float32)
+    target_length = len(audio) * target_sample_rate // sample_rate
+    positions = np.arange(target_length, dtype=np.float64) * (sample_rate / target_sample_rate)
+    left = positions.astype(np.int64)
+    right = np.minimum(left + 1, len(audio) - 1)
+    weights = (positions - left).astype(np.float32)
+    return audio[left] + (audio[right] - audio[left]) * weights
+
+
+def read_pcm(file: BinaryIO, pcm_format: PcmFormat) -> NDArray[np.float32]:
+    """Read the samples described by `pcm_format` from the current position of `file` into mono float32 audio sampled at `SAMPLES_PER_SECOND`, without going through a decoder."""
+    data = file.read() if pcm_format.size is None else file.read(pcm_format.size)
+    # a truncated upload may end in the middle of a frame
+    frames = len(data) // pcm_format.frame_size
+    samples = np.frombuffer(data, dtype=pcm_format.dtype, count=frames * pcm_format.channels)
+    if pcm_format.channels > 1:
+        # the channels are averaged, which is what PyAV's resampler does when downmixing to mono
+        audio = samples.reshape(frames, pcm_format.channels).mean(axis=1, dtype=np.float32)
+        if pcm_format.dtype == "<i2":
+            audio *= 1 / 32768
+    elif pcm_format.dtype == "<i2":
+        audio = pcm16_to_float32(samples)
+    else:
+        audio = samples.astype(np.float32)
+    return resample(audio, pcm_format.sample_rate, SAMPLES_PER_SECOND)
+
+
+def decode_to_shared_memory(data: bytes, name: str) -> int:
+    """Decode `data` (in a process pool worker) into a new shared memory block called `name`. Returns the number of samples in it, which are read (and the block is unlinked) by `read_shared_memory`. See `decode_in_process`."""
+    audio = decode_audio(io.BytesIO(data))
+    shm = shared_memory.SharedMemory(name=name, create=True, size=max(audio.nbytes, 1))
+    # NOTE: otherwise this process' resource tracker would unlink the block when the worker exits, or warn about it having leaked
+    resource_tracker.unregister(shm._name, "shared_memory")  # pyright: ignore[reportAttributeAccessIssue]  # noqa: SLF001
+    shared = np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)
+    shared[:] = audio
+    del shared  # the buffer can't be released while it's exported
+    shm.close()
+    return len(audio)
+
+
+def read_shared_memory(name: str, samples: int) -> NDArray[np.float32]:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # NOTE: copied out since the array would otherwise have to keep the block (which is tied to the request) mapped
+        return np.frombuffer(shm.buf, dtype=np.float32, count=samples).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def unlink_shared_memory(name: str) -> None:
+    """Remove the shared memory block called `name`, if it exists."""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def decode_in_process(data: bytes, process_pool: Executor) -> NDArray[np.float32]:
+    """Decode `data` on `process_pool`, with the samples being passed back through shared memory rather than pickled.
+
+    The name of the block is chosen here so that it can be unlinked if the worker fails to hand it over (e.g. it died after creating the block). Since the worker stops tracking the block, it would otherwise stay in `/dev/shm` until the next reboot.
+    """
+    name = f"speaches_{secrets.token_hex(8)}"
+    try:
+        samples = process_pool.submit(decode_to_shared_memory, data, name).result()
+    except BaseException:
+        unlink_shared_memory(name)
+        raise
+    return read_shared_memory(name, samples)
+
+
+def decode_audio_file(
+    file: BinaryIO, pcm_format: PcmFormat | None = None, process_pool: Executor | None = None
+) -> NDArray[np.float32]:
+    """Same as `faster_whisper.audio.decode_audio`, except that WAV files containing 16-bit PCM or 32-bit float samples, and raw PCM described by `pcm_format`, are read directly with NumPy. Only compressed formats go through PyAV, on `process_pool` if given (see `decode_in_process`)."""
+    if pcm_format is None:
+        pcm_format = sniff_wav(file)
+    if pcm_format is not None:
+        return read_pcm(file, pcm_format)
+    if process_pool is not None:
+        return decode_in_process(file.read(), process_pool)
+    return decode_audio(file)  # pyright: ignore[reportReturnType]
+
+
+def read_pcm16_incrementally(
+    file: BinaryIO, pcm_format: PcmFormat, chunk_seconds: int = 30
+) -> Generator[NDArray[np.int16], None, None]:
+    """Same as `decode_pcm16_incrementally` for samples which are already in the native format (see `PcmFormat.is_native`), which only need to be copied."""
+    assert pcm_format.is_native
+    remaining = pcm_format.size
+    chunk_size = chunk_seconds * SAMPLES_PER_SECOND * pcm_format.frame_size
+    leftover = b""
+    while remaining is None or remaining > 0:
+        data = file.read(chunk_size if remaining is None else min(chunk_size, remaining))
+        if not data:
+            break
+        if remaining is not None:
+            remaining -= len(data)
+        data = leftover + data
+        usable = len(data) - len(data) % pcm_format.frame_size
+        leftover = data[usable:]
+        if usable > 0:
+            yield np.frombuffer(data, dtype=np.int16, count=usable // pcm_format.frame_size)
+
+
+def decode_audio_incrementally(
+    file: BinaryIO, sampling_rate: int = SAMPLES_PER_SECOND
+) -> Generator[NDArray[np.float32], None, None]:
+    for pcm in decode_pcm16_incrementally(file, sampling_rate):
+        yield pcm16_to_float32(pcm)
+
+
+class SpilledAudio:
+    """Decoded audio kept as 16-bit PCM in an (already unlinked) temporary file instead of memory.
+
+    `chunks` memory-maps the file and converts one chunk at a time, releasing the pages which have been read, so the memory used doesn't depend on the duration of the audio. `decode_audio` on the other hand holds all of it as float32, which is about 230MB per hour.
+    `close` has to be called once the audio isn't needed anymore (or it has to be used as a context manager).
+    """
+
+    def __init__(self, file: BinaryIO, samples: int, digest: str) -> None:
+        self.file = file
+        self.samples = samples
+        self.digest = digest
+        """Hash of the PCM data, for use as a `TranscriptionCache` key."""
+        self.readers: weakref.WeakSet[Generator[NDArray[np.float32], None, None]] = weakref.WeakSet()
+        """Iterators returned by `chunks`, each of which holds a memory map of the file until it's exhausted or closed."""
+
+    @classmethod
+    def decode(cls, file: BinaryIO, spill_dir: Path | None = None, pcm_format: PcmFormat | None = None) -> SpilledAudio:
+        """Decode `file` into a temporary file. Like `decode_audio_file`, raw PCM (described by `pcm_format`) and WAV files are read without a decoder when their samples are already 16kHz mono 16-bit PCM."""
+        declared = pcm_format is not None
+        if pcm_format is None:
+            pcm_format = sniff_wav(file)
+        if pcm_format is not None and pcm_format.is_native:
+            pcm_chunks = read_pcm16_incrementally(file, pcm_format)
+        elif pcm_format is not None and declared:
+            # PyAV can't decode raw PCM without being told its layout, so it's read (and resampled) in one go
+            audio = read_pcm(file, pcm_format)
+            pcm_chunks = iter([(audio * 32768).clip(-32768, 32767).astype(np.int16)])
+        else:
+            # NOTE: WAV files which need to be resampled are also left to PyAV since, unlike `resample`, it can do it incrementally
+            file.seek(0)
+            pcm_chunks = decode_pcm16_incrementally(file)
+        spill = tempfile.TemporaryFile(dir=spill_dir)  # noqa: SIM115
+        hasher = hashlib.blake2b(b"pcm16", digest_size=16)
+        samples = 0
+        try:
+            for pcm in pcm_chunks:
+                spill.write(pcm.data)
+                hasher.update(pcm.data)
+                samples += len(pcm)
+            spill.flush()
+        except:
+            spill.close()
+            raise
+        return cls(spill, samples, hasher.hexdigest())
+
+    @property
+    def duration(self) -> float:
+        return self.samples / SAMPLES_PER_SECOND
+
+    def close(self) -> None:
+        """Close the file, along with the memory maps of the iterators returned by `chunks` which haven't been exhausted (e.g. because the client disconnected)."""
+        for reader in list(self.readers):
+            # NOTE: raises if it's still being iterated on another thread, in which case it unmaps the file itself once it's done
+            with contextlib.suppress(ValueError):
+                reader.close()
+        self.file.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_args) -> None:  # noqa: ANN002
+        self.close()
+
+    def chunks(self, chunk_seconds: int) -> Generator[NDArray[np.float32], None, None]:
+        reader = self._chunks(chunk_seconds)
+        self.readers.add(reader)
+        return reader
+
+    def _chunks(self, chunk_seconds: int) -> Generator[NDArray[np.float32], None, None]:
+        if self.samples == 0:
+            return
+        chunk_size = chunk_seconds * SAMPLES_PER_SECOND
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pcm = np.frombuffer(mapped, dtype=np.int16)
+            released = 0
+            try:
+                for start in range(0, self.samples, chunk_size):
+                    yield pcm16_to_float32(pcm[start : start + chunk_size])
+                    # the pages that have been converted won't be read again. Without this they'd remain a part of the process's RSS until the kernel needs the memory
+                    end = (start + chunk_size) * pcm.itemsize // mmap.PAGESIZE * mmap.PAGESIZE
+                    if end > released and hasattr(mapped, "madvise"):
+                        mapped.madvise(mmap.MADV_DONTNEED, released, end - released)
+                        released = end
+            finally:
+                # the view has to be gone before the mapping gets closed
+                del pcm
+
+
 class Audio:
     def __init__(
         self,
@@ -0,0 +1,248 @@
+"""Batched Whisper inference that can be shared between requests.
+
+`BatchedInferencePipeline` batches the VAD chunks of a single request and keeps per-request state (`last_speech_timestamp`) on the pipeline itself. `SharedBatchedInferencePipeline` keeps that state per request so that a single pipeline can be created per loaded model and reused. `DynamicBatchedInferencePipeline` additionally hands the chunks to a `BatchScheduler`, which groups the chunks of every concurrent request using the same model into batches, so that many short requests share a single encoder and decoder pass.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from faster_whisper.transcribe import BatchedInferencePipeline, Segment, TranscriptionOptions, Word
+import numpy as np
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Hashable, Sequence
+
+    from faster_whisper import WhisperModel
+    from faster_whisper.tokenizer import Tokenizer
+    from numpy.typing import NDArray
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT = 5.0
+
+
+@dataclass(eq=False)
+class _RequestState:
+    last_speech_timestamp: float = 0.0
+    """Per-request replacement for `BatchedInferencePipeline.last_speech_timestamp`, which would otherwise be shared by every request in a batch."""
+
+
+@dataclass(eq=False)
+class BatchItem:
+    feature: NDArray[np.float32]
+    chunk_metadata: dict[str, Any]
+    tokenizer: Tokenizer
+    options: TranscriptionOptions
+    request: _RequestState
+    key: Hashable
+    future: Future[list[dict[str, Any]]] = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+def _to_segment(segment: dict[str, Any], segment_id: int, options: TranscriptionOptions) -> Segment:
+    """Same conversion as in `BatchedInferencePipeline._batched_segments_generator`."""
+    return Segment(
+        seek=segment["seek"],
+        id=segment_id,
+        text=segment["text"],
+        start=round(segment["start"], 3),
+        end=round(segment["end"], 3),
+        words=None if not options.word_timestamps else [Word(**word) for word in segment["words"]],
+        tokens=segment["tokens"],
+        avg_logprob=segment["avg_logprob"],
+        no_speech_prob=segment["no_speech_prob"],
+        compression_ratio=segment["compression_ratio"],
+        temperature=options.temperatures[0],
+    )
+
+
+class SharedBatchedInferencePipeline(BatchedInferencePipeline):
+    """`BatchedInferencePipeline` which may be used by multiple requests at once, so it only needs to be created once per loaded model.
+
+    `BatchedInferencePipeline.forward` reads and updates `self.last_speech_timestamp` when word timestamps are requested, which would mix up the word alignment of concurrent requests (e.g. a streamed response that's still being generated when the next request starts). The value is kept per request instead and swapped in while holding a lock.
+    """
+
+    def __init__(self, model: WhisperModel) -> None:
+        super().__init__(model=model)
+        self._lock = threading.Lock()
+
+    def forward_request(
+        self,
+        features: NDArray[np.float32],
+        tokenizer: Tokenizer,
+        chunks_metadata: list[dict[str, Any]],
+        options: TranscriptionOptions,
+        request: _RequestState,
+    ) -> list[list[dict[str, Any]]]:
+        if not options.word_timestamps:
+            return self.forward(features, tokenizer, chunks_metadata, options)
+        with self._lock:
+            self.last_speech_timestamp = request.last_speech_timestamp
+            results = self.forward(features, tokenizer, chunks_metadata, options)
+            request.last_speech_timestamp = self.last_speech_timestamp
+        return results
+
+    def _batched_segments_generator(  # pyright: ignore[reportIncompatibleMethodOverride]
+        self,
+        features: NDArray[np.float32] | list[NDArray[np.float32]],
+        tokenizer: Tokenizer,
+        chunks_metadata: list[dict[str, Any]],
+        batch_size: int,
+        options: TranscriptionOptions,
+        _log_progress: bool,
+    ) -> Generator[Segment, None, None]:
+        request = _RequestState()
+        segment_id = 0
+        for i in range(0, len(features), batch_size):
+            results = self.forward_request(
+                features[i : i + batch_size],  # pyright: ignore[reportArgumentType]
+                tokenizer,
+                chunks_metadata[i : i + batch_size],
+                options,
+                request,
+            )
+            for result in results:
+                for segment in result:
+                    segment_id += 1
+                    yield _to_segment(segment, segment_id, options)
+
+
+def batch_key(tokenizer: Tokenizer, options: TranscriptionOptions, request: _RequestState) -> Hashable:
+    """Chunks can only share a batch if they're decoded with the same prompt and options.
+
+    Chunks of requests with word timestamps are never batched with other requests, since the word alignment of a chunk depends on the previous chunk of the same request.
+    """
+    # NOTE: `clip_timestamps` differs for every request but isn't used past the VAD step. `repr` is used since the options contain lists
+    options_key = repr(replace(options, clip_timestamps=[]))
+    return (tokenizer.task, tokenizer.language_code, options_key, request if options.word_timestamps else None)
+
+
+class BatchScheduler:
+    """Runs the chunks submitted by concurrent requests as batches on a dedicated thread.
+
+    A batch is started as soon as `max_batch_size` compatible chunks are queued or the oldest queued chunk has waited for `max_wait` seconds, whichever comes first.
+    The thread exits after being idle for `IDLE_TIMEOUT` seconds and gets started again by the next submission, so an unloaded model isn't kept alive by its scheduler.
+    """
+
+    def __init__(self, model: WhisperModel, max_batch_size: int, max_wait: float) -> None:
+        self.pipeline = SharedBatchedInferencePipeline(model=model)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.batched_chunks = 0
+        self._queue: deque[BatchItem] = deque()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.batched_chunks / self.batches if self.batches > 0 else 0.0
+
+    def submit(
+        self,
+        feature: NDArray[np.float32],
+        chunk_metadata: dict[str, Any],
+        tokenizer: Tokenizer,
+        options: TranscriptionOptions,
+        request: _RequestState,
+    ) -> Future[list[dict[str, Any]]]:
+        item = BatchItem(feature, chunk_metadata, tokenizer, options, request, batch_key(tokenizer, options, request))
+        with self._condition:
+            self._queue.append(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="whisper-batch-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return item.future
+
+    def _next_batch(self) -> list[BatchItem] | None:
+        """Block until a batch is ready. Returns `None` if nothing was submitted for `IDLE_TIMEOUT` seconds, in which case the caller must exit."""
+        with self._condition:
+            while True:
+                if len(self._queue) == 0:
+                    if not self._condition.wait(IDLE_TIMEOUT) and len(self._queue) == 0:
+                        self._thread = None
+                        return None
+                    continue
+                # the batch is formed around the oldest chunk so that no chunk waits for longer than `max_wait`
+                head = self._queue[0]
+                batch = [item for item in self._queue if item.key == head.key][: self.max_batch_size]
+                remaining = head.enqueued_at + self.max_wait - time.monotonic()
+                if len(batch) == self.max_batch_size or remaining <= 0:
+                    batched = set(map(id, batch))
+                    self._queue = deque(item for item in self._queue if id(item) not in batched)
+                    return batch
+                self._condition.wait(remaining)
+
+    def _forward(self, batch: Sequence[BatchItem]) -> list[list[dict[str, Any]]]:
+        head = batch[0]
+        features = np.stack([item.feature for item in batch])
+        # NOTE: batches with word timestamps only ever contain the chunks of a single request (see `batch_key`)
+        return self.pipeline.forward_request(
+            features, head.tokenizer, [item.chunk_metadata for item in batch], head.options, head.request
+        )
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            # chunks of requests that have gone away (e.g. the client disconnected) are skipped
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if len(batch) == 0:
+                continue
+            try:
+                results = self._forward(batch)
+            except Exception as e:
+                logger.exception(f"Failed to process a batch of {len(batch)} chunks")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_chunks += len(batch)
+            for item, result in zip(batch, results, strict=True):
+                item.future.set_result(result)
+
+
+class DynamicBatchedInferencePipeline(SharedBatchedInferencePipeline):
+    """Same as `SharedBatchedInferencePipeline`, except that the chunks are run by a `BatchScheduler` shared with other requests.
+
+    Language detection and feature extraction still happen in the calling thread. `batch_size` limits how many chunks of a single request may be queued at once, so that a long request doesn't delay the chunks of requests which arrive after it.
+    """
+
+    def __init__(self, model: WhisperModel, scheduler: BatchScheduler) -> None:
+        super().__init__(model=model)
+        self.scheduler = scheduler
+
+    def _batched_segments_generator(  # pyright: ignore[reportIncompatibleMethodOverride]
+        self,
+        features: NDArray[np.float32] | list[NDArray[np.float32]],
+        tokenizer: Tokenizer,
+        chunks_metadata: list[dict[str, Any]],
+        batch_size: int,
+        options: TranscriptionOptions,
+        _log_progress: bool,
+    ) -> Generator[Segment, None, None]:
+        request = _RequestState()
+        pending: deque[Future[list[dict[str, Any]]]] = deque()
+        next_chunk = 0
+        segment_id = 0
+        try:
+            while next_chunk < len(features) or len(pending) > 0:
+                while next_chunk < len(features) and len(pending) < batch_size:
+                    pending.append(
+                        self.scheduler.submit(
+                            features[next_chunk], chunks_metadata[next_chunk], tokenizer, options, request
+                        )
+                    )
+                    next_chunk += 1
+                for segment in pending.popleft().result():
+                    segment_id += 1
+                    yield _to_segment(segment, segment_id, options)
+        finally:
+            for future in pending:
+                future.cancel()
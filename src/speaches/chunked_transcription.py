@@ -0,0 +1,130 @@
+"""Transcription of long audio by splitting it at silences and transcribing the chunks in parallel.
+
+Every chunk is transcribed independently (by whichever replica, or model process, is free) and the segments are stitched back together in order, with their IDs renumbered and their timestamps shifted by the start of their chunk, so the result has the same structure as transcribing the audio in one go.
+The language is detected on the first chunk (the same 30 seconds the serial path would use) and then used for every other chunk.
+"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import itertools
+import logging
+from typing import TYPE_CHECKING, Any, Self
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.vad import merge_speech_timestamps
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from concurrent.futures import Executor, Future
+
+    from faster_whisper.transcribe import TranscriptionInfo
+    import numpy as np
+    from numpy.typing import NDArray
+
+    from speaches.segments import Segment
+    from speaches.windowed_transcription import TranscribeWindow
+
+logger = logging.getLogger(__name__)
+
+
+def split_at_silences(
+    speech_timestamps: list[dict[str, int]], total_samples: int, max_chunk_samples: int
+) -> list[tuple[int, int]]:
+    """Split the speech of `total_samples` of audio into `(start, end)` ranges which are at most `max_chunk_samples` long, unless a single speech region is longer than that.
+
+    Neighbouring ranges are cut in the middle of the silence between them. Silence which doesn't fit into the ranges on either side of it (i.e. long silences) is left out, so there are no ranges at all if there's no speech.
+    """
+    groups = merge_speech_timestamps(speech_timestamps, max_chunk_samples)
+    if len(groups) == 0:
+        return []
+    cuts = [0, *((previous["end"] + current["start"]) // 2 for previous, current in itertools.pairwise(groups))]
+    cuts.append(total_samples)
+    chunks: list[tuple[int, int]] = []
+    for group, (previous_cut, next_cut) in zip(groups, itertools.pairwise(cuts), strict=True):
+        start = max(previous_cut, min(group["start"], group["end"] - max_chunk_samples))
+        end = max(group["end"], min(next_cut, start + max_chunk_samples))
+        chunks.append((start, end))
+    return chunks
+
+
+def chunk_speech_timestamps(
+    speech_timestamps: list[dict[str, int]], chunk_start: int, chunk_end: int
+) -> list[dict[str, int]]:
+    """The parts of the speech regions which lie within the chunk, relative to its start."""
+    return [
+        {"start": max(speech["start"], chunk_start) - chunk_start, "end": min(speech["end"], chunk_end) - chunk_start}
+        for speech in speech_timestamps
+        if speech["start"] < chunk_end and speech["end"] > chunk_start
+    ]
+
+
+class ChunkedTranscription:
+    """Iterator over the segments of `audio`, with the chunks being transcribed on `executor`.
+
+    Given the `speech_timestamps` of `audio`, every chunk is only transcribed within its own speech regions, which are passed to `transcribe_chunk` as `speech_timestamps` (see `speaches.vad.transcribe_speech`).
+    `start` has to be called first. It waits for the first chunk to be transcribed, after which `info` is available.
+    """
+
+    def __init__(
+        self,
+        transcribe_chunk: TranscribeWindow,
+        audio: NDArray[np.float32],
+        chunks: list[tuple[int, int]],
+        params: dict[str, Any],
+        executor: Executor,
+        speech_timestamps: list[dict[str, int]] | None = None,
+    ) -> None:
+        self.transcribe_chunk = transcribe_chunk
+        self.audio = audio
+        self.chunks = chunks
+        self.params = params
+        self.executor = executor
+        self.speech_timestamps = speech_timestamps
+        self.info: TranscriptionInfo | None = None
+        self._futures: list[Future[tuple[list[Segment], TranscriptionInfo]]] = []
+
+    def _submit(self, chunks: list[tuple[int, int]], params: dict[str, Any]) -> None:
+        for start, end in chunks:
+            chunk_params = params
+            if self.speech_timestamps is not None:
+                chunk_params = {
+                    **params,
+                    "speech_timestamps": chunk_speech_timestamps(self.speech_timestamps, start, end),
+                }
+            self._futures.append(self.executor.submit(self.transcribe_chunk, self.audio[start:end], **chunk_params))
+
+    def start(self) -> Self:
+        logger.info(f"Transcribing {len(self.audio) / SAMPLES_PER_SECOND:.1f}s of audio in {len(self.chunks)} chunks")
+        try:
+            if self.params.get("language") is not None:
+                self._submit(self.chunks, self.params)
+                _, info = self._futures[0].result()
+            else:
+                self._submit(self.chunks[:1], self.params)
+                _, info = self._futures[0].result()
+                self._submit(self.chunks[1:], {**self.params, "language": info.language})
+        except:
+            self._cancel()
+            raise
+        self.info = replace(info, duration=len(self.audio) / SAMPLES_PER_SECOND)
+        return self
+
+    def __iter__(self) -> Generator[Segment, None, None]:
+        assert self.info is not None, "`start` must be called first"
+        segment_id = 0
+        try:
+            for (chunk_start, _), future in zip(self.chunks, self._futures, strict=True):
+                segments, _ = future.result()
+                for segment in segments:
+                    segment_id += 1
+                    segment.id = segment_id
+                    segment.offset(chunk_start / SAMPLES_PER_SECOND)
+                    yield segment
+        finally:
+            # e.g. the client disconnected in the middle of a streamed response
+            self._cancel()
+
+    def _cancel(self) -> None:
+        for future in self._futures:
+            future.cancel()
@@ -1,3 +1,4 @@
+from pathlib import Path
 from typing import Literal
 
 from pydantic import BaseModel, Field, SecretStr
@@ -18,6 +19,70 @@ type Quantization = Literal[
 ]
 
 
+class DynamicBatchingConfig(BaseModel):
+    """Batch the inference of concurrent requests for the same Whisper model.
+
+    Requests share their replica instead of holding it exclusively, and their VAD chunks get grouped into batches which run as a single encoder and decoder pass.
+    Implies `use_batched_mode`. Has no effect when `model_host.isolate_models` is enabled.
+    """
+
+    enabled: bool = False
+    max_batch_size: int = Field(default=8, ge=1)
+    """
+    Maximum number of 30 second chunks in a batch.
+    """
+    max_wait: float = Field(default=0.01, ge=0)
+    """
+    Time in seconds that a chunk may wait for other chunks to fill its batch. Higher values trade latency for throughput.
+    Usage:
+        `export WHISPER__DYNAMIC_BATCHING__ENABLED=true`
+        `export WHISPER__DYNAMIC_BATCHING__MAX_WAIT=0.05`
+    """
+    max_requests_per_replica: int = Field(default=32, ge=1)
+    """
+    Maximum number of requests sharing a replica. Once every replica is at the limit, another replica is loaded (if `max_replicas` allows for it) or requests wait.
+    """
+
+
+class DecodingProfile(BaseModel):
+    """Decoding options of a named trade-off between speed and accuracy, passed on to `transcribe`. Options which aren't set keep the defaults of the model (which differ for batched pipelines, e.g. `without_timestamps`)."""
+
+    beam_size: int = Field(default=5, ge=1)
+    """
+    Number of beams of the beam search. 1 is greedy decoding.
+    """
+    best_of: int = Field(default=5, ge=1)
+    """
+    Number of candidates when sampling with a non-zero temperature.
+    """
+    condition_on_previous_text: bool = True
+    """
+    Whether the text of the previous window is passed as the prompt of the next one. Disabling it is faster and makes the model less prone to getting stuck in repetitions, but the text can become less consistent across windows.
+    """
+    without_timestamps: bool = False
+    """
+    Whether to skip predicting timestamp tokens. Segments then span whole 30 second windows.
+    """
+    compression_ratio_threshold: float | None = 2.4
+    """
+    Transcriptions of a window whose gzip compression ratio is above this are treated as failed (repetitive). `None` disables the check.
+    """
+
+
+DEFAULT_DECODING_PROFILES = {
+    "realtime": DecodingProfile(
+        beam_size=1,
+        best_of=1,
+        condition_on_previous_text=False,
+        without_timestamps=True,
+        compression_ratio_threshold=None,
+    ),
+    "balanced": DecodingProfile(beam_size=2, best_of=2, condition_on_previous_text=False),
+    # NOTE: the same as faster-whisper's defaults
+    "accurate": DecodingProfile(beam_size=5, best_of=5, condition_on_previous_text=True),
+}
+
+
 class WhisperConfig(BaseModel):
     """See https://github.com/SYSTRAN/faster-whisper/blob/master/faster_whisper/transcribe.py#L599."""
 
@@ -36,6 +101,233 @@ class WhisperConfig(BaseModel):
     """
     Whether to use batch mode(introduced in 1.1.0 `faster-whisper` release) for inference. This will likely become the default in the future and the configuration option will be removed.
     """
+    batch_size: int = Field(default=8, ge=1)
+    """
+    Maximum number of 30 second chunks of a request that are decoded together in batched mode. Higher values speed up long transcriptions at the cost of memory.
+    """
+    max_replicas: int = Field(default=1, ge=1)
+    """
+    Maximum number of instances (replicas) of each model that can be loaded to serve concurrent requests in parallel. Additional replicas are only loaded when all existing ones are busy and are unloaded after being idle for `ttl` seconds.
+    When `cpu_threads` is 0, the host's cores are split evenly between the replicas. For example, 8 replicas on a 32 core host get 4 threads each.
+    """
+    model_max_replicas: dict[str, int] = {}
+    """
+    Per-model override of `max_replicas`.
+    Usage:
+        `export WHISPER__MODEL_MAX_REPLICAS='{"Systran/faster-distil-whisper-small.en": 8}'`
+    """
+    replica_memory_cap: int | None = Field(default=None, ge=0)
+    """
+    Memory (in bytes) that loaded models may occupy on this node before no more replicas get loaded. Requests wait for a busy replica instead. The first replica of a model is always loaded.
+    `None` disables the cap.
+    """
+    dynamic_batching: DynamicBatchingConfig = DynamicBatchingConfig()
+    decoding_profiles: dict[str, DecodingProfile] = DEFAULT_DECODING_PROFILES
+    """
+    Named decoding profiles which requests can pick with `decoding_profile`. Replaces the default `realtime`, `balanced` and `accurate` profiles, so those have to be repeated to keep them.
+    Usage:
+        `export WHISPER__DECODING_PROFILES='{"realtime": {"beam_size": 1, "best_of": 1, "condition_on_previous_text": false}, "accurate": {}}'`
+    """
+    default_decoding_profile: str | None = "accurate"
+    """
+    Decoding profile of requests which don't specify one. `None` uses faster-whisper's defaults.
+    Usage:
+        `export WHISPER__DEFAULT_DECODING_PROFILE=balanced`
+    """
+    max_chunk_duration: int = Field(default=120, ge=30)
+    """
+    Maximum duration (in seconds) of the chunks that audio gets split into (at silences) when a transcription request sets `chunking_strategy=auto`. The chunks are transcribed in parallel, up to `max_replicas` at a time.
+    """
+
+
+class PiperConfig(BaseModel):
+    ttl: int = Field(default=300, ge=-1)
+    """
+    Time in seconds until the voice model is unloaded if it is not being used.
+    -1: Never unload the model.
+    0: Unload the model immediately after usage.
+    """
+
+
+class KokoroConfig(BaseModel):
+    ttl: int = Field(default=300, ge=-1)
+    """
+    Time in seconds until the model is unloaded if it is not being used.
+    -1: Never unload the model.
+    0: Unload the model immediately after usage.
+    """
+
+
+class ModelResidencyConfig(BaseModel):
+    """Controls how many models may stay loaded at once across the Whisper, Piper and Kokoro model managers."""
+
+    memory_budget: int | None = Field(default=None, ge=0)
+    """
+    Maximum amount of memory (in bytes) that loaded models may occupy. Each model's footprint is measured when it's loaded. Before a new model gets loaded, the least recently used idle models are unloaded until the new model fits.
+    `None` disables the budget.
+    Usage:
+        `export RESIDENCY__MEMORY_BUDGET=8000000000`
+    """
+    pinned_model_ids: list[str] = []
+    """
+    Model IDs that will never be unloaded, neither to satisfy `memory_budget` nor when their TTL expires.
+    Usage:
+        `export RESIDENCY__PINNED_MODEL_IDS='["Systran/faster-whisper-small"]'`
+    """
+    warm_tier_size: int = Field(default=0, ge=0)
+    """
+    Maximum size (in bytes) of Whisper model files that are kept in the OS page cache after their model gets unloaded, which makes reloading the model faster. The files of the models that were loaded the most often get prefetched as well when there's room.
+    `0` disables the warm tier.
+    Usage:
+        `export RESIDENCY__WARM_TIER_SIZE=4000000000`
+    """
+
+
+class ModelHostConfig(BaseModel):
+    isolate_models: bool = False
+    """
+    Whether to load every model (each Whisper replica, Piper voice and Kokoro model) in its own child process. Inference calls get forwarded to the process.
+    Unloading a model terminates its process, which returns all of the model's memory to the OS. A crashed or hung process only fails the requests it was serving and gets restarted.
+    """
+    heartbeat_interval: float = Field(default=1.0, gt=0)
+    """
+    How often (in seconds) model processes get checked for crashes and hangs.
+    """
+    hang_timeout: float = Field(default=60.0, gt=0)
+    """
+    Time in seconds a model process may spend on a request without producing a result (or the next item of a streamed one, e.g. a transcription segment) before it's considered hung and gets restarted. Time spent waiting for the client to consume streamed items doesn't count.
+    """
+
+
+class AdmissionConfig(BaseModel):
+    """Limits the number of concurrent transcription and translation requests per Whisper model. Excess requests wait in a bounded FIFO queue, and once that's full they're rejected with a 429 and a `Retry-After` header."""
+
+    max_concurrent_requests: int | None = Field(default=None, ge=1)
+    """
+    Maximum number of requests per model being processed at once. `None` disables admission control.
+    """
+    model_max_concurrent_requests: dict[str, int] = {}
+    """
+    Per-model override of `max_concurrent_requests`.
+    Usage:
+        `export ADMISSION__MODEL_MAX_CONCURRENT_REQUESTS='{"Systran/faster-whisper-large-v3": 2}'`
+    """
+    max_queued_requests: int = Field(default=64, ge=0)
+    """
+    Maximum number of requests per model waiting for their turn.
+    """
+    max_queue_wait: float = Field(default=30.0, gt=0)
+    """
+    Time in seconds a request may wait in the queue before being rejected with a 503.
+    """
+
+
+class ExecutorConfig(BaseModel):
+    """Sizes of the thread pools which the speech-to-text and voice activity detection endpoints dispatch their blocking work to.
+
+    Each workload class gets its own pool so that, for example, a burst of uploads being decoded can't occupy the threads needed to run (or stream the results of) transcriptions that are already in progress. `None` uses the `ThreadPoolExecutor` default of `min(32, os.cpu_count() + 4)`.
+    """
+
+    decode_workers: int | None = Field(default=None, ge=1)
+    """
+    Threads decoding uploaded audio files.
+    """
+    decode_processes: int = Field(default=0, ge=0)
+    """
+    Processes decoding compressed uploads (e.g. MP3, M4A or Opus), which are sent the upload and return the decoded audio through shared memory. With `0`, uploads are decoded on the decode threads, where PyAV competes for the GIL with request handling and transcription. WAV and raw PCM uploads are always read on the decode threads, since that's just a NumPy conversion.
+    Usage:
+        `export EXECUTORS__DECODE_PROCESSES=8`
+    """
+    inference_workers: int | None = Field(default=32, ge=1)
+    """
+    Threads running Whisper transcriptions and translations. Most of the time these wait on the model (or on the dynamic batch scheduler), so this should be at least as large as the number of requests expected to be processed at once.
+    Usage:
+        `export EXECUTORS__INFERENCE_WORKERS=64`
+    """
+    vad_workers: int | None = Field(default=None, ge=1)
+    """
+    Threads running voice activity detection.
+    """
+    chunk_workers: int | None = Field(default=None, ge=1)
+    """
+    Threads transcribing the chunks of requests with `chunking_strategy=auto`.
+    """
+
+
+class LargeFileConfig(BaseModel):
+    """Uploaded files larger than `min_upload_size` are decoded to 16-bit PCM in a temporary file rather than into memory and then transcribed 30 seconds at a time, so the memory used by a request doesn't grow with the duration of its audio.
+
+    The audio is split into windows the same way as for `/v1/audio/transcriptions/upload-stream`, which may produce slightly different segments than transcribing the whole file at once.
+    """
+
+    min_upload_size: int | None = Field(default=None, ge=0)
+    """
+    Size (in bytes) of the uploaded file from which on it's handled as a large file. `None` disables the large file mode.
+    Usage:
+        `export LARGE_FILE__MIN_UPLOAD_SIZE=104857600`
+    """
+    spill_dir: Path | None = None
+    """
+    Directory the decoded audio gets written to. Defaults to the system's temporary directory.
+    """
+
+
+class TranscriptionCacheConfig(BaseModel):
+    """Caches transcription and translation results keyed by a hash of the decoded audio, the model and every parameter affecting the result.
+
+    Identical requests made while the first one is still being processed wait for its result instead of running the model again.
+    The cache is disabled unless `max_entries` or `disk_dir` is set.
+    """
+
+    max_entries: int = Field(default=0, ge=0)
+    """
+    Number of results kept in memory. The least recently used results are evicted first.
+    """
+    disk_dir: Path | None = None
+    """
+    Directory in which results are stored as well, so that they survive restarts. Only this server should be writing to it.
+    Usage:
+        `export TRANSCRIPTION_CACHE__DISK_DIR=/var/cache/speaches/transcriptions`
+    """
+    disk_max_size: int | None = Field(default=1024**3, ge=0)
+    """
+    Maximum size (in bytes) of the results stored in `disk_dir`. The least recently used results are removed first. `None` disables the limit.
+    """
+
+
+class VadConfig(BaseModel):
+    """Voice activity detection, used by `/v1/audio/speech/timestamps` and by transcriptions with `vad_filter=true`."""
+
+    cache_max_entries: int = Field(default=256, ge=0)
+    """
+    Number of audio files whose speech probabilities are kept in memory (about 450KB per hour of audio), keyed by a hash of the decoded audio. Requesting the speech timestamps of a file and then transcribing it only runs the VAD model once. `0` disables the cache.
+    """
+    ttl: int = Field(default=-1, ge=-1)
+    """
+    Time in seconds until the Silero VAD model is unloaded if it is not being used. The model only takes up a few megabytes.
+    -1: Never unload the model.
+    0: Unload the model immediately after usage.
+    """
+    intra_op_num_threads: int = Field(default=1, ge=0)
+    """
+    Threads used by ONNX Runtime to run a single operator of the model. `0` lets ONNX Runtime decide (one per physical core).
+    """
+    inter_op_num_threads: int = Field(default=1, ge=0)
+    """
+    Threads used by ONNX Runtime to run independent operators of the model in parallel. `0` lets ONNX Runtime decide.
+    """
+    execution_providers: list[str] = ["CPUExecutionProvider"]
+    """
+    ONNX Runtime execution providers to run the model with, in order of preference. The model is small enough that running it on a GPU mostly pays off when many streams get batched together (see `max_batch_size`).
+    Usage:
+        `export VAD__EXECUTION_PROVIDERS='["CUDAExecutionProvider", "CPUExecutionProvider"]'`
+    """
+    max_batch_size: int = Field(default=16, ge=1)
+    """
+    Maximum number of audio streams (e.g. uploaded files or realtime sessions) scored together in a single run of the model. Streams only get batched when they're submitted while the model is busy, so batching never delays a request. `1` disables batching.
+    Usage:
+        `export VAD__MAX_BATCH_SIZE=32`
+    """
 
 
 # TODO: document `alias` behaviour within the docstring
@@ -73,6 +365,31 @@ class Config(BaseSettings):
     """
 
     whisper: WhisperConfig = WhisperConfig()
+    piper: PiperConfig = PiperConfig()
+    kokoro: KokoroConfig = KokoroConfig()
+    residency: ModelResidencyConfig = ModelResidencyConfig()
+    model_host: ModelHostConfig = ModelHostConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    executors: ExecutorConfig = ExecutorConfig()
+    large_file: LargeFileConfig = LargeFileConfig()
+    transcription_cache: TranscriptionCacheConfig = TranscriptionCacheConfig()
+    vad: VadConfig = VadConfig()
+    preload_models: list[str] = []
+    """
+    Models to load in parallel when the server starts. Each gets warmed up with a short inference before the server reports itself as ready (`/health/ready`).
+    Piper and Kokoro voices are specified as `{model_id}/{voice}` and Silero VAD as `silero_vad_v5`.
+    Preloaded models are still subject to their TTL. Use `residency.pinned_model_ids` to keep them loaded.
+    Usage:
+        `export PRELOAD_MODELS='["Systran/faster-whisper-small", "hexgrad/Kokoro-82M/af", "rhasspy/piper-voices/en_US-amy-medium", "silero_vad_v5"]'`
+    """
+    inference_host_socket: str | None = None
+    """
+    Path of the Unix socket of a shared inference host. When set, the API server doesn't load any models itself and forwards transcription, speech synthesis and voice activity detection to the inference host instead, which lets multiple API workers share a single copy of each model.
+    Usage:
+        `export INFERENCE_HOST_SOCKET=/tmp/speaches.sock`
+        `python -m speaches.inference_host &`
+        `uvicorn --factory speaches.main:create_app --workers 4`
+    """
 
     loopback_host_url: str | None = None
     """
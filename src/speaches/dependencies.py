@@ -1,17 +1,21 @@
+from collections.abc import AsyncGenerator, Callable
 from functools import lru_cache
 import logging
-from typing import Annotated
+from typing import Annotated, BinaryIO, Literal
 
 import av.error
 from fastapi import (
+    BackgroundTasks,
     Depends,
     Form,
     HTTPException,
+    Query,
+    Response,
     UploadFile,
     status,
 )
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from faster_whisper.audio import decode_audio
 from httpx import ASGITransport, AsyncClient
 from numpy import float32
 from numpy.typing import NDArray
@@ -19,8 +23,28 @@ from openai import AsyncOpenAI
 from openai.resources.audio import AsyncSpeech, AsyncTranscriptions
 from openai.resources.chat.completions import AsyncCompletions
 
-from speaches.config import Config
-from speaches.model_manager import KokoroModelManager, PiperModelManager, WhisperModelManager
+from speaches.admission import AdmissionController, AdmissionSlot
+from speaches.audio import PcmFormat, SpilledAudio, decode_audio_file
+from speaches.config import SAMPLES_PER_SECOND, Config
+from speaches.executors import WorkloadExecutors, run_in_executor
+from speaches.inference_host import (
+    InferenceHostClient,
+    RemoteKokoroModelManager,
+    RemotePiperModelManager,
+    RemoteWhisperModelManager,
+)
+from speaches.model_aliases import ModelId
+from speaches.model_manager import (
+    KokoroModelManager,
+    ModelResidencyController,
+    ModelWarmer,
+    PiperModelManager,
+    VadModelManager,
+    WhisperModelManager,
+)
+from speaches.preload import ModelPreloader
+from speaches.transcription_cache import TranscriptionCache
+from speaches.vad import SpeechProbabilityCache
 
 logger = logging.getLogger(__name__)
 
@@ -38,30 +62,155 @@ ConfigDependency = Annotated[Config, Depends(get_config)]
 
 
 @lru_cache
-def get_model_manager() -> WhisperModelManager:
+def get_residency_controller() -> ModelResidencyController:
+    config = get_config()
+    return ModelResidencyController(config.residency.memory_budget, config.residency.pinned_model_ids)
+
+
+@lru_cache
+def get_model_warmer() -> ModelWarmer:
+    config = get_config()
+    return ModelWarmer(config.residency.warm_tier_size)
+
+
+@lru_cache
+def get_inference_host_client() -> InferenceHostClient:
+    config = get_config()
+    assert config.inference_host_socket is not None
+    return InferenceHostClient(config.inference_host_socket)
+
+
+@lru_cache
+def get_model_manager() -> WhisperModelManager | RemoteWhisperModelManager:
+    config = get_config()
+    if config.inference_host_socket is not None:
+        return RemoteWhisperModelManager(get_inference_host_client())
+    return WhisperModelManager(config.whisper, get_residency_controller(), config.model_host, get_model_warmer())
+
+
+ModelManagerDependency = Annotated[WhisperModelManager | RemoteWhisperModelManager, Depends(get_model_manager)]
+
+
+@lru_cache
+def get_piper_model_manager() -> PiperModelManager | RemotePiperModelManager:
+    config = get_config()
+    if config.inference_host_socket is not None:
+        return RemotePiperModelManager(get_inference_host_client())
+    return PiperModelManager(config.piper.ttl, get_residency_controller(), config.model_host)
+
+
+PiperModelManagerDependency = Annotated[PiperModelManager | RemotePiperModelManager, Depends(get_piper_model_manager)]
+
+
+@lru_cache
+def get_kokoro_model_manager() -> KokoroModelManager | RemoteKokoroModelManager:
+    config = get_config()
+    if config.inference_host_socket is not None:
+        return RemoteKokoroModelManager(get_inference_host_client())
+    return KokoroModelManager(config.kokoro.ttl, get_residency_controller(), config.model_host)
+
+
+KokoroModelManagerDependency = Annotated[
+    KokoroModelManager | RemoteKokoroModelManager, Depends(get_kokoro_model_manager)
+]
+
+
+@lru_cache
+def get_vad_model_manager() -> VadModelManager:
+    config = get_config()
+    return VadModelManager(config.vad, get_residency_controller())
+
+
+@lru_cache
+def get_model_preloader() -> ModelPreloader:
+    config = get_config()
+    return ModelPreloader(
+        config.preload_models,
+        get_model_manager(),
+        get_piper_model_manager(),
+        get_kokoro_model_manager(),
+        # NOTE: the VAD model is loaded by the inference host when there is one
+        get_vad_model_manager() if config.inference_host_socket is None else None,
+    )
+
+
+ModelPreloaderDependency = Annotated[ModelPreloader, Depends(get_model_preloader)]
+
+
+@lru_cache
+def get_transcription_cache() -> TranscriptionCache:
+    config = get_config()
+    return TranscriptionCache(
+        config.transcription_cache.max_entries,
+        config.transcription_cache.disk_dir,
+        config.transcription_cache.disk_max_size,
+    )
+
+
+TranscriptionCacheDependency = Annotated[TranscriptionCache, Depends(get_transcription_cache)]
+
+
+def get_speech_probabilities() -> Callable[[NDArray[float32]], NDArray[float32]]:
+    """Run the VAD model of this process, or of the inference host if there is one, without caching the result (see `get_speech_probability_cache`)."""
+    config = get_config()
+    if config.inference_host_socket is not None:
+        return get_inference_host_client().speech_probabilities
+    return get_vad_model_manager().speech_probabilities
+
+
+@lru_cache
+def get_speech_probability_cache() -> SpeechProbabilityCache:
     config = get_config()
-    return WhisperModelManager(config.whisper)
+    return SpeechProbabilityCache(config.vad.cache_max_entries, get_speech_probabilities())
 
 
-ModelManagerDependency = Annotated[WhisperModelManager, Depends(get_model_manager)]
+SpeechProbabilityCacheDependency = Annotated[SpeechProbabilityCache, Depends(get_speech_probability_cache)]
 
 
 @lru_cache
-def get_piper_model_manager() -> PiperModelManager:
+def get_executors() -> WorkloadExecutors:
     config = get_config()
-    return PiperModelManager(config.whisper.ttl)  # HACK: should have its own config
+    return WorkloadExecutors(config.executors)
 
 
-PiperModelManagerDependency = Annotated[PiperModelManager, Depends(get_piper_model_manager)]
+ExecutorsDependency = Annotated[WorkloadExecutors, Depends(get_executors)]
 
 
 @lru_cache
-def get_kokoro_model_manager() -> KokoroModelManager:
+def get_admission_controller() -> AdmissionController:
     config = get_config()
-    return KokoroModelManager(config.whisper.ttl)  # HACK: should have its own config
+    return AdmissionController(config.admission)
+
+
+AdmissionControllerDependency = Annotated[AdmissionController, Depends(get_admission_controller)]
+
+
+# NOTE: the teardown of dependencies runs before a `StreamingResponse` body gets sent, so endpoints which stream must hold on to the slot until then (see `hold_admission_slot`)
+async def admit_whisper_request(model: Annotated[ModelId, Form()]) -> AsyncGenerator[AdmissionSlot, None]:
+    async with get_admission_controller().admit(model) as slot:
+        yield slot
+
+
+# NOTE: this is resolved before the audio gets decoded so that rejected requests don't pay for it
+WhisperAdmissionDependency = Annotated[AdmissionSlot, Depends(admit_whisper_request)]
+
 
+async def admit_whisper_upload_stream(model: Annotated[ModelId, Query()]) -> AsyncGenerator[AdmissionSlot, None]:
+    async with get_admission_controller().admit(model) as slot:
+        yield slot
+
+
+# NOTE: same as `WhisperAdmissionDependency` for endpoints which take their parameters from the query string because the request body is the audio itself
+WhisperUploadStreamAdmissionDependency = Annotated[AdmissionSlot, Depends(admit_whisper_upload_stream)]
+
+
+def hold_admission_slot[T: Response](slot: AdmissionSlot, response: T) -> T:
+    """Keep the admission slot of a streamed response until its body has been sent, since the inference runs while it's being sent."""
+    if isinstance(response, StreamingResponse):
+        slot.hold()
+        response.body_iterator = slot.release_after(response.body_iterator)
+    return response
 
-KokoroModelManagerDependency = Annotated[KokoroModelManager, Depends(get_kokoro_model_manager)]
 
 security = HTTPBearer()
 
@@ -76,12 +225,9 @@ async def verify_api_key(
 ApiKeyDependency = Depends(verify_api_key)
 
 
-# TODO: test async vs sync performance
-def audio_file_dependency(
-    file: Annotated[UploadFile, Form()],
-) -> NDArray[float32]:
+async def decode_upload[T](file: UploadFile, decode: Callable[[BinaryIO], T]) -> T:
     try:
-        audio = decode_audio(file.file)
+        audio = await run_in_executor(get_executors().decode, decode, file.file)
     except av.error.InvalidDataError as e:
         raise HTTPException(
             status_code=415,
@@ -99,12 +245,60 @@ def audio_file_dependency(
         )
         raise HTTPException(status_code=500, detail="Failed to decode audio.") from e
     else:
-        return audio  # pyright: ignore reportReturnType
+        return audio
+
+
+def pcm_format_dependency(
+    audio_format: Annotated[
+        Literal["pcm"] | None,
+        Form(
+            description="Set to `pcm` when `file` is headerless 16-bit little-endian mono PCM (sampled at `sample_rate`) rather than an audio file. WAV files containing PCM samples are detected without it."
+        ),
+    ] = None,
+    sample_rate: Annotated[int, Form(gt=0, description="Sample rate of `pcm` audio.")] = SAMPLES_PER_SECOND,
+) -> PcmFormat | None:
+    return PcmFormat(sample_rate=sample_rate) if audio_format == "pcm" else None
+
+
+PcmFormatDependency = Annotated[PcmFormat | None, Depends(pcm_format_dependency)]
+
+
+async def audio_file_dependency(
+    file: Annotated[UploadFile, Form()],
+    pcm_format: PcmFormatDependency = None,
+) -> NDArray[float32]:
+    """Decode the uploaded file. WAV files containing PCM samples and raw PCM (see `pcm_format_dependency`) are read directly with NumPy, everything else is decoded with PyAV."""
+    process_pool = get_executors().decode_processes
+    return await decode_upload(file, lambda f: decode_audio_file(f, pcm_format, process_pool))
 
 
 AudioFileDependency = Annotated[NDArray[float32], Depends(audio_file_dependency)]
 
 
+async def transcription_audio_dependency(
+    file: Annotated[UploadFile, Form()],
+    background_tasks: BackgroundTasks,
+    pcm_format: PcmFormatDependency = None,
+) -> AsyncGenerator[NDArray[float32] | SpilledAudio, None]:
+    """Same as `audio_file_dependency`, except that large files are spilled to disk (see `LargeFileConfig`)."""
+    config = get_config().large_file
+    if config.min_upload_size is None or file.size is None or file.size < config.min_upload_size:
+        yield await audio_file_dependency(file, pcm_format)
+        return
+    logger.info(f"Decoding a {file.size} byte upload to a temporary file")
+    audio = await decode_upload(file, lambda f: SpilledAudio.decode(f, config.spill_dir, pcm_format))
+    # NOTE: background tasks run once the response has been sent, unlike the teardown of this dependency which runs before a `StreamingResponse` body gets sent (see `admit_whisper_request`)
+    background_tasks.add_task(audio.close)
+    try:
+        yield audio
+    except:
+        audio.close()
+        raise
+
+
+TranscriptionAudioDependency = Annotated[NDArray[float32] | SpilledAudio, Depends(transcription_audio_dependency)]
+
+
 @lru_cache
 def get_completion_client() -> AsyncCompletions:
     config = get_config()
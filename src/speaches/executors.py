@@ -0,0 +1,83 @@
+"""Dedicated thread pools for the blocking work done by the speech-to-text and voice activity detection endpoints.
+
+The endpoints themselves are `async`. Decoding, Whisper inference and voice activity detection are dispatched to separately sized pools instead of Starlette's default threadpool, which is shared by every sync endpoint, sync dependency and streamed response, so one workload class can't starve the others.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import functools
+import logging
+import multiprocessing
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Callable, Iterable, Iterator
+    from concurrent.futures import Future
+
+    from speaches.config import ExecutorConfig
+
+logger = logging.getLogger(__name__)
+
+
+class WorkloadExecutors:
+    def __init__(self, config: ExecutorConfig) -> None:
+        self.decode = ThreadPoolExecutor(config.decode_workers, thread_name_prefix="decode")
+        self.inference = ThreadPoolExecutor(config.inference_workers, thread_name_prefix="inference")
+        self.vad = ThreadPoolExecutor(config.vad_workers, thread_name_prefix="vad")
+        # NOTE: separate from `inference` since the requests running on it wait for their chunks
+        self.chunks = ThreadPoolExecutor(config.chunk_workers, thread_name_prefix="chunk")
+        self.decode_processes = (
+            RestartingProcessPoolExecutor(config.decode_processes) if config.decode_processes > 0 else None
+        )
+
+
+class RestartingProcessPoolExecutor(Executor):
+    """`ProcessPoolExecutor` which gets replaced once it's broken (i.e. one of its processes died, for example because of the OOM killer), since a `ProcessPoolExecutor` rejects every submission after that.
+
+    The processes are spawned rather than forked, as forking a process which is running threads (and possibly holds CUDA contexts) isn't safe.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = self._create()
+
+    def _create(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit[**P, T](self, fn: Callable[P, T], /, *args: P.args, **kwargs: P.kwargs) -> Future[T]:
+        executor = self._executor
+        try:
+            return executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    logger.warning("A process pool worker died, starting a new process pool")
+                    self._executor = self._create()
+            return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+async def run_in_executor[**P, T](executor: Executor, fn: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+
+def _next[T](iterator: Iterator[T]) -> tuple[T] | None:
+    try:
+        return (next(iterator),)
+    except StopIteration:
+        return None
+
+
+async def iterate_in_executor[T](executor: Executor, iterable: Iterable[T]) -> AsyncGenerator[T, None]:
+    """Same as `starlette.concurrency.iterate_in_threadpool`, except that every item is produced on `executor`."""
+    iterator = iter(iterable)
+    while (item := await run_in_executor(executor, _next, iterator)) is not None:
+        yield item[0]
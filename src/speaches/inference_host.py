@@ -0,0 +1,398 @@
+"""A process which owns the loaded models and runs inference on behalf of the API workers.
+
+Each of the processes started by `uvicorn --workers N` would otherwise load its own copy of every model. When `inference_host_socket` is configured, the workers forward inference requests to `python -m speaches.inference_host` over a Unix socket. Audio gets passed through `multiprocessing.shared_memory` instead of being pickled.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Generator, Iterator
+import contextlib
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+import logging
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+import threading
+from typing import TYPE_CHECKING, Any, Literal
+
+import numpy as np
+
+from speaches.config import Config
+from speaches.logger import setup_logger
+from speaches.model_host import (
+    KOKORO_HANDLERS,
+    PIPER_HANDLERS,
+    WHISPER_HANDLERS,
+    KokoroProxy,
+    ModelHostCrashedError,
+    ModelHostProxy,
+    PiperVoiceProxy,
+    RequestChannel,
+    WhisperModelProxy,
+    serve_requests,
+)
+from speaches.model_manager import (
+    KokoroModelManager,
+    ModelResidencyController,
+    ModelWarmer,
+    PiperModelManager,
+    VadModelManager,
+    WhisperModelManager,
+)
+from speaches.vad import speech_timestamps
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from multiprocessing.connection import Connection
+    from types import TracebackType
+
+    from faster_whisper.vad import VadOptions
+    from numpy.typing import NDArray
+
+    from speaches.model_manager import ModelState
+
+logger = logging.getLogger(__name__)
+
+type ModelKind = Literal["whisper", "piper", "kokoro"]
+type ModelManager = WhisperModelManager | PiperModelManager | KokoroModelManager
+
+
+@dataclass(frozen=True, slots=True)
+class SharedArray:
+    """Describes a NumPy array placed in a `SharedMemory` block."""
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+
+@contextmanager
+def share_array(array: NDArray[Any]) -> Generator[SharedArray, None, None]:
+    """Copy `array` into a new shared memory block which gets freed on exit."""
+    shared_memory = SharedMemory(create=True, size=max(array.nbytes, 1))
+    try:
+        np.ndarray(array.shape, dtype=array.dtype, buffer=shared_memory.buf)[...] = array
+        yield SharedArray(shared_memory.name, array.shape, array.dtype.str)
+    finally:
+        shared_memory.close()
+        shared_memory.unlink()
+
+
+@contextmanager
+def attach_array(shared_array: SharedArray) -> Generator[NDArray[Any], None, None]:
+    """Map an array shared by another process without copying it."""
+    shared_memory = SharedMemory(name=shared_array.name)
+    # NOTE: attaching registers the block with this process' resource tracker which would then unlink it when this process exits (https://github.com/python/cpython/issues/82300). The block is owned by the process which created it
+    resource_tracker.unregister(shared_memory._name, "shared_memory")  # pyright: ignore[reportAttributeAccessIssue]  # noqa: SLF001
+    try:
+        yield np.ndarray(shared_array.shape, dtype=shared_array.dtype, buffer=shared_memory.buf)
+    finally:
+        # views of the array which are still alive keep the block mapped until they get garbage collected
+        with contextlib.suppress(BufferError):
+            shared_memory.close()
+
+
+def _map_args(
+    fn: Callable[[object], object], args: tuple[object, ...], kwargs: dict[str, object]
+) -> tuple[tuple[object, ...], dict[str, object]]:
+    return tuple(fn(arg) for arg in args), {key: fn(value) for key, value in kwargs.items()}
+
+
+def _hold_until_exhausted(stack: ExitStack, items: Iterator[object]) -> Generator[object, None, None]:
+    with stack:
+        yield from items
+
+
+# Inference host side
+
+
+def _handler(fn: Callable[..., object]) -> Callable[..., object]:
+    """Wrap `fn(host, stack, *args, **kwargs)` so that `SharedArray` arguments get passed in as arrays.
+
+    The arrays and the context managers entered on `stack` are kept alive until the request finishes, which for handlers returning an iterator is once it's exhausted.
+    """
+
+    def handle(host: InferenceHost, *args: object, **kwargs) -> object:
+        with ExitStack() as stack:
+
+            def attach(value: object) -> object:
+                return stack.enter_context(attach_array(value)) if isinstance(value, SharedArray) else value
+
+            args, kwargs = _map_args(attach, args, kwargs)
+            result = fn(host, stack, *args, **kwargs)
+            if isinstance(result, Iterator):
+                return _hold_until_exhausted(stack.pop_all(), result)
+            return result
+
+    return handle
+
+
+def _model_handler(kind: ModelKind, handler: Callable[..., object]) -> Callable[..., object]:
+    """Adapt one of the `speaches.model_host` handlers to execute against `model_id` loaded by the inference host's model manager."""
+
+    def handle(host: InferenceHost, stack: ExitStack, model_id: str, *args: object, **kwargs) -> object:
+        model = stack.enter_context(host.model_managers[kind].load_model(model_id))
+        return handler(model, *args, **kwargs)
+
+    return _handler(handle)
+
+
+@dataclass(frozen=True, slots=True)
+class RunningModelStatus:
+    state: ModelState
+    loading_elapsed: float | None
+    replicas: tuple[ModelState, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class ModelUnloadCounters:
+    scheduled: int
+    cancelled: int
+    executed: int
+
+
+def _running_whisper_models(host: InferenceHost) -> dict[str, RunningModelStatus]:
+    model_manager = host.model_managers["whisper"]
+    assert isinstance(model_manager, WhisperModelManager)
+    return {
+        model_id: RunningModelStatus(
+            model.state, model.loading_elapsed, tuple(replica.state for replica in model.replicas)
+        )
+        for model_id, model in list(model_manager.loaded_models.items())
+    }
+
+
+def _whisper_unload_counters(host: InferenceHost) -> ModelUnloadCounters:
+    model_manager = host.model_managers["whisper"]
+    assert isinstance(model_manager, WhisperModelManager)
+    reaper = model_manager.reaper
+    return ModelUnloadCounters(reaper.scheduled, reaper.cancelled, reaper.executed)
+
+
+def _warm_whisper_models(host: InferenceHost) -> dict[str, int]:
+    model_manager = host.model_managers["whisper"]
+    assert isinstance(model_manager, WhisperModelManager)
+    return model_manager.warm_models
+
+
+def _preload_whisper_model(host: InferenceHost, model_id: str) -> None:
+    with host.model_managers["whisper"].load_model(model_id):
+        pass
+
+
+def _unload_whisper_model(host: InferenceHost, model_id: str) -> None:
+    host.model_managers["whisper"].unload_model(model_id)
+
+
+def _get_speech_timestamps(
+    host: InferenceHost, _stack: ExitStack, audio: NDArray[np.float32], vad_options: VadOptions
+) -> list[dict[str, int]]:
+    return speech_timestamps(host.vad_model_manager.speech_probabilities(audio), len(audio), vad_options)
+
+
+def _speech_probabilities(host: InferenceHost, _stack: ExitStack, audio: NDArray[np.float32]) -> NDArray[np.float32]:
+    return host.vad_model_manager.speech_probabilities(audio)
+
+
+INFERENCE_HOST_HANDLERS: dict[str, Callable[..., object]] = {
+    **{f"whisper.{method}": _model_handler("whisper", handler) for method, handler in WHISPER_HANDLERS.items()},
+    **{f"piper.{method}": _model_handler("piper", handler) for method, handler in PIPER_HANDLERS.items()},
+    **{f"kokoro.{method}": _model_handler("kokoro", handler) for method, handler in KOKORO_HANDLERS.items()},
+    "whisper.running_models": _running_whisper_models,
+    "whisper.unload_counters": _whisper_unload_counters,
+    "whisper.warm_models": _warm_whisper_models,
+    "whisper.preload_model": _preload_whisper_model,
+    "whisper.unload_model": _unload_whisper_model,
+    "vad.get_speech_timestamps": _handler(_get_speech_timestamps),
+    "vad.speech_probabilities": _handler(_speech_probabilities),
+}
+
+
+class InferenceHost:
+    """Serves inference requests from API workers. Every connection gets its own thread and handles one request at a time, so clients open as many connections as they have concurrent requests."""
+
+    def __init__(
+        self, socket_path: str, model_managers: dict[ModelKind, ModelManager], vad_model_manager: VadModelManager
+    ) -> None:
+        self.socket_path = socket_path
+        self.model_managers = model_managers
+        self.vad_model_manager = vad_model_manager
+
+    def serve_forever(self) -> None:
+        # remove the socket left behind by a previous instance that didn't shut down cleanly
+        with contextlib.suppress(FileNotFoundError):
+            Path(self.socket_path).unlink()
+        with Listener(self.socket_path, family="AF_UNIX") as listener:
+            logger.info(f"Inference host listening on {self.socket_path}")
+            while True:
+                connection = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def _serve_connection(self, connection: Connection) -> None:
+        with connection:
+            serve_requests(connection, self, INFERENCE_HOST_HANDLERS)
+
+
+def main() -> None:
+    config = Config()
+    setup_logger(config.log_level)
+    if config.inference_host_socket is None:
+        msg = "`INFERENCE_HOST_SOCKET` must be set"
+        raise SystemExit(msg)
+    residency_controller = ModelResidencyController(config.residency.memory_budget, config.residency.pinned_model_ids)
+    inference_host = InferenceHost(
+        config.inference_host_socket,
+        {
+            "whisper": WhisperModelManager(
+                config.whisper, residency_controller, config.model_host, ModelWarmer(config.residency.warm_tier_size)
+            ),
+            "piper": PiperModelManager(config.piper.ttl, residency_controller, config.model_host),
+            "kokoro": KokoroModelManager(config.kokoro.ttl, residency_controller, config.model_host),
+        },
+        VadModelManager(config.vad, residency_controller),
+    )
+    inference_host.serve_forever()
+
+
+# API worker side
+
+
+class InferenceHostClient:
+    """Forwards requests to the inference host listening on `socket_path`. NumPy array arguments are passed through shared memory."""
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self._idle_channels: list[RequestChannel] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _channel(self) -> Generator[RequestChannel, None, None]:
+        with self._lock:
+            channel = self._idle_channels.pop() if self._idle_channels else None
+        if channel is None:
+            channel = RequestChannel(Client(self.socket_path, family="AF_UNIX"), "Inference host")
+        try:
+            yield channel
+        except ModelHostCrashedError:
+            channel.close()
+            raise
+        finally:
+            if not channel.connection.closed:
+                with self._lock:
+                    self._idle_channels.append(channel)
+
+    def call(self, method: str, *args: object, **kwargs) -> Any:  # noqa: ANN401
+        with ExitStack() as stack, self._channel() as channel:
+            args, kwargs = _map_args(lambda value: _share(stack, value), args, kwargs)
+            return channel.call(method, *args, **kwargs)
+
+    def call_stream(self, method: str, *args: object, **kwargs) -> Generator[Any, None, None]:
+        with ExitStack() as stack, self._channel() as channel:
+            args, kwargs = _map_args(lambda value: _share(stack, value), args, kwargs)
+            yield from channel.call_stream(method, *args, **kwargs)
+
+    def get_speech_timestamps(self, audio: NDArray[np.float32], vad_options: VadOptions) -> list[dict[str, int]]:
+        return self.call("vad.get_speech_timestamps", audio, vad_options)
+
+    def speech_probabilities(self, audio: NDArray[np.float32]) -> NDArray[np.float32]:
+        return self.call("vad.speech_probabilities", audio)
+
+
+def _share(stack: ExitStack, value: object) -> object:
+    return stack.enter_context(share_array(value)) if isinstance(value, np.ndarray) else value
+
+
+class RemoteModel:
+    """A model living in the inference host. Implements `speaches.model_host.ModelHostLike` so that the same proxies can be used."""
+
+    def __init__(self, client: InferenceHostClient, kind: ModelKind, model_id: str) -> None:
+        self.client = client
+        self.kind = kind
+        self.model_id = model_id
+
+    @property
+    def rss(self) -> int:
+        return 0  # accounted for by the inference host
+
+    def call(self, method: str, *args: object, **kwargs) -> Any:  # noqa: ANN401
+        return self.client.call(f"{self.kind}.{method}", self.model_id, *args, **kwargs)
+
+    def call_stream(self, method: str, *args: object, **kwargs) -> Generator[Any, None, None]:
+        return self.client.call_stream(f"{self.kind}.{method}", self.model_id, *args, **kwargs)
+
+    def close(self) -> None:
+        pass
+
+
+class RemoteModelLease[T]:
+    """Stands in for `SelfDisposingModel`. The inference host acquires the model for the duration of each call rather than for the duration of the `with` block."""
+
+    def __init__(self, model: T) -> None:
+        self.model = model
+
+    def __enter__(self) -> T:
+        return self.model
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        pass
+
+    async def __aenter__(self) -> T:
+        return self.model
+
+    async def __aexit__(
+        self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        pass
+
+
+class RemoteModelManager[T: ModelHostProxy]:
+    def __init__(self, client: InferenceHostClient, kind: ModelKind, create_proxy: Callable[[RemoteModel], T]) -> None:
+        self.client = client
+        self.kind = kind
+        self.create_proxy = create_proxy
+
+    def load_model(self, model_id: str) -> RemoteModelLease[T]:
+        return RemoteModelLease(self.create_proxy(RemoteModel(self.client, self.kind, model_id)))
+
+
+class RemoteWhisperModelManager(RemoteModelManager[WhisperModelProxy]):
+    def __init__(self, client: InferenceHostClient) -> None:
+        super().__init__(client, "whisper", WhisperModelProxy)
+
+    @property
+    def loaded_models(self) -> dict[str, RunningModelStatus]:
+        """Snapshot of the models loaded by the inference host."""
+        return self.client.call("whisper.running_models")
+
+    @property
+    def warm_models(self) -> dict[str, int]:
+        return self.client.call("whisper.warm_models")
+
+    @property
+    def reaper(self) -> ModelUnloadCounters:
+        """Snapshot of the inference host's TTL based unload counters."""
+        return self.client.call("whisper.unload_counters")
+
+    def preload_model(self, model_id: str) -> None:
+        self.client.call("whisper.preload_model", model_id)
+
+    def unload_model(self, model_id: str) -> None:
+        self.client.call("whisper.unload_model", model_id)
+
+
+class RemotePiperModelManager(RemoteModelManager[PiperVoiceProxy]):
+    def __init__(self, client: InferenceHostClient) -> None:
+        super().__init__(client, "piper", PiperVoiceProxy)
+
+
+class RemoteKokoroModelManager(RemoteModelManager[KokoroProxy]):
+    def __init__(self, client: InferenceHostClient) -> None:
+        super().__init__(client, "kokoro", KokoroProxy)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@ import numpy as np
 from speaches.api_types import Model, Voice
 from speaches.audio import resample_audio
 from speaches.hf_utils import list_model_files
+from speaches.model_host import KokoroProxy
 
 KOKORO_REVISION = "c97b7bbc3e60f447383c79b2f94fee861ff156ac"
 MODEL_ID = "hexgrad/Kokoro-82M"
@@ -94,7 +95,7 @@ def list_kokoro_voices() -> list[Voice]:
 
 
 async def generate_audio(
-    kokoro_tts: Kokoro,
+    kokoro_tts: Kokoro | KokoroProxy,
     text: str,
     voice: str,
     *,
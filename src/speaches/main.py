@@ -1,15 +1,19 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
 import logging
+from typing import TYPE_CHECKING
 
 from fastapi import (
     FastAPI,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.responses import RedirectResponse
 
-from speaches.dependencies import ApiKeyDependency, get_config
+from speaches.admission import AdmissionRejectedError, QueueFullError
+from speaches.dependencies import ApiKeyDependency, get_config, get_model_preloader
 from speaches.logger import setup_logger
 from speaches.routers.chat import (
     router as chat_router,
@@ -36,6 +40,11 @@ from speaches.routers.vad import (
     router as vad_router,
 )
 
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator
+
+    from starlette.requests import Request
+
 # https://swagger.io/docs/specification/v3_0/grouping-operations-with-tags/
 # https://fastapi.tiangolo.com/tutorial/metadata/#metadata-for-tags
 TAGS_METADATA = [
@@ -51,6 +60,21 @@ TAGS_METADATA = [
 ]
 
 
+def admission_rejected_handler(_request: Request, exc: Exception) -> JSONResponse:
+    assert isinstance(exc, AdmissionRejectedError)
+    return JSONResponse(
+        status_code=429 if isinstance(exc, QueueFullError) else 503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None]:
+    get_model_preloader().start()
+    yield
+
+
 def create_app() -> FastAPI:
     config = get_config()  # HACK
     setup_logger(config.log_level)
@@ -62,7 +86,8 @@ def create_app() -> FastAPI:
     if config.api_key is not None:
         dependencies.append(ApiKeyDependency)
 
-    app = FastAPI(dependencies=dependencies, openapi_tags=TAGS_METADATA)
+    app = FastAPI(dependencies=dependencies, openapi_tags=TAGS_METADATA, lifespan=lifespan)
+    app.add_exception_handler(AdmissionRejectedError, admission_rejected_handler)
 
     app.include_router(chat_router)
     app.include_router(stt_router)
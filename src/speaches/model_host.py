@@ -0,0 +1,428 @@
+"""Run models in dedicated child processes.
+
+Unloading a model that lives in a child process terminates the process, which returns all of its memory to the OS (unlike https://github.com/SYSTRAN/faster-whisper/issues/992). A crash in native code (CTranslate2, ONNX Runtime) only takes down the child process, which gets respawned by a watchdog.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Generator, Iterator
+import contextlib
+from functools import cached_property
+import itertools
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+import pickle
+import threading
+import time
+import traceback
+from typing import TYPE_CHECKING, Any, Protocol
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Callable
+    from multiprocessing.connection import Connection
+    from multiprocessing.sharedctypes import Synchronized
+
+    from faster_whisper import WhisperModel
+    from faster_whisper.transcribe import BatchedInferencePipeline, Segment, TranscriptionInfo
+    from kokoro_onnx import Kokoro
+    import numpy as np
+    from numpy.typing import NDArray
+    from piper.voice import PiperConfig, PiperVoice
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN = "__shutdown__"
+CANCEL = "__cancel__"
+
+
+def get_process_rss(pid: int | None = None) -> int:
+    """Resident set size of a process (the current one by default) in bytes. Returns 0 on platforms without `/proc`."""
+    try:
+        resident_pages = int(Path(f"/proc/{pid or 'self'}/statm").read_text().split()[1])
+    except OSError:
+        return 0
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class ModelHostError(Exception):
+    """An exception raised inside of the model host process. Carries the formatted traceback since the original exception might not be picklable."""
+
+
+class ModelHostCrashedError(ModelHostError):
+    pass
+
+
+def _mark_busy(busy_since: Synchronized[float] | None, *, busy: bool) -> None:
+    if busy_since is not None:
+        busy_since.value = time.monotonic() if busy else 0.0
+
+
+def _serve(
+    connection: Connection,
+    busy_since: Synchronized[float],
+    load_fn: Callable[..., Any],
+    load_args: tuple[Any, ...],
+    handlers: dict[str, Callable[..., Any]],
+) -> None:
+    """Entry point of the model host process."""
+    try:
+        model = load_fn(*load_args)
+    except Exception as e:  # noqa: BLE001
+        connection.send(("error", 0, ModelHostError(f"Failed to load the model: {e}\n{traceback.format_exc()}")))
+        return
+    connection.send(("ready", 0, None))
+    serve_requests(connection, model, handlers, busy_since)
+
+
+def serve_requests(
+    connection: Connection,
+    target: object,
+    handlers: dict[str, Callable[..., Any]],
+    busy_since: Synchronized[float] | None = None,
+) -> None:
+    """Execute requests received over `connection` as `handlers[method](target, *args, **kwargs)` until the connection gets closed or a shutdown is requested. Counterpart of `RequestChannel`.
+
+    If given, `busy_since` is set to the `time.monotonic()` at which the handler started working on its current result (the whole result or the next streamed item) and to 0 while there's none, i.e. while waiting for a request or for the other side to receive a result.
+    """
+    while True:
+        try:
+            request_id, method, args, kwargs = connection.recv()
+        except (EOFError, OSError):
+            return
+        if method == SHUTDOWN:
+            return
+        if method == CANCEL:
+            continue  # the request had already finished by the time the cancellation arrived
+        _mark_busy(busy_since, busy=True)
+        try:
+            _handle_request(connection, request_id, handlers[method](target, *args, **kwargs), busy_since)
+        except Exception as e:  # noqa: BLE001
+            _mark_busy(busy_since, busy=False)
+            try:
+                _send_error(connection, request_id, e)
+            except OSError:
+                return  # the other side went away
+
+
+def _send_error(connection: Connection, request_id: int, e: Exception) -> None:
+    e.add_note(f"Raised in process {os.getpid()}:\n{traceback.format_exc()}")
+    try:
+        connection.send(("error", request_id, e))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        connection.send(("error", request_id, ModelHostError(f"{e}\n{traceback.format_exc()}")))
+
+
+def _handle_request(
+    connection: Connection, request_id: int, result: object, busy_since: Synchronized[float] | None
+) -> None:
+    if not isinstance(result, Iterator):
+        _mark_busy(busy_since, busy=False)
+        connection.send(("result", request_id, result))
+        return
+    try:
+        for item in result:
+            # NOTE: sending blocks while the other side isn't consuming the items, which isn't the handler's fault
+            _mark_busy(busy_since, busy=False)
+            connection.send(("item", request_id, item))
+            # NOTE: the only message the other side sends while a request is in progress is a cancellation
+            if connection.poll():
+                connection.recv()
+                break
+            _mark_busy(busy_since, busy=True)
+    finally:
+        if isinstance(result, Generator):
+            result.close()
+    _mark_busy(busy_since, busy=False)
+    connection.send(("end", request_id, None))
+
+
+class RequestChannel:
+    """Sends requests to `serve_requests` running on the other end of `connection`. Requests must be made one at a time.
+
+    Handlers returning an iterator have their items streamed back as they're produced.
+    """
+
+    def __init__(self, connection: Connection, name: str) -> None:
+        self.connection = connection
+        self.name = name
+        self._request_ids = itertools.count(1)
+
+    def receive(self) -> tuple[str, int, Any]:
+        try:
+            return self.connection.recv()
+        except (EOFError, OSError) as e:
+            raise ModelHostCrashedError(f"{self.name} closed the connection unexpectedly") from e
+
+    def call(self, method: str, *args: object, **kwargs) -> Any:  # noqa: ANN401
+        self.connection.send((next(self._request_ids), method, args, kwargs))
+        kind, _, payload = self.receive()
+        if kind == "error":
+            raise payload
+        return payload
+
+    def call_stream(self, method: str, *args: object, **kwargs) -> Generator[Any, None, None]:
+        request_id = next(self._request_ids)
+        self.connection.send((request_id, method, args, kwargs))
+        finished = False
+        try:
+            while True:
+                kind, _, payload = self.receive()
+                if kind == "item":
+                    yield payload
+                    continue
+                finished = True
+                if kind == "error":
+                    raise payload
+                return
+        finally:
+            if not finished:
+                self._cancel(request_id)
+
+    def _cancel(self, request_id: int) -> None:
+        """Stop streaming the results of an abandoned request and discard the ones that were already sent."""
+        try:
+            self.connection.send((request_id, CANCEL, (), {}))
+            while self.receive()[0] == "item":
+                pass
+        except (ModelHostCrashedError, OSError):
+            pass
+
+    def shutdown(self) -> None:
+        with contextlib.suppress(OSError):
+            self.connection.send((0, SHUTDOWN, (), {}))
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class ModelHost:
+    """Owns a child process which loads a model using `load_fn(*load_args)` and executes `handlers` against it.
+
+    Requests are executed one at a time. Handlers returning an iterator have their items streamed back as they're produced. The process gets restarted when it crashes or when a handler spends more than `hang_timeout` seconds on a result (or on the next item of a streamed one), for example because it hangs in native code.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load_fn: Callable[..., Any],
+        load_args: tuple[Any, ...],
+        handlers: dict[str, Callable[..., Any]],
+        *,
+        check_interval: float = 1.0,
+        hang_timeout: float = 60.0,
+    ) -> None:
+        self.name = name
+        self.load_fn = load_fn
+        self.load_args = load_args
+        self.handlers = handlers
+        self.check_interval = check_interval
+        self.hang_timeout = hang_timeout
+        self.restarts = 0
+
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        """Held for the duration of a request (including streaming its items) and while (re)spawning the process."""
+        self._closed = threading.Event()
+        with self._lock:
+            self._spawn()
+        self._watchdog = threading.Thread(target=self._watch, name=f"model-host-watchdog-{name}", daemon=True)
+        self._watchdog.start()
+
+    @property
+    def pid(self) -> int | None:
+        return self._process.pid
+
+    @property
+    def rss(self) -> int:
+        return get_process_rss(self._process.pid)
+
+    def _spawn(self) -> None:
+        """Start the process and wait until the model is loaded. Must be called while holding `self._lock`."""
+        connection, child_connection = self._context.Pipe()
+        self._channel = RequestChannel(connection, f"Model host for {self.name}")
+        self._busy_since = self._context.Value("d", 0.0, lock=False)
+        """See `serve_requests`."""
+        self._process = self._context.Process(
+            target=_serve,
+            args=(
+                child_connection,
+                self._busy_since,
+                self.load_fn,
+                self.load_args,
+                self.handlers,
+            ),
+            name=f"model-host-{self.name}",
+            daemon=True,
+        )
+        start = time.perf_counter()
+        self._process.start()
+        child_connection.close()
+        kind, _, payload = self._channel.receive()
+        if kind == "error":
+            self._kill()
+            raise payload
+        logger.info(f"Model host for {self.name} (pid {self._process.pid}) ready in {time.perf_counter() - start:.2f}s")
+
+    def _kill(self) -> None:
+        self._process.kill()
+        self._process.join()
+        self._channel.close()
+
+    def _watch(self) -> None:
+        while not self._closed.wait(self.check_interval):
+            busy_since = self._busy_since.value
+            busy_for = time.monotonic() - busy_since if busy_since else 0.0
+            if self._process.is_alive() and busy_for < self.hang_timeout:
+                continue
+            if self._process.is_alive():
+                logger.error(
+                    f"Model host for {self.name} hasn't made progress on a request in {busy_for:.0f}s, restarting it"
+                )
+            else:
+                logger.error(f"Model host for {self.name} crashed (exit code {self._process.exitcode}), restarting it")
+            # killing the process first unblocks the request (if any) which is waiting on it and releases `self._lock`
+            self._kill()
+            with self._lock:
+                if self._closed.is_set():
+                    return
+                try:
+                    self._spawn()
+                except Exception:
+                    logger.exception(f"Failed to restart the model host for {self.name}")
+                else:
+                    self.restarts += 1
+
+    def call(self, method: str, *args: object, **kwargs) -> Any:  # noqa: ANN401
+        with self._lock:
+            return self._channel.call(method, *args, **kwargs)
+
+    def call_stream(self, method: str, *args: object, **kwargs) -> Generator[Any, None, None]:
+        with self._lock:
+            yield from self._channel.call_stream(method, *args, **kwargs)
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            self._channel.shutdown()
+            self._process.join(timeout=5)
+            if self._process.is_alive():
+                self._kill()
+        logger.info(f"Model host for {self.name} stopped")
+
+
+class ModelHostLike(Protocol):
+    """Anything that can execute a model's handlers on behalf of a proxy. Implemented by `ModelHost` and `speaches.inference_host.RemoteModel`."""
+
+    @property
+    def rss(self) -> int: ...
+
+    def call(self, method: str, *args: object, **kwargs) -> Any: ...  # noqa: ANN401
+
+    def call_stream(self, method: str, *args: object, **kwargs) -> Generator[Any, None, None]: ...
+
+    def close(self) -> None: ...
+
+
+class ModelHostProxy:
+    """Base class for objects that stand in for a model living in another process."""
+
+    def __init__(self, host: ModelHostLike) -> None:
+        self.host = host
+
+    @property
+    def memory_footprint(self) -> int:
+        return self.host.rss
+
+    def close(self) -> None:
+        self.host.close()
+
+
+# NOTE: handlers run inside of the model host process. They need to be module level functions so that they can be pickled
+
+
+def whisper_transcribe(
+    model: WhisperModel | BatchedInferencePipeline | WhisperModelProxy,
+    audio: NDArray[np.float32],
+    *,
+    batch_size: int | None = None,
+    **kwargs,
+) -> Generator[TranscriptionInfo | Segment, None, None]:
+    from faster_whisper import WhisperModel
+
+    from speaches.vad import transcribe_speech
+
+    # NOTE: `batch_size` is only understood by batched pipelines and proxies of them
+    if batch_size is not None and not isinstance(model, WhisperModel):
+        kwargs["batch_size"] = batch_size
+    # NOTE: passed by API workers which don't know which kind of model this is (see `transcribe_speech`)
+    speech_timestamps = kwargs.pop("speech_timestamps", None)
+    segments, transcription_info = transcribe_speech(model, audio, speech_timestamps, **kwargs)
+    yield transcription_info
+    yield from segments
+
+
+WHISPER_HANDLERS: dict[str, Callable[..., Any]] = {"transcribe": whisper_transcribe}
+
+
+class WhisperModelProxy(ModelHostProxy):
+    def transcribe(
+        self, audio: NDArray[np.float32], **kwargs
+    ) -> tuple[Generator[Segment, None, None], TranscriptionInfo]:
+        stream = self.host.call_stream("transcribe", audio, **kwargs)
+        transcription_info = next(stream)
+        return stream, transcription_info
+
+
+def piper_config(model: PiperVoice) -> PiperConfig:
+    return model.config
+
+
+def piper_synthesize_stream_raw(model: PiperVoice, text: str, **kwargs) -> Iterator[bytes]:
+    return model.synthesize_stream_raw(text, **kwargs)
+
+
+PIPER_HANDLERS: dict[str, Callable[..., Any]] = {
+    "config": piper_config,
+    "synthesize_stream_raw": piper_synthesize_stream_raw,
+}
+
+
+class PiperVoiceProxy(ModelHostProxy):
+    @cached_property
+    def config(self) -> PiperConfig:
+        return self.host.call("config")
+
+    def synthesize_stream_raw(self, text: str, **kwargs) -> Generator[bytes, None, None]:
+        return self.host.call_stream("synthesize_stream_raw", text, **kwargs)
+
+
+def kokoro_create_stream(
+    model: Kokoro, *args: object, **kwargs
+) -> Generator[tuple[NDArray[np.float32], int], None, None]:
+    loop = asyncio.new_event_loop()
+    audio_stream = model.create_stream(*args, **kwargs)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(anext(audio_stream))
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(audio_stream.aclose())
+        loop.close()
+
+
+KOKORO_HANDLERS: dict[str, Callable[..., Any]] = {"create_stream": kokoro_create_stream}
+
+
+class KokoroProxy(ModelHostProxy):
+    async def create_stream(self, *args: object, **kwargs) -> AsyncGenerator[tuple[NDArray[np.float32], int], None]:
+        stream = self.host.call_stream("create_stream", *args, **kwargs)
+        try:
+            while (item := await asyncio.to_thread(next, stream, None)) is not None:
+                yield item
+        finally:
+            await asyncio.to_thread(stream.close)
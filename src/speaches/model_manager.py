@@ -1,34 +1,337 @@
 from __future__ import annotations
 
-from collections import OrderedDict
+import asyncio
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 import gc
+import heapq
+import itertools
 import json
 import logging
+import mmap
+import os
 from pathlib import Path
 import threading
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal
 
 from faster_whisper import WhisperModel
+from faster_whisper.transcribe import BatchedInferencePipeline
 from kokoro_onnx import Kokoro
 from onnxruntime import InferenceSession
 
+from speaches import hf_utils, vad
+from speaches.batching import BatchScheduler, DynamicBatchedInferencePipeline, SharedBatchedInferencePipeline
 from speaches.kokoro_utils import get_kokoro_model_path
+from speaches.model_host import (
+    KOKORO_HANDLERS,
+    PIPER_HANDLERS,
+    WHISPER_HANDLERS,
+    KokoroProxy,
+    ModelHost,
+    ModelHostProxy,
+    PiperVoiceProxy,
+    WhisperModelProxy,
+    get_process_rss,
+)
 from speaches.piper_utils import get_piper_voice_model_file
+from speaches.vad import SileroVadModel, VadBatchScheduler
 
 if TYPE_CHECKING:
-    from collections.abc import Callable
+    from collections.abc import Callable, Iterable
 
+    import numpy as np
+    from numpy.typing import NDArray
     from piper.voice import PiperVoice
 
     from speaches.config import (
+        ModelHostConfig,
+        VadConfig,
         WhisperConfig,
     )
 
 logger = logging.getLogger(__name__)
 
+ONNX_PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+MAX_CONCURRENT_MODEL_LOADS = 4
+# NOTE: model construction (and downloading, if the model isn't available locally) happens here rather than in the request's thread so that concurrent requests for the same model can share a single load and requests for different models load in parallel
+model_loader = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_MODEL_LOADS, thread_name_prefix="model-loader")
+
+type ModelState = Literal["unloaded", "loading", "loaded"]
+type AnyWhisperModel = WhisperModel | BatchedInferencePipeline | WhisperModelProxy
+type AnyVadModel = SileroVadModel | VadBatchScheduler
+
+
+class ModelResidencyController:
+    """Keeps the combined memory footprint of models loaded by all model managers within `memory_budget`.
+
+    Models register themselves once loaded. Before another model gets loaded, the least recently used idle models are unloaded until the new model's (previously measured) footprint fits.
+    """
+
+    def __init__(self, memory_budget: int | None = None, pinned_model_ids: Iterable[str] = ()) -> None:
+        self.memory_budget = memory_budget
+        self.pinned_model_ids = set(pinned_model_ids)
+        self.resident_models: list[SelfDisposingModel] = []
+        self.footprints: dict[str, int] = {}
+        """Last measured footprint of each model ID. Used to estimate how much memory a model needs before it's loaded."""
+        self._lock = threading.Lock()
+
+    @property
+    def used_memory(self) -> int:
+        with self._lock:
+            return sum(model.memory_footprint for model in self.resident_models)
+
+    def is_pinned(self, model_id: str) -> bool:
+        return model_id in self.pinned_model_ids
+
+    def register(self, model: SelfDisposingModel) -> None:
+        with self._lock:
+            self.footprints[model.model_id] = model.memory_footprint
+            if model not in self.resident_models:
+                self.resident_models.append(model)
+
+    def unregister(self, model: SelfDisposingModel) -> None:
+        with self._lock:
+            if model in self.resident_models:
+                self.resident_models.remove(model)
 
-# TODO: enable concurrent model downloads
+    def make_room(self, for_model: SelfDisposingModel) -> None:
+        if self.memory_budget is None:
+            return
+        with self._lock:
+            required = 0 if for_model in self.resident_models else self.footprints.get(for_model.model_id, 0)
+            candidates = sorted(
+                (
+                    model
+                    for model in self.resident_models
+                    if model is not for_model and not self.is_pinned(model.model_id)
+                ),
+                key=lambda model: model.last_used,
+            )
+        # NOTE: candidates are unloaded outside of `self._lock` since unloading calls back into the model managers
+        for candidate in candidates:
+            if self.used_memory + required <= self.memory_budget:
+                return
+            if candidate.try_unload():
+                logger.info(
+                    f"Evicted {candidate.model_id} to stay within the memory budget of {self.memory_budget} bytes"
+                )
+        if self.used_memory + required > self.memory_budget:
+            logger.warning(
+                f"Loaded models use {self.used_memory} bytes which together with {for_model.model_id} ({required} bytes) exceeds the memory budget of {self.memory_budget} bytes. All other models are either in use or pinned"
+            )
+
+
+class ModelReaper:
+    """Unloads idle models once their TTL expires.
+
+    A single thread serves every managed model: expiry deadlines are kept in a heap and cancelling an expiry only bumps the model's `expire_generation`, which turns the heap entry stale. Garbage collection after unloading also happens on this thread, outside of any model lock.
+    """
+
+    def __init__(self) -> None:
+        self.scheduled = 0
+        self.cancelled = 0
+        self.executed = 0
+        self._deadlines: list[tuple[float, int, int, SelfDisposingModel]] = []
+        """Heap of `(deadline, sequence number, expire generation, model)`."""
+        self._sequence = itertools.count()
+        self._gc_requested = False
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-reaper", daemon=True)
+            self._thread.start()
+
+    def schedule(self, model: SelfDisposingModel, ttl: float) -> None:
+        with self._condition:
+            model.expire_generation += 1
+            model.expires_at = time.monotonic() + ttl
+            heapq.heappush(self._deadlines, (model.expires_at, next(self._sequence), model.expire_generation, model))
+            self.scheduled += 1
+            self._ensure_started()
+            self._condition.notify()
+
+    def cancel(self, model: SelfDisposingModel) -> bool:
+        with self._condition:
+            if model.expires_at is None:
+                return False
+            model.expire_generation += 1
+            model.expires_at = None
+            self.cancelled += 1
+            return True
+
+    def collect_garbage(self) -> None:
+        """Request a `gc.collect()` on the reaper thread."""
+        with self._condition:
+            self._gc_requested = True
+            self._ensure_started()
+            self._condition.notify()
+
+    def _expire(self, model: SelfDisposingModel, generation: int) -> None:
+        with model.rlock:
+            with self._condition:
+                if generation != model.expire_generation or model.expires_at is None:
+                    return  # the expiry got cancelled or rescheduled
+                model.expires_at = None
+                if model.ref_count > 0 or model.model is None:
+                    return
+                self.executed += 1
+            logger.info(f"Model {model.model_id} has been idle for {model.ttl}s, unloading")
+            model.unload()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._gc_requested and (
+                    len(self._deadlines) == 0 or self._deadlines[0][0] > time.monotonic()
+                ):
+                    timeout = self._deadlines[0][0] - time.monotonic() if len(self._deadlines) > 0 else None
+                    self._condition.wait(timeout)
+                due: list[tuple[float, int, int, SelfDisposingModel]] = []
+                while len(self._deadlines) > 0 and self._deadlines[0][0] <= time.monotonic():
+                    due.append(heapq.heappop(self._deadlines))
+                gc_requested, self._gc_requested = self._gc_requested, False
+            for _, _, generation, model in due:
+                try:
+                    self._expire(model, generation)
+                except Exception:
+                    logger.exception(f"Failed to unload {model.model_id}")
+            # NOTE: expired models request garbage collection themselves, which gets picked up on the next iteration
+            if gc_requested:
+                gc.collect()
+
+
+model_reaper = ModelReaper()
+
+
+def list_model_weight_files(model_id: str) -> list[Path]:
+    """Files of the model's Hugging Face snapshot, with symlinks resolved to the blobs they point to."""
+    return sorted({path.resolve() for path in hf_utils.list_model_files(model_id) if path.is_file()})
+
+
+class ModelWarmer:
+    """Keeps the weight files of models that aren't loaded in the OS page cache so that reloading them doesn't have to read from disk.
+
+    Warm models have their files memory mapped with `MADV_WILLNEED`, which makes the kernel read them ahead without adding them to this process' resident memory. The kernel may still evict those pages under memory pressure. At most `budget` bytes of files are kept warm, evicting the least recently warmed models first. Files get warmed by a background thread: a model that was just unloaded, followed by the models that were loaded the most often (the models predicted to be needed next) as long as they fit without evicting anything.
+    """
+
+    def __init__(
+        self, budget: int, list_files: Callable[[str], list[Path]] = list_model_weight_files, max_predicted: int = 2
+    ) -> None:
+        self.budget = budget
+        self.list_files = list_files
+        self.max_predicted = max_predicted
+        self.warm_models: OrderedDict[str, list[mmap.mmap]] = OrderedDict()
+        self.sizes: dict[str, int] = {}
+        self.load_counts: Counter[str] = Counter()
+        self._pending: deque[tuple[str, bool]] = deque()
+        """`(model_id, evict)` pairs waiting to be warmed."""
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def used(self) -> int:
+        with self._condition:
+            return self._used_locked()
+
+    def _used_locked(self) -> int:
+        return sum(self.sizes[model_id] for model_id in self.warm_models)
+
+    def list_warm_models(self) -> dict[str, int]:
+        """Size of the files kept warm for each model, least recently warmed first."""
+        with self._condition:
+            return {model_id: self.sizes[model_id] for model_id in self.warm_models}
+
+    def is_warm(self, model_id: str) -> bool:
+        with self._condition:
+            return model_id in self.warm_models
+
+    def record_load(self, model_id: str) -> None:
+        """Called when a model starts loading. Its files no longer need to be kept warm by the warmer."""
+        with self._condition:
+            self.load_counts[model_id] += 1
+        self.release(model_id)
+
+    def release(self, model_id: str) -> None:
+        with self._condition:
+            self._release_locked(model_id)
+
+    def _release_locked(self, model_id: str) -> None:
+        for file in self.warm_models.pop(model_id, []):
+            file.close()
+
+    def predict(self, exclude: Iterable[str] = ()) -> list[str]:
+        """Models which are most likely to be requested next, most likely first."""
+        excluded = set(exclude)
+        with self._condition:
+            return [
+                model_id
+                for model_id, _ in self.load_counts.most_common()
+                if model_id not in excluded and model_id not in self.warm_models
+            ][: self.max_predicted]
+
+    def request_warm(self, model_id: str, *, evict: bool = True) -> None:
+        """Warm `model_id` on the background thread. With `evict=False` the model only gets warmed if it fits within the budget without evicting other models."""
+        if self.budget == 0:
+            return
+        with self._condition:
+            self._pending.append((model_id, evict))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="model-warmer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def warm(self, model_id: str, *, evict: bool = True) -> bool:
+        """Returns whether the model is warm."""
+        files = self.list_files(model_id)
+        size = sum(file.stat().st_size for file in files)
+        with self._condition:
+            if model_id in self.warm_models:
+                self.warm_models.move_to_end(model_id)
+                return True
+            self.sizes[model_id] = size
+            load_count = self.load_counts[model_id]
+            evicted: list[str] = []
+            while self._used_locked() + size > self.budget:
+                if not evict or len(self.warm_models) == 0:
+                    return False
+                evicted.append(next(iter(self.warm_models)))
+                self._release_locked(evicted[-1])
+        start = time.perf_counter()
+        mapped_files = [self._map(file) for file in files if file.stat().st_size > 0]
+        with self._condition:
+            if self.load_counts[model_id] != load_count:
+                # the model started loading in the meantime
+                for file in mapped_files:
+                    file.close()
+                return False
+            self.warm_models[model_id] = mapped_files
+        if len(evicted) > 0:
+            logger.info(f"Evicted {evicted} from the warm tier to make room for {model_id}")
+        logger.info(
+            f"Warmed {len(mapped_files)} files ({size / 1024**2:.0f} MB) of {model_id} in {time.perf_counter() - start:.2f}s"
+        )
+        return True
+
+    def _map(self, path: Path) -> mmap.mmap:
+        with path.open("rb") as f:
+            file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        file.madvise(mmap.MADV_WILLNEED)
+        return file
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while len(self._pending) == 0:
+                    self._condition.wait()
+                model_id, evict = self._pending.popleft()
+            try:
+                self.warm(model_id, evict=evict)
+            except Exception:
+                logger.exception(f"Failed to warm {model_id}")
 
 
 class SelfDisposingModel[T]:
@@ -38,16 +341,27 @@ class SelfDisposingModel[T]:
         load_fn: Callable[[], T],
         ttl: int,
         model_unloaded_callback: Callable[[str], None] | None = None,
+        residency_controller: ModelResidencyController | None = None,
+        reaper: ModelReaper | None = None,
     ) -> None:
         self.model_id = model_id
         self.load_fn = load_fn
         self.ttl = ttl
         self.model_unloaded_callback = model_unloaded_callback
+        self.residency_controller = residency_controller
+        self.reaper = reaper or model_reaper
 
         self.ref_count: int = 0
         self.rlock = threading.RLock()
-        self.expire_timer: threading.Timer | None = None
+        self.expires_at: float | None = None
+        """`time.monotonic()` deadline after which the reaper unloads the model. `None` if no unload is scheduled."""
+        self.expire_generation = 0
         self.model: T | None = None
+        self.load_future: Future[None] | None = None
+        self.load_started_at: float | None = None
+        self.memory_footprint: int = 0
+        """Increase in the process's resident memory (in bytes) measured while loading the model. Only an approximation when several models are loaded concurrently."""
+        self.last_used = time.monotonic()
 
     def unload(self) -> None:
         with self.rlock:
@@ -55,119 +369,521 @@ class SelfDisposingModel[T]:
                 raise ValueError(f"Model {self.model_id} is not loaded. {self.ref_count=}")
             if self.ref_count > 0:
                 raise ValueError(f"Model {self.model_id} is still in use. {self.ref_count=}")
-            if self.expire_timer:
-                self.expire_timer.cancel()
-            self.model = None
-            gc.collect()
-            logger.info(f"Model {self.model_id} unloaded")
+            self._drop_model()
+        self._after_unload()
+
+    def try_unload(self, *, blocking: bool = False) -> bool:
+        """Unload the model if it's loaded and idle. Unless `blocking`, never blocks on a model that is currently being used or loaded."""
+        if not self.rlock.acquire(blocking=blocking):
+            return False
+        try:
+            if self.model is None or self.ref_count > 0:
+                return False
+            self._drop_model()
+        finally:
+            self.rlock.release()
+        self._after_unload()
+        return True
+
+    def _drop_model(self) -> None:
+        """Must be called while holding `self.rlock`."""
+        self.reaper.cancel(self)
+        model, self.model = self.model, None
+        if isinstance(model, ModelHostProxy):
+            # terminating the model's process returns all of its memory to the OS
+            model.close()
+        del model
+        logger.info(f"Model {self.model_id} unloaded")
+
+    def _after_unload(self) -> None:
+        self.reaper.collect_garbage()
+        if self.residency_controller is not None:
+            self.residency_controller.unregister(self)
+        # NOTE: called without holding `self.rlock` as the callback acquires the model manager's lock
+        if self.model_unloaded_callback is not None:
+            self.model_unloaded_callback(self.model_id)
+
+    @property
+    def state(self) -> ModelState:
+        if self.model is not None:
+            return "loaded"
+        if self.load_future is not None:
+            return "loading"
+        return "unloaded"
+
+    @property
+    def loading_elapsed(self) -> float | None:
+        """Seconds since the in-flight load started or `None` if the model isn't being loaded."""
+        load_started_at = self.load_started_at
+        return None if load_started_at is None else time.monotonic() - load_started_at
+
+    def _load(self) -> None:
+        logger.debug(f"Loading model {self.model_id}")
+        try:
+            if self.residency_controller is not None:
+                self.residency_controller.make_room(self)
+            rss_before = get_process_rss()
+            start = time.perf_counter()
+            model = self.load_fn()
+        except:
+            logger.exception(f"Failed to load model {self.model_id}")
+            with self.rlock:
+                self.load_future = None
+                self.load_started_at = None
             if self.model_unloaded_callback is not None:
                 self.model_unloaded_callback(self.model_id)
+            raise
+        with self.rlock:
+            self.model = model
+            self.memory_footprint = (
+                model.memory_footprint if isinstance(model, ModelHostProxy) else max(get_process_rss() - rss_before, 0)
+            )
+            self.load_future = None
+            self.load_started_at = None
+        logger.info(
+            f"Model {self.model_id} loaded in {time.perf_counter() - start:.2f}s using ~{self.memory_footprint / 1024**2:.0f} MB"
+        )
+        if self.residency_controller is not None:
+            self.residency_controller.register(self)
+            # the actual footprint is now known, unload other models if the estimate was too low
+            self.residency_controller.make_room(self)
 
-    def _load(self) -> None:
+    def _acquire(self) -> Future[None] | None:
+        """Take a reference to the model and start loading it if needed. Returns the in-flight load (shared by all concurrent callers) or `None` if the model is already loaded."""
         with self.rlock:
-            assert self.model is None
-            logger.debug(f"Loading model {self.model_id}")
-            start = time.perf_counter()
-            self.model = self.load_fn()
-            logger.info(f"Model {self.model_id} loaded in {time.perf_counter() - start:.2f}s")
+            self._increment_ref()
+            if self.model is not None:
+                return None
+            if self.load_future is None:
+                self.load_started_at = time.monotonic()
+                self.load_future = model_loader.submit(self._load)
+            return self.load_future
+
+    def _release_failed_load(self) -> None:
+        with self.rlock:
+            self.ref_count -= 1
 
     def _increment_ref(self) -> None:
         with self.rlock:
             self.ref_count += 1
-            if self.expire_timer:
-                logger.debug(f"Model was set to expire in {self.expire_timer.interval}s, cancelling")
-                self.expire_timer.cancel()
+            self.last_used = time.monotonic()
+            if self.reaper.cancel(self):
+                logger.debug(f"Model {self.model_id} was set to expire, cancelling")
             logger.debug(f"Incremented ref count for {self.model_id}, {self.ref_count=}")
 
     def _decrement_ref(self) -> None:
+        unload = False
         with self.rlock:
             self.ref_count -= 1
+            self.last_used = time.monotonic()
             logger.debug(f"Decremented ref count for {self.model_id}, {self.ref_count=}")
             if self.ref_count <= 0:
-                if self.ttl > 0:
+                if self.residency_controller is not None and self.residency_controller.is_pinned(self.model_id):
+                    logger.info(f"Model {self.model_id} is idle, not unloading since it's pinned")
+                elif self.ttl > 0:
                     logger.info(f"Model {self.model_id} is idle, scheduling offload in {self.ttl}s")
-                    self.expire_timer = threading.Timer(self.ttl, self.unload)
-                    self.expire_timer.start()
+                    self.reaper.schedule(self, self.ttl)
                 elif self.ttl == 0:
                     logger.info(f"Model {self.model_id} is idle, unloading immediately")
-                    self.unload()
+                    unload = True
                 else:
                     logger.info(f"Model {self.model_id} is idle, not unloading")
+        # NOTE: unloaded without holding `self.rlock` (see `unload`). The model gets kept if it got used again in the meantime
+        if unload:
+            self.try_unload(blocking=True)
 
     def __enter__(self) -> T:
-        with self.rlock:
-            if self.model is None:
-                self._load()
-            self._increment_ref()
-            assert self.model is not None
-            return self.model
+        load_future = self._acquire()
+        if load_future is not None:
+            try:
+                load_future.result()
+            except:
+                self._release_failed_load()
+                raise
+        assert self.model is not None
+        return self.model
 
     def __exit__(self, *_args) -> None:  # noqa: ANN002
         self._decrement_ref()
 
+    async def __aenter__(self) -> T:
+        """Same as `__enter__` but waits for the model to load without blocking the event loop or occupying a worker thread."""
+        load_future = self._acquire()
+        if load_future is not None:
+            try:
+                await asyncio.wrap_future(load_future)
+            except:
+                self._release_failed_load()
+                raise
+        assert self.model is not None
+        return self.model
+
+    async def __aexit__(self, *_args) -> None:  # noqa: ANN002
+        self._decrement_ref()
+
+
+def load_whisper_model(model_id: str, **kwargs) -> WhisperModel:
+    return WhisperModel(model_id, **kwargs)
+
+
+def load_batched_whisper_model(model_id: str, **kwargs) -> SharedBatchedInferencePipeline:
+    return SharedBatchedInferencePipeline(load_whisper_model(model_id, **kwargs))
+
+
+def load_piper_voice(model_id: str) -> PiperVoice:
+    from piper.voice import PiperConfig, PiperVoice
+
+    model_path = get_piper_voice_model_file(model_id)
+    inf_sess = InferenceSession(model_path, providers=ONNX_PROVIDERS)
+    config_path = Path(str(model_path) + ".json")
+    conf = PiperConfig.from_dict(json.loads(config_path.read_text()))
+    return PiperVoice(session=inf_sess, config=conf)
+
+
+def load_kokoro() -> Kokoro:
+    model_path = get_kokoro_model_path()
+    voices_path = model_path.parent / "voices.bin"
+    inf_sess = InferenceSession(model_path, providers=ONNX_PROVIDERS)
+    return Kokoro.from_session(inf_sess, str(voices_path))
+
+
+def load_silero_vad(config: VadConfig) -> AnyVadModel:
+    model = SileroVadModel.load(config)
+    return VadBatchScheduler(model, config.max_batch_size) if config.max_batch_size > 1 else model
+
+
+def create_model_host(
+    name: str,
+    load_fn: Callable[..., object],
+    load_args: tuple[object, ...],
+    handlers: dict[str, Callable[..., object]],
+    model_host_config: ModelHostConfig,
+) -> ModelHost:
+    return ModelHost(
+        name,
+        load_fn,
+        load_args,
+        handlers,
+        check_interval=model_host_config.heartbeat_interval,
+        hang_timeout=model_host_config.hang_timeout,
+    )
+
+
+class WhisperReplicaPool:
+    """Up to `max_replicas` instances of the same Whisper model with a first-come first-served queue of requests in front of them.
+
+    A new replica is only loaded when every existing replica is busy (and `memory_cap` allows for it). Idle replicas get unloaded once their TTL expires, so the pool shrinks back when the load goes down.
+    A replica is busy once it's leased `max_leases_per_replica` times. More than one lease per replica is only useful when the model batches concurrent requests itself (see `DynamicBatchedInferencePipeline`).
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        max_replicas: int,
+        create_replica: Callable[[], SelfDisposingModel[AnyWhisperModel]],
+        memory_cap: int | None = None,
+        residency_controller: ModelResidencyController | None = None,
+        pool_emptied_callback: Callable[[WhisperReplicaPool], None] | None = None,
+        max_leases_per_replica: int = 1,
+    ) -> None:
+        self.model_id = model_id
+        self.max_replicas = max_replicas
+        self.max_leases_per_replica = max_leases_per_replica
+        self.create_replica = create_replica
+        self.memory_cap = memory_cap
+        self.residency_controller = residency_controller
+        self.pool_emptied_callback = pool_emptied_callback
+
+        self.replicas: list[SelfDisposingModel[AnyWhisperModel]] = []
+        self.busy_replicas = Counter[SelfDisposingModel[AnyWhisperModel]]()
+        """Number of leases held on each leased replica."""
+        self.waiters: deque[Future[SelfDisposingModel[AnyWhisperModel]]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> ModelState:
+        states = {replica.state for replica in self.replicas}
+        if "loaded" in states:
+            return "loaded"
+        if "loading" in states:
+            return "loading"
+        return "unloaded"
+
+    @property
+    def loading_elapsed(self) -> float | None:
+        elapsed = [x for x in (replica.loading_elapsed for replica in self.replicas) if x is not None]
+        return max(elapsed, default=None)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.waiters)
+
+    def _can_add_replica(self) -> bool:
+        if len(self.replicas) == 0:
+            return True
+        if len(self.replicas) >= self.max_replicas:
+            return False
+        if self.memory_cap is None:
+            return True
+        replica_footprint = max(replica.memory_footprint for replica in self.replicas)
+        if self.residency_controller is not None:
+            used_memory = self.residency_controller.used_memory
+        else:
+            used_memory = sum(replica.memory_footprint for replica in self.replicas)
+        return used_memory + replica_footprint <= self.memory_cap
+
+    def _pick_replica(self) -> SelfDisposingModel[AnyWhisperModel] | None:
+        idle_replicas = [
+            replica for replica in self.replicas if self.busy_replicas[replica] < self.max_leases_per_replica
+        ]
+        # prefer replicas that don't need to be loaded
+        for replica in idle_replicas:
+            if replica.state == "loaded":
+                return replica
+        if len(idle_replicas) > 0:
+            return idle_replicas[0]
+        if self._can_add_replica():
+            replica = self.create_replica()
+            replica.model_unloaded_callback = lambda _model_id: self._handle_replica_unloaded(replica)
+            self.replicas.append(replica)
+            logger.info(f"Added replica #{len(self.replicas)} of {self.model_id}")
+            return replica
+        return None
+
+    def _dispatch(self) -> None:
+        """Hand out idle replicas to waiting requests in arrival order. Must be called while holding `self._lock`."""
+        while len(self.waiters) > 0:
+            if self.waiters[0].cancelled():
+                self.waiters.popleft()
+                continue
+            replica = self._pick_replica()
+            if replica is None:
+                return
+            waiter = self.waiters.popleft()
+            if not waiter.set_running_or_notify_cancel():
+                continue
+            self.busy_replicas[replica] += 1
+            waiter.set_result(replica)
+
+    def request_replica(self) -> Future[SelfDisposingModel[AnyWhisperModel]]:
+        waiter: Future[SelfDisposingModel[AnyWhisperModel]] = Future()
+        with self._lock:
+            self.waiters.append(waiter)
+            self._dispatch()
+        return waiter
+
+    def release_replica(self, replica: SelfDisposingModel[AnyWhisperModel]) -> None:
+        with self._lock:
+            self.busy_replicas[replica] -= 1
+            if self.busy_replicas[replica] <= 0:
+                del self.busy_replicas[replica]
+            self._dispatch()
+            is_empty = len(self.replicas) == 0 and len(self.waiters) == 0 and len(self.busy_replicas) == 0
+        if is_empty and self.pool_emptied_callback is not None:
+            self.pool_emptied_callback(self)
+
+    def _handle_replica_unloaded(self, replica: SelfDisposingModel[AnyWhisperModel]) -> None:
+        with self._lock:
+            if replica in self.replicas:
+                self.replicas.remove(replica)
+                logger.info(f"Removed a replica of {self.model_id}, {len(self.replicas)} left")
+            is_empty = len(self.replicas) == 0 and len(self.waiters) == 0 and len(self.busy_replicas) == 0
+        if is_empty and self.pool_emptied_callback is not None:
+            self.pool_emptied_callback(self)
+
+    def unload(self) -> None:
+        with self._lock:
+            if len(self.busy_replicas) > 0:
+                raise ValueError(f"Model {self.model_id} is still in use. {len(self.busy_replicas)=}")
+            replicas = list(self.replicas)
+        if len(replicas) == 0:
+            raise ValueError(f"Model {self.model_id} is not loaded.")
+        for replica in replicas:
+            replica.unload()
+
+    def lease(self) -> WhisperModelLease:
+        return WhisperModelLease(self)
+
+
+class WhisperModelLease:
+    """Context manager which waits for a free replica in the pool and holds on to it for the duration of the `with` block."""
+
+    def __init__(self, pool: WhisperReplicaPool) -> None:
+        self.pool = pool
+        self.replica: SelfDisposingModel[AnyWhisperModel] | None = None
+
+    def __enter__(self) -> AnyWhisperModel:
+        self.replica = self.pool.request_replica().result()
+        try:
+            return self.replica.__enter__()
+        except:
+            self.pool.release_replica(self.replica)
+            raise
+
+    def __exit__(self, *args) -> None:  # noqa: ANN002
+        assert self.replica is not None
+        try:
+            self.replica.__exit__(*args)
+        finally:
+            self.pool.release_replica(self.replica)
+
+    async def __aenter__(self) -> AnyWhisperModel:
+        waiter = self.pool.request_replica()
+        try:
+            self.replica = await asyncio.wrap_future(waiter)
+        except asyncio.CancelledError:
+            # the replica might've been handed out right before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.pool.release_replica(waiter.result())
+            raise
+        try:
+            return await self.replica.__aenter__()
+        except:
+            self.pool.release_replica(self.replica)
+            raise
+
+    async def __aexit__(self, *args) -> None:  # noqa: ANN002
+        assert self.replica is not None
+        try:
+            await self.replica.__aexit__(*args)
+        finally:
+            self.pool.release_replica(self.replica)
+
 
 class WhisperModelManager:
-    def __init__(self, whisper_config: WhisperConfig) -> None:
+    def __init__(
+        self,
+        whisper_config: WhisperConfig,
+        residency_controller: ModelResidencyController | None = None,
+        model_host_config: ModelHostConfig | None = None,
+        warmer: ModelWarmer | None = None,
+    ) -> None:
         self.whisper_config = whisper_config
-        self.loaded_models: OrderedDict[str, SelfDisposingModel[WhisperModel]] = OrderedDict()
+        self.residency_controller = residency_controller
+        self.model_host_config = model_host_config
+        self.warmer = warmer
+        self.reaper = model_reaper
+        self.loaded_models: OrderedDict[str, WhisperReplicaPool] = OrderedDict()
         self._lock = threading.Lock()
 
-    def _load_fn(self, model_id: str) -> WhisperModel:
-        return WhisperModel(
+    def _max_replicas(self, model_id: str) -> int:
+        return self.whisper_config.model_max_replicas.get(model_id, self.whisper_config.max_replicas)
+
+    def _cpu_threads(self, model_id: str) -> int:
+        """Number of threads each replica gets. Unless explicitly configured, the host's cores are partitioned between the replicas."""
+        max_replicas = self._max_replicas(model_id)
+        if self.whisper_config.cpu_threads > 0 or max_replicas == 1:
+            return self.whisper_config.cpu_threads
+        return max((os.cpu_count() or 1) // max_replicas, 1)
+
+    @property
+    def warm_models(self) -> dict[str, int]:
+        """Size of the files kept in the page cache for each model in the warm tier."""
+        return {} if self.warmer is None else self.warmer.list_warm_models()
+
+    def _load_fn(self, model_id: str) -> AnyWhisperModel:
+        if self.warmer is not None:
+            self.warmer.record_load(model_id)
+        kwargs = {
+            "device": self.whisper_config.inference_device,
+            "device_index": self.whisper_config.device_index,
+            "compute_type": self.whisper_config.compute_type,
+            "cpu_threads": self._cpu_threads(model_id),
+            "num_workers": self.whisper_config.num_workers,
+        }
+        if self.model_host_config is not None and self.model_host_config.isolate_models:
+            host = create_model_host(
+                model_id,
+                partial(
+                    load_batched_whisper_model if self.whisper_config.use_batched_mode else load_whisper_model,
+                    **kwargs,
+                ),
+                (model_id,),
+                WHISPER_HANDLERS,
+                self.model_host_config,
+            )
+            return WhisperModelProxy(host)
+        model = load_whisper_model(model_id, **kwargs)
+        dynamic_batching = self.whisper_config.dynamic_batching
+        if dynamic_batching.enabled:
+            scheduler = BatchScheduler(model, dynamic_batching.max_batch_size, dynamic_batching.max_wait)
+            return DynamicBatchedInferencePipeline(model, scheduler)
+        if self.whisper_config.use_batched_mode:
+            # NOTE: the pipeline is created once per replica rather than per request
+            return SharedBatchedInferencePipeline(model)
+        return model
+
+    def _max_leases_per_replica(self) -> int:
+        if self.model_host_config is not None and self.model_host_config.isolate_models:
+            return 1
+        dynamic_batching = self.whisper_config.dynamic_batching
+        return dynamic_batching.max_requests_per_replica if dynamic_batching.enabled else 1
+
+    def _create_replica(self, model_id: str) -> SelfDisposingModel[AnyWhisperModel]:
+        return SelfDisposingModel[AnyWhisperModel](
             model_id,
-            device=self.whisper_config.inference_device,
-            device_index=self.whisper_config.device_index,
-            compute_type=self.whisper_config.compute_type,
-            cpu_threads=self.whisper_config.cpu_threads,
-            num_workers=self.whisper_config.num_workers,
+            load_fn=lambda: self._load_fn(model_id),
+            ttl=self.whisper_config.ttl,
+            residency_controller=self.residency_controller,
+            reaper=self.reaper,
         )
 
-    def _handle_model_unloaded(self, model_id: str) -> None:
+    def _handle_pool_emptied(self, pool: WhisperReplicaPool) -> None:
         with self._lock:
-            if model_id in self.loaded_models:
-                del self.loaded_models[model_id]
+            if self.loaded_models.get(pool.model_id) is pool:
+                del self.loaded_models[pool.model_id]
+            loaded_model_ids = list(self.loaded_models)
+        if self.warmer is not None:
+            self.warmer.request_warm(pool.model_id)
+            for model_id in self.warmer.predict(exclude=[*loaded_model_ids, pool.model_id]):
+                self.warmer.request_warm(model_id, evict=False)
 
     def unload_model(self, model_id: str) -> None:
         with self._lock:
             model = self.loaded_models.get(model_id)
-            if model is None:
-                raise KeyError(f"Model {model_id} not found")
-            # WARN: ~300 MB of memory will still be held by the model. See https://github.com/SYSTRAN/faster-whisper/issues/992
-            self.loaded_models[model_id].unload()
+        if model is None:
+            raise KeyError(f"Model {model_id} not found")
+        # NOTE: unloading happens outside of `self._lock` since `_handle_pool_emptied` acquires it
+        # WARN: ~300 MB of memory will still be held by the model. See https://github.com/SYSTRAN/faster-whisper/issues/992
+        model.unload()
 
-    def load_model(self, model_id: str) -> SelfDisposingModel[WhisperModel]:
+    def load_model(self, model_id: str) -> WhisperModelLease:
         logger.debug(f"Loading model {model_id}")
         with self._lock:
             logger.debug("Acquired lock")
             if model_id in self.loaded_models:
                 logger.debug(f"{model_id} model already loaded")
-                return self.loaded_models[model_id]
-            self.loaded_models[model_id] = SelfDisposingModel[WhisperModel](
+                return self.loaded_models[model_id].lease()
+            self.loaded_models[model_id] = WhisperReplicaPool(
                 model_id,
-                load_fn=lambda: self._load_fn(model_id),
-                ttl=self.whisper_config.ttl,
-                model_unloaded_callback=self._handle_model_unloaded,
+                max_replicas=self._max_replicas(model_id),
+                max_leases_per_replica=self._max_leases_per_replica(),
+                create_replica=lambda: self._create_replica(model_id),
+                memory_cap=self.whisper_config.replica_memory_cap,
+                residency_controller=self.residency_controller,
+                pool_emptied_callback=self._handle_pool_emptied,
             )
-            return self.loaded_models[model_id]
-
-
-ONNX_PROVIDERS = ["CUDAExecutionProvider", "CPUExecutionProvider"]
+            return self.loaded_models[model_id].lease()
 
 
 class PiperModelManager:
-    def __init__(self, ttl: int) -> None:
+    def __init__(
+        self,
+        ttl: int,
+        residency_controller: ModelResidencyController | None = None,
+        model_host_config: ModelHostConfig | None = None,
+    ) -> None:
         self.ttl = ttl
-        self.loaded_models: OrderedDict[str, SelfDisposingModel[PiperVoice]] = OrderedDict()
+        self.residency_controller = residency_controller
+        self.model_host_config = model_host_config
+        self.loaded_models: OrderedDict[str, SelfDisposingModel[PiperVoice | PiperVoiceProxy]] = OrderedDict()
         self._lock = threading.Lock()
 
-    def _load_fn(self, model_id: str) -> PiperVoice:
-        from piper.voice import PiperConfig, PiperVoice
-
-        model_path = get_piper_voice_model_file(model_id)
-        inf_sess = InferenceSession(model_path, providers=ONNX_PROVIDERS)
-        config_path = Path(str(model_path) + ".json")
-        conf = PiperConfig.from_dict(json.loads(config_path.read_text()))
-        return PiperVoice(session=inf_sess, config=conf)
+    def _load_fn(self, model_id: str) -> PiperVoice | PiperVoiceProxy:
+        if self.model_host_config is not None and self.model_host_config.isolate_models:
+            host = create_model_host(model_id, load_piper_voice, (model_id,), PIPER_HANDLERS, self.model_host_config)
+            return PiperVoiceProxy(host)
+        return load_piper_voice(model_id)
 
     def _handle_model_unloaded(self, model_id: str) -> None:
         with self._lock:
@@ -177,38 +893,46 @@ class PiperModelManager:
     def unload_model(self, model_id: str) -> None:
         with self._lock:
             model = self.loaded_models.get(model_id)
-            if model is None:
-                raise KeyError(f"Model {model_id} not found")
-            self.loaded_models[model_id].unload()
+        if model is None:
+            raise KeyError(f"Model {model_id} not found")
+        model.unload()
 
-    def load_model(self, model_id: str) -> SelfDisposingModel[PiperVoice]:
+    def load_model(self, model_id: str) -> SelfDisposingModel[PiperVoice | PiperVoiceProxy]:
         from piper.voice import PiperVoice
 
         with self._lock:
             if model_id in self.loaded_models:
                 logger.debug(f"{model_id} model already loaded")
                 return self.loaded_models[model_id]
-            self.loaded_models[model_id] = SelfDisposingModel[PiperVoice](
+            self.loaded_models[model_id] = SelfDisposingModel[PiperVoice | PiperVoiceProxy](
                 model_id,
                 load_fn=lambda: self._load_fn(model_id),
                 ttl=self.ttl,
                 model_unloaded_callback=self._handle_model_unloaded,
+                residency_controller=self.residency_controller,
             )
             return self.loaded_models[model_id]
 
 
 class KokoroModelManager:
-    def __init__(self, ttl: int) -> None:
+    def __init__(
+        self,
+        ttl: int,
+        residency_controller: ModelResidencyController | None = None,
+        model_host_config: ModelHostConfig | None = None,
+    ) -> None:
         self.ttl = ttl
-        self.loaded_models: OrderedDict[str, SelfDisposingModel[Kokoro]] = OrderedDict()
+        self.residency_controller = residency_controller
+        self.model_host_config = model_host_config
+        self.loaded_models: OrderedDict[str, SelfDisposingModel[Kokoro | KokoroProxy]] = OrderedDict()
         self._lock = threading.Lock()
 
     # TODO
-    def _load_fn(self, _model_id: str) -> Kokoro:
-        model_path = get_kokoro_model_path()
-        voices_path = model_path.parent / "voices.bin"
-        inf_sess = InferenceSession(model_path, providers=ONNX_PROVIDERS)
-        return Kokoro.from_session(inf_sess, str(voices_path))
+    def _load_fn(self, model_id: str) -> Kokoro | KokoroProxy:
+        if self.model_host_config is not None and self.model_host_config.isolate_models:
+            host = create_model_host(model_id, load_kokoro, (), KOKORO_HANDLERS, self.model_host_config)
+            return KokoroProxy(host)
+        return load_kokoro()
 
     def _handle_model_unloaded(self, model_id: str) -> None:
         with self._lock:
@@ -218,19 +942,46 @@ class KokoroModelManager:
     def unload_model(self, model_id: str) -> None:
         with self._lock:
             model = self.loaded_models.get(model_id)
-            if model is None:
-                raise KeyError(f"Model {model_id} not found")
-            self.loaded_models[model_id].unload()
+        if model is None:
+            raise KeyError(f"Model {model_id} not found")
+        model.unload()
 
-    def load_model(self, model_id: str) -> SelfDisposingModel[Kokoro]:
+    def load_model(self, model_id: str) -> SelfDisposingModel[Kokoro | KokoroProxy]:
         with self._lock:
             if model_id in self.loaded_models:
                 logger.debug(f"{model_id} model already loaded")
                 return self.loaded_models[model_id]
-            self.loaded_models[model_id] = SelfDisposingModel[Kokoro](
+            self.loaded_models[model_id] = SelfDisposingModel[Kokoro | KokoroProxy](
                 model_id,
                 load_fn=lambda: self._load_fn(model_id),
                 ttl=self.ttl,
                 model_unloaded_callback=self._handle_model_unloaded,
+                residency_controller=self.residency_controller,
             )
             return self.loaded_models[model_id]
+
+
+class VadModelManager:
+    """Manages the Silero VAD model (`speaches.vad.MODEL_ID`), which is the only VAD model and is shared by every request.
+
+    The model always gets loaded in this process, even when `model_host.isolate_models` is enabled, since it only takes up a few megabytes.
+    """
+
+    def __init__(self, config: VadConfig, residency_controller: ModelResidencyController | None = None) -> None:
+        self.config = config
+        self.model = SelfDisposingModel[AnyVadModel](
+            vad.MODEL_ID,
+            load_fn=lambda: load_silero_vad(config),
+            ttl=config.ttl,
+            residency_controller=residency_controller,
+        )
+
+    def unload_model(self) -> None:
+        self.model.unload()
+
+    def load_model(self) -> SelfDisposingModel[AnyVadModel]:
+        return self.model
+
+    def speech_probabilities(self, audio: NDArray[np.float32]) -> NDArray[np.float32]:
+        with self.model as model:
+            return model.speech_probabilities(audio)
@@ -18,6 +18,8 @@ if TYPE_CHECKING:
 
     from piper.voice import PiperVoice
 
+    from speaches.model_host import PiperVoiceProxy
+
 MODEL_ID = "rhasspy/piper-voices"
 PiperVoiceQuality = Literal["x_low", "low", "medium", "high"]
 PIPER_VOICE_QUALITY_SAMPLE_RATE_MAP: dict[PiperVoiceQuality, int] = {
@@ -87,7 +89,7 @@ def read_piper_voice_config(voice: str) -> PiperVoiceConfig:
 
 # TODO: async generator https://github.com/mikeshardmind/async-utils/blob/354b93a276572aa54c04212ceca5ac38fedf34ab/src/async_utils/gen_transform.py#L147
 def generate_audio(
-    piper_tts: PiperVoice, text: str, *, speed: float = 1.0, sample_rate: int | None = None
+    piper_tts: PiperVoice | PiperVoiceProxy, text: str, *, speed: float = 1.0, sample_rate: int | None = None
 ) -> Generator[bytes, None, None]:
     if sample_rate is None:
         sample_rate = piper_tts.config.sample_rate
@@ -0,0 +1,134 @@
+"""Load models when the server starts rather than when they're first requested."""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from pathlib import Path
+import threading
+import time
+from typing import TYPE_CHECKING, Literal
+
+from faster_whisper.audio import decode_audio
+import numpy as np
+
+from speaches import kokoro_utils, piper_utils, vad
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Iterable
+
+    from numpy.typing import NDArray
+
+    from speaches.inference_host import RemoteKokoroModelManager, RemotePiperModelManager, RemoteWhisperModelManager
+    from speaches.model_manager import KokoroModelManager, PiperModelManager, VadModelManager, WhisperModelManager
+
+logger = logging.getLogger(__name__)
+
+type PreloadKind = Literal["whisper", "piper", "kokoro", "vad"]
+
+SAMPLE_RATE = 16000
+WARMUP_AUDIO_PATH = Path("audio.wav")
+WARMUP_TEXT = "Hello world."
+
+
+def parse_preload_model_id(model_id: str) -> tuple[PreloadKind, str]:
+    """Split a `preload_models` entry into its kind and the ID that kind's model manager expects. Voices are written as `{model_id}/{voice}`."""
+    if model_id == vad.MODEL_ID:
+        return "vad", model_id
+    if model_id.startswith(f"{kokoro_utils.MODEL_ID}/"):
+        return "kokoro", model_id.removeprefix(f"{kokoro_utils.MODEL_ID}/")
+    if model_id.startswith(f"{piper_utils.MODEL_ID}/"):
+        return "piper", model_id.removeprefix(f"{piper_utils.MODEL_ID}/")
+    return "whisper", model_id
+
+
+def load_warmup_audio() -> NDArray[np.float32]:
+    """First second of `audio.wav` (shipped with the repository and the Docker image) or one second of silence if it isn't available."""
+    if WARMUP_AUDIO_PATH.exists():
+        return decode_audio(str(WARMUP_AUDIO_PATH), sampling_rate=SAMPLE_RATE)[:SAMPLE_RATE]  # pyright: ignore[reportReturnType]
+    return np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+
+async def _drain(audio_generator: AsyncGenerator[bytes, None]) -> None:
+    async for _ in audio_generator:
+        pass
+
+
+class ModelPreloader:
+    """Loads `model_ids` in parallel and runs a short inference with each of them.
+
+    The warmup inference takes care of the work that happens lazily on the first inference (e.g. CUDA kernel selection, ONNX Runtime graph optimizations). `ready` gets set once every model has been warmed up, whether or not it succeeded.
+    """
+
+    def __init__(
+        self,
+        model_ids: Iterable[str],
+        model_manager: WhisperModelManager | RemoteWhisperModelManager,
+        piper_model_manager: PiperModelManager | RemotePiperModelManager,
+        kokoro_model_manager: KokoroModelManager | RemoteKokoroModelManager,
+        vad_model_manager: VadModelManager | None = None,
+    ) -> None:
+        self.model_ids = list(model_ids)
+        self.model_manager = model_manager
+        self.piper_model_manager = piper_model_manager
+        self.kokoro_model_manager = kokoro_model_manager
+        self.vad_model_manager = vad_model_manager
+        """`None` when the VAD model is loaded elsewhere (by the inference host), in which case preloading it is skipped."""
+        self.ready = threading.Event()
+        self.timings: dict[str, tuple[float, float]] = {}
+        """`(load time, warmup time)` in seconds of each successfully preloaded model."""
+        self.failures: dict[str, str] = {}
+        self.started = False
+
+    def start(self) -> None:
+        """Run `run` in the background. Only the first call does anything, since the preloader is shared by every app (see `speaches.main.lifespan`)."""
+        if self.started:
+            return
+        self.started = True
+        threading.Thread(target=self.run, name="model-preloader", daemon=True).start()
+
+    def run(self) -> None:
+        if len(self.model_ids) == 0:
+            self.ready.set()
+            return
+        start = time.perf_counter()
+        warmup_audio = load_warmup_audio()
+        with ThreadPoolExecutor(max_workers=len(self.model_ids), thread_name_prefix="model-preloader") as executor:
+            for model_id in self.model_ids:
+                executor.submit(self._preload, model_id, warmup_audio)
+        logger.info(f"Preloaded {len(self.timings)}/{len(self.model_ids)} models in {time.perf_counter() - start:.2f}s")
+        self.ready.set()
+
+    def _preload(self, model_id: str, warmup_audio: NDArray[np.float32]) -> None:
+        kind, id_ = parse_preload_model_id(model_id)
+        try:
+            start = time.perf_counter()
+            match kind:
+                case "whisper":
+                    with self.model_manager.load_model(id_) as whisper:
+                        loaded = time.perf_counter()
+                        segments, _ = whisper.transcribe(warmup_audio)
+                        list(segments)
+                case "piper":
+                    with self.piper_model_manager.load_model(id_) as piper_tts:
+                        loaded = time.perf_counter()
+                        list(piper_tts.synthesize_stream_raw(WARMUP_TEXT))
+                case "kokoro":
+                    with self.kokoro_model_manager.load_model(id_) as tts:
+                        loaded = time.perf_counter()
+                        asyncio.run(_drain(kokoro_utils.generate_audio(tts, WARMUP_TEXT, id_)))
+                case "vad":
+                    if self.vad_model_manager is None:
+                        logger.info(f"Not preloading {model_id} since it's loaded by the inference host")
+                        return
+                    with self.vad_model_manager.load_model() as vad_model:
+                        loaded = time.perf_counter()
+                        vad_model.speech_probabilities(warmup_audio)
+        except Exception as e:
+            logger.exception(f"Failed to preload {model_id}")
+            self.failures[model_id] = str(e)
+            return
+        warmed_up = time.perf_counter()
+        self.timings[model_id] = (loaded - start, warmed_up - loaded)
+        logger.info(f"Preloaded {model_id}: loaded in {loaded - start:.2f}s, warmed up in {warmed_up - loaded:.2f}s")
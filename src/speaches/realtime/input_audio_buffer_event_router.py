@@ -3,13 +3,13 @@ from io import BytesIO
 import logging
 from typing import Literal
 
-from faster_whisper.transcribe import get_speech_timestamps
 from faster_whisper.vad import VadOptions
 import numpy as np
 from numpy.typing import NDArray
 from openai.types.beta.realtime.error_event import Error
 
 from speaches.audio import audio_samples_from_file
+from speaches.dependencies import get_speech_probabilities
 from speaches.realtime.context import SessionContext
 from speaches.realtime.event_router import EventRouter
 from speaches.realtime.input_audio_buffer import (
@@ -29,6 +29,7 @@ from speaches.types.realtime import (
     TurnDetection,
     create_invalid_request_error,
 )
+from speaches.vad import speech_timestamps
 
 MIN_AUDIO_BUFFER_DURATION_MS = 100  # based on the OpenAI's API response
 
@@ -53,11 +54,11 @@ def resample_audio_data(data: NDArray[np.float32], sample_rate: int, target_samp
 
 
 # TODO: also found in src/speaches/routers/vad.py. Remove duplication
-def to_ms_speech_timestamps(speech_timestamps: list[SpeechTimestamp]) -> list[SpeechTimestamp]:
-    for i in range(len(speech_timestamps)):
-        speech_timestamps[i]["start"] = speech_timestamps[i]["start"] // MS_SAMPLE_RATE
-        speech_timestamps[i]["end"] = speech_timestamps[i]["end"] // MS_SAMPLE_RATE
-    return speech_timestamps
+def to_ms_speech_timestamps(speech_timestamps: list[dict[str, int]]) -> list[SpeechTimestamp]:
+    return [
+        {"start": speech["start"] // MS_SAMPLE_RATE, "end": speech["end"] // MS_SAMPLE_RATE}
+        for speech in speech_timestamps
+    ]
 
 
 def vad_detection_flow(
@@ -65,20 +66,23 @@ def vad_detection_flow(
 ) -> InputAudioBufferSpeechStartedEvent | InputAudioBufferSpeechStoppedEvent | None:
     audio_window = input_audio_buffer.data[-MAX_VAD_WINDOW_SIZE_SAMPLES:]
 
-    speech_timestamps = to_ms_speech_timestamps(
-        get_speech_timestamps(
-            audio_window,
-            vad_options=VadOptions(
+    # NOTE: not cached since the window is different every time
+    probabilities = get_speech_probabilities()(audio_window)
+    window_speech_timestamps = to_ms_speech_timestamps(
+        speech_timestamps(
+            probabilities,
+            len(audio_window),
+            VadOptions(
                 threshold=turn_detection.threshold,
                 min_silence_duration_ms=turn_detection.silence_duration_ms,
                 speech_pad_ms=turn_detection.prefix_padding_ms,
             ),
         )
     )
-    if len(speech_timestamps) > 1:
-        logger.warning(f"More than one speech timestamp: {speech_timestamps}")
+    if len(window_speech_timestamps) > 1:
+        logger.warning(f"More than one speech timestamp: {window_speech_timestamps}")
 
-    speech_timestamp = speech_timestamps[-1] if len(speech_timestamps) > 0 else None
+    speech_timestamp = window_speech_timestamps[-1] if len(window_speech_timestamps) > 0 else None
 
     # logger.debug(f"Speech timestamps: {speech_timestamps}")
     if input_audio_buffer.vad_state.audio_start_ms is None:
@@ -1,22 +1,201 @@
+import asyncio
+from typing import Literal
+
 from fastapi import (
     APIRouter,
     Response,
 )
+from fastapi.responses import JSONResponse
 import huggingface_hub
 from huggingface_hub.hf_api import RepositoryNotFoundError
+from pydantic import BaseModel
 
 from speaches import hf_utils
-from speaches.dependencies import ModelManagerDependency
+from speaches.admission import AdmissionController
+from speaches.dependencies import (
+    AdmissionControllerDependency,
+    ModelManagerDependency,
+    ModelPreloaderDependency,
+    TranscriptionCacheDependency,
+)
+from speaches.inference_host import RemoteWhisperModelManager
 from speaches.model_aliases import ModelId
+from speaches.preload import ModelPreloader
+from speaches.realtime.session import active_session_ids
 
 router = APIRouter()
 
 
+class RunningModel(BaseModel):
+    id: str
+    state: Literal["loading", "loaded"]
+    loading_elapsed: float | None = None
+    """Seconds since the model started loading. Only set while the model is loading."""
+    replicas: int = 1
+    """Number of instances of the model that are loaded or loading."""
+
+
+class ModelUnloadCounters(BaseModel):
+    scheduled: int
+    """Number of times an idle model was scheduled to be unloaded after its TTL."""
+    cancelled: int
+    """Number of scheduled unloads that were cancelled because the model got used (or unloaded) before its TTL expired."""
+    executed: int
+    """Number of models unloaded because their TTL expired."""
+
+
+class WarmModel(BaseModel):
+    id: str
+    size: int
+    """Bytes of model files kept in the OS page cache."""
+
+
+class ModelQueue(BaseModel):
+    id: str
+    active: int
+    """Number of requests being processed."""
+    queued: int
+    """Number of requests waiting for their turn."""
+    max_concurrency: int
+    average_wait: float
+    """Average time in seconds that admitted requests spent in the queue."""
+    admitted: int
+    rejected: int
+    """Number of requests rejected because the queue was full."""
+    timed_out: int
+    """Number of requests rejected because they waited for longer than `admission.max_queue_wait`."""
+
+
+class ListRunningModelsResponse(BaseModel):
+    models: list[str]
+    """IDs of the loaded and loading ("hot") models."""
+    running_models: list[RunningModel]
+    """State of each model in `models`."""
+    warm_models: list[WarmModel]
+    """Models that aren't loaded but whose files are kept in the OS page cache for faster reloads."""
+    unloads: ModelUnloadCounters
+    queues: list[ModelQueue]
+    """Admission queues of the models that received requests. Empty unless `admission.max_concurrent_requests` is set."""
+
+
+class LoadReport(BaseModel):
+    status: Literal["warming_up", "overloaded", "ready"]
+    """`warming_up` until every model in `preload_models` has been loaded and warmed up. `overloaded` while a model's admission queue is full."""
+    load_score: float
+    """Amount of outstanding work on this node: requests being processed, queued requests and connected realtime sessions. Meant to be compared across nodes, lower is less loaded."""
+    loaded_models: list[str]
+    warm_models: list[str]
+    """Models that aren't loaded but whose files are kept in the OS page cache."""
+    in_flight: dict[str, int]
+    """Number of transcription and translation requests being processed per model."""
+    queued: dict[str, int]
+    """Number of requests waiting in the admission queue per model."""
+    realtime_sessions: int
+
+
+class TranscriptionCacheStats(BaseModel):
+    enabled: bool
+    entries: int
+    """Number of results kept in memory."""
+    hits: int
+    """Requests served from the cache, including `disk_hits`."""
+    disk_hits: int
+    misses: int
+    coalesced: int
+    """Requests which waited for an identical request being processed instead of running the model themselves."""
+    in_flight: int
+
+
+class ModelTierResponse(BaseModel):
+    id: str
+    tier: Literal["hot", "warm", "cold"]
+
+
 @router.get("/health", tags=["diagnostic"])
 def health() -> Response:
     return Response(status_code=200, content="OK")
 
 
+def get_load_status(
+    model_preloader: ModelPreloader, admission_controller: AdmissionController
+) -> Literal["warming_up", "overloaded", "ready"]:
+    if not model_preloader.ready.is_set():
+        return "warming_up"
+    if admission_controller.is_saturated():
+        return "overloaded"
+    return "ready"
+
+
+def compute_load_score(admission_controller: AdmissionController) -> float:
+    # NOTE: copying the items first because this may run in a worker thread while the event loop updates them
+    in_flight = sum(count for _, count in list(admission_controller.in_flight.items()))
+    queued = sum(queue.queue_depth for _, queue in list(admission_controller.queues.items()))
+    return float(in_flight + queued + len(active_session_ids))
+
+
+@router.get("/health/ready", tags=["diagnostic"])
+async def readiness(
+    model_preloader: ModelPreloaderDependency, admission_controller: AdmissionControllerDependency
+) -> Response:
+    match get_load_status(model_preloader, admission_controller):
+        case "warming_up":
+            return Response(status_code=503, content="Warming up")
+        case "overloaded":
+            return Response(status_code=503, content="Overloaded")
+        case "ready":
+            return Response(status_code=200, content="OK")
+
+
+@router.get(
+    "/health/load",
+    tags=["diagnostic"],
+    summary="Get the load score of this node as plain text. Meant to be polled by load balancers doing weighted least-loaded routing.",
+)
+async def load(
+    model_preloader: ModelPreloaderDependency, admission_controller: AdmissionControllerDependency
+) -> Response:
+    status = get_load_status(model_preloader, admission_controller)
+    return Response(
+        status_code=200 if status == "ready" else 503,
+        content=f"{compute_load_score(admission_controller):g}",
+        headers={"X-Load-Status": status},
+    )
+
+
+@router.get("/health/load-report", tags=["diagnostic"], response_model=LoadReport)
+def load_report(
+    model_manager: ModelManagerDependency,
+    model_preloader: ModelPreloaderDependency,
+    admission_controller: AdmissionControllerDependency,
+) -> JSONResponse:
+    status = get_load_status(model_preloader, admission_controller)
+    report = LoadReport(
+        status=status,
+        load_score=compute_load_score(admission_controller),
+        loaded_models=[
+            model_id for model_id, model in list(model_manager.loaded_models.items()) if model.state == "loaded"
+        ],
+        warm_models=list(model_manager.warm_models),
+        in_flight=dict(list(admission_controller.in_flight.items())),
+        queued={model_id: queue.queue_depth for model_id, queue in list(admission_controller.queues.items())},
+        realtime_sessions=len(active_session_ids),
+    )
+    return JSONResponse(status_code=200 if status == "ready" else 503, content=report.model_dump())
+
+
+@router.get("/api/transcription-cache", tags=["experimental"], summary="Get the transcription cache's counters.")
+def get_transcription_cache_stats(transcription_cache: TranscriptionCacheDependency) -> TranscriptionCacheStats:
+    return TranscriptionCacheStats(
+        enabled=transcription_cache.enabled,
+        entries=len(transcription_cache.entries),
+        hits=transcription_cache.hits,
+        disk_hits=transcription_cache.disk_hits,
+        misses=transcription_cache.misses,
+        coalesced=transcription_cache.coalesced,
+        in_flight=len(transcription_cache.in_flight),
+    )
+
+
 @router.post(
     "/api/pull/{model_id:path}",
     tags=["experimental"],
@@ -32,19 +211,68 @@ def pull_model(model_id: ModelId) -> Response:
     return Response(status_code=201, content=f"Model {model_id} downloaded")
 
 
-@router.get("/api/ps", tags=["experimental"], summary="Get a list of loaded models.")
+@router.get("/api/ps", tags=["experimental"], summary="Get a list of loaded and loading models.")
 def get_running_models(
     model_manager: ModelManagerDependency,
-) -> dict[str, list[str]]:
-    return {"models": list(model_manager.loaded_models.keys())}
+    admission_controller: AdmissionControllerDependency,
+) -> ListRunningModelsResponse:
+    running_models: list[RunningModel] = []
+    reaper = model_manager.reaper
+    for model_id, model in list(model_manager.loaded_models.items()):
+        match model.state:
+            case "loading":
+                running_models.append(
+                    RunningModel(
+                        id=model_id,
+                        state="loading",
+                        loading_elapsed=model.loading_elapsed,
+                        replicas=len(model.replicas),
+                    )
+                )
+            case "loaded":
+                running_models.append(RunningModel(id=model_id, state="loaded", replicas=len(model.replicas)))
+            case "unloaded":
+                # requested but neither loading nor loaded yet
+                pass
+    return ListRunningModelsResponse(
+        models=[model.id for model in running_models],
+        running_models=running_models,
+        warm_models=[WarmModel(id=model_id, size=size) for model_id, size in model_manager.warm_models.items()],
+        unloads=ModelUnloadCounters(scheduled=reaper.scheduled, cancelled=reaper.cancelled, executed=reaper.executed),
+        queues=[
+            ModelQueue(
+                id=model_id,
+                active=queue.active,
+                queued=queue.queue_depth,
+                max_concurrency=queue.max_concurrency,
+                average_wait=queue.average_wait,
+                admitted=queue.admitted,
+                rejected=queue.rejected,
+                timed_out=queue.timed_out,
+            )
+            for model_id, queue in list(admission_controller.queues.items())
+        ],
+    )
+
+
+@router.get("/api/ps/{model_id:path}", tags=["experimental"], summary="Get the residency tier of a model.")
+def get_model_tier(model_manager: ModelManagerDependency, model_id: str) -> ModelTierResponse:
+    if model_id in model_manager.loaded_models:
+        return ModelTierResponse(id=model_id, tier="hot")
+    if model_id in model_manager.warm_models:
+        return ModelTierResponse(id=model_id, tier="warm")
+    return ModelTierResponse(id=model_id, tier="cold")
 
 
 @router.post("/api/ps/{model_id:path}", tags=["experimental"], summary="Load a model into memory.")
-def load_model_route(model_manager: ModelManagerDependency, model_id: ModelId) -> Response:
+async def load_model_route(model_manager: ModelManagerDependency, model_id: ModelId) -> Response:
     if model_id in model_manager.loaded_models:
         return Response(status_code=409, content="Model already loaded")
-    with model_manager.load_model(model_id):
-        pass
+    if isinstance(model_manager, RemoteWhisperModelManager):
+        await asyncio.to_thread(model_manager.preload_model, model_id)
+    else:
+        async with model_manager.load_model(model_id):
+            pass
     return Response(status_code=201)
 
 
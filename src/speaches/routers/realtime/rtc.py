@@ -32,7 +32,7 @@ from speaches.realtime.input_audio_buffer_event_router import (
 )
 from speaches.realtime.response_event_router import event_router as response_event_router
 from speaches.realtime.rtc.audio_stream_track import AudioStreamTrack
-from speaches.realtime.session import create_session_object_configuration
+from speaches.realtime.session import active_session_ids, create_session_object_configuration
 from speaches.realtime.session_event_router import event_router as session_event_router
 from speaches.routers.realtime.ws import event_listener
 from speaches.types.realtime import (
@@ -145,10 +145,11 @@ def datachannel_handler(ctx: SessionContext, channel: RTCDataChannel) -> None:
     channel.on("message")(lambda message: message_handler(ctx, message))
 
 
-def iceconnectionstatechange_handler(_ctx: SessionContext, pc: RTCPeerConnection) -> None:
+def iceconnectionstatechange_handler(ctx: SessionContext, pc: RTCPeerConnection) -> None:
     logger.info(f"ICE connection state changed to {pc.iceConnectionState}")
     if pc.iceConnectionState in ["failed", "closed"]:
         logger.info("Peer connection closed")
+        active_session_ids.discard(ctx.session.id)
 
 
 def track_handler(ctx: SessionContext, track: RemoteStreamTrack) -> None:
@@ -234,5 +235,6 @@ async def realtime_webrtc(
     logger.info(f"Setting local description took {time.perf_counter() - start:.3f} seconds")
 
     rtc_session_tasks[ctx.session.id].add(asyncio.create_task(event_listener(ctx)))
+    active_session_ids.add(ctx.session.id)
 
     return Response(content=pc.localDescription.sdp, media_type="text/plain charset=utf-8")
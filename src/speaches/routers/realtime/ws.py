@@ -19,7 +19,11 @@ from speaches.realtime.input_audio_buffer_event_router import (
 )
 from speaches.realtime.message_manager import WsServerMessageManager
 from speaches.realtime.response_event_router import event_router as response_event_router
-from speaches.realtime.session import OPENAI_REALTIME_SESSION_DURATION_SECONDS, create_session_object_configuration
+from speaches.realtime.session import (
+    OPENAI_REALTIME_SESSION_DURATION_SECONDS,
+    active_session_ids,
+    create_session_object_configuration,
+)
 from speaches.realtime.session_event_router import event_router as session_event_router
 from speaches.realtime.utils import task_done_callback
 from speaches.types.realtime import SessionCreatedEvent
@@ -71,14 +75,18 @@ async def realtime(
         session=create_session_object_configuration(model),
     )
     message_manager = WsServerMessageManager(ctx.pubsub)
-    async with asyncio.TaskGroup() as tg:
-        event_listener_task = tg.create_task(event_listener(ctx), name="event_listener")
-        async with asyncio.timeout(OPENAI_REALTIME_SESSION_DURATION_SECONDS):
-            mm_task = asyncio.create_task(message_manager.run(ws))
-            # HACK: a tiny delay to ensure the message_manager.run() task is started. Otherwise, the `SessionCreatedEvent` will not be sent, as it's published before the `sender` task subscribes to the pubsub.
-            await asyncio.sleep(0.001)
-            ctx.pubsub.publish_nowait(SessionCreatedEvent(session=ctx.session))
-            await mm_task
-        event_listener_task.cancel()
+    active_session_ids.add(ctx.session.id)
+    try:
+        async with asyncio.TaskGroup() as tg:
+            event_listener_task = tg.create_task(event_listener(ctx), name="event_listener")
+            async with asyncio.timeout(OPENAI_REALTIME_SESSION_DURATION_SECONDS):
+                mm_task = asyncio.create_task(message_manager.run(ws))
+                # HACK: a tiny delay to ensure the message_manager.run() task is started. Otherwise, the `SessionCreatedEvent` will not be sent, as it's published before the `sender` task subscribes to the pubsub.
+                await asyncio.sleep(0.001)
+                ctx.pubsub.publish_nowait(SessionCreatedEvent(session=ctx.session))
+                await mm_task
+            event_listener_task.cancel()
+    finally:
+        active_session_ids.discard(ctx.session.id)
 
     logger.info(f"Finished handling '{ctx.session.id}' session")
@@ -109,7 +109,7 @@ async def synthesize(
 ) -> StreamingResponse:
     if body.model == kokoro_utils.MODEL_ID:
         # TODO: download the `voices.bin` file
-        with kokoro_model_manager.load_model(body.voice) as tts:
+        async with kokoro_model_manager.load_model(body.voice) as tts:
             audio_generator = kokoro_utils.generate_audio(
                 tts,
                 body.input,
@@ -127,7 +127,7 @@ async def synthesize(
                 )
             return StreamingResponse(audio_generator, media_type=f"audio/{body.response_format}")
     elif body.model == piper_utils.MODEL_ID:
-        with piper_model_manager.load_model(body.voice) as piper_tts:
+        async with piper_model_manager.load_model(body.voice) as piper_tts:
             # TODO: async generator
             audio_generator = piper_utils.generate_audio(
                 piper_tts, body.input, speed=body.speed, sample_rate=body.sample_rate
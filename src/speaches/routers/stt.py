@@ -1,16 +1,25 @@
-import asyncio
-from collections.abc import Generator, Iterable
+from collections.abc import Generator, Iterable, Iterator
+from concurrent.futures import Executor
+from contextlib import ExitStack
+from dataclasses import dataclass, replace
 import logging
 from typing import Annotated, Literal
 
+import av.error
 from fastapi import (
     APIRouter,
     Form,
+    HTTPException,
+    Query,
     Request,
     Response,
 )
 from fastapi.responses import StreamingResponse
-from faster_whisper.transcribe import BatchedInferencePipeline, TranscriptionInfo
+from faster_whisper import WhisperModel
+from faster_whisper.transcribe import TranscriptionInfo
+from faster_whisper.vad import VadOptions
+import numpy as np
+from numpy.typing import NDArray
 
 from speaches.api_types import (
     DEFAULT_TIMESTAMP_GRANULARITIES,
@@ -18,24 +27,54 @@ from speaches.api_types import (
     CreateTranscriptionResponseJson,
     CreateTranscriptionResponseVerboseJson,
     TimestampGranularities,
-    TranscriptionSegment,
 )
-from speaches.dependencies import AudioFileDependency, ConfigDependency, ModelManagerDependency
+from speaches.audio import SpilledAudio, decode_audio_incrementally
+from speaches.chunked_transcription import ChunkedTranscription, split_at_silences
+from speaches.config import SAMPLES_PER_SECOND, Config
+from speaches.dependencies import (
+    ConfigDependency,
+    ExecutorsDependency,
+    ModelManagerDependency,
+    SpeechProbabilityCacheDependency,
+    TranscriptionAudioDependency,
+    TranscriptionCacheDependency,
+    WhisperAdmissionDependency,
+    WhisperUploadStreamAdmissionDependency,
+    hold_admission_slot,
+)
+from speaches.executors import WorkloadExecutors, iterate_in_executor, run_in_executor
+from speaches.inference_host import RemoteWhisperModelManager
 from speaches.model_aliases import ModelId
+from speaches.model_manager import WhisperModelManager
+from speaches.segments import (
+    Segment,
+    segment_to_verbose_json,
+    segments_to_json,
+    segments_to_subtitles,
+    segments_to_verbose_json,
+)
+from speaches.streaming_upload import UploadStreamingResponse, feed_upload
 from speaches.text_utils import segments_to_srt, segments_to_text, segments_to_vtt
+from speaches.transcription_cache import TranscriptionCache, audio_digest
+from speaches.vad import BATCHED_CHUNK_SECONDS, SpeechProbabilityCache, batched_vad_options, transcribe_speech
+from speaches.windowed_transcription import WINDOW_SECONDS, TranscribeWindow, WindowedTranscription
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["automatic-speech-recognition"])
 
 type ResponseFormat = Literal["text", "json", "verbose_json", "srt", "vtt"]
+# https://platform.openai.com/docs/api-reference/audio/createTranscription#audio-createtranscription-chunking_strategy
+# NOTE: only "auto" is supported, not the `server_vad` object
+type ChunkingStrategy = Literal["auto"]
 
 # https://platform.openai.com/docs/api-reference/audio/createTranscription#audio-createtranscription-response_format
 DEFAULT_RESPONSE_FORMAT: ResponseFormat = "json"
+UNKNOWN_LANGUAGE = "unknown"
 
 
 def segments_to_response(
-    segments: Iterable[TranscriptionSegment],
+    segments: Iterable[Segment],
     transcription_info: TranscriptionInfo,
     response_format: ResponseFormat,
 ) -> Response:
@@ -44,86 +83,331 @@ def segments_to_response(
         case "text":
             return Response(segments_to_text(segments), media_type="text/plain")
         case "json":
-            return Response(
-                CreateTranscriptionResponseJson.from_segments(segments).model_dump_json(),
-                media_type="application/json",
-            )
+            return Response(segments_to_json(segments), media_type="application/json")
         case "verbose_json":
-            return Response(
-                CreateTranscriptionResponseVerboseJson.from_segments(segments, transcription_info).model_dump_json(),
-                media_type="application/json",
-            )
+            return Response(segments_to_verbose_json(segments, transcription_info), media_type="application/json")
         case "vtt":
-            return Response(
-                "".join(segments_to_vtt(segment, i) for i, segment in enumerate(segments)), media_type="text/vtt"
-            )
+            return Response(segments_to_subtitles(segments, "vtt"), media_type="text/vtt")
         case "srt":
-            return Response(
-                "".join(segments_to_srt(segment, i) for i, segment in enumerate(segments)), media_type="text/plain"
-            )
+            return Response(segments_to_subtitles(segments, "srt"), media_type="text/plain")
+
+
+def create_response(
+    segments: Iterable[Segment],
+    transcription_info: TranscriptionInfo,
+    response_format: ResponseFormat,
+    executor: Executor,
+    *,
+    stream: bool,
+) -> Response | StreamingResponse:
+    if stream:
+        return segments_to_streaming_response(segments, transcription_info, response_format, executor)
+    return segments_to_response(segments, transcription_info, response_format)
+
+
+def cache_params(
+    config: Config, params: dict[str, object], chunking_strategy: ChunkingStrategy | None = None
+) -> dict[str, object]:
+    """Everything besides the audio and the model which affects the transcription."""
+    cache_key_params = {
+        **params,
+        "batched": config.whisper.use_batched_mode or config.whisper.dynamic_batching.enabled,
+        "batch_size": config.whisper.batch_size,
+    }
+    if chunking_strategy is not None:
+        cache_key_params["chunking_strategy"] = chunking_strategy
+    return cache_key_params
+
+
+def decoding_profile_params(config: Config, decoding_profile: str | None) -> dict[str, object]:
+    """The `transcribe` options of the requested decoding profile, or of `whisper.default_decoding_profile` if none was requested."""
+    name = decoding_profile if decoding_profile is not None else config.whisper.default_decoding_profile
+    if name is None:
+        return {}
+    profile = config.whisper.decoding_profiles.get(name)
+    if profile is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown decoding profile '{name}'. Available profiles: {', '.join(config.whisper.decoding_profiles)}.",
+        )
+    return profile.model_dump(exclude_unset=True)
+
+
+def batched_mode_kwargs(whisper: object, config: Config) -> dict[str, int]:
+    """Batched pipelines (and proxies, which may be backed by one) are created by the model manager, this only applies the batch size."""
+    return {} if isinstance(whisper, WhisperModel) else {"batch_size": config.whisper.batch_size}
 
 
 def format_as_sse(data: str) -> str:
     return f"data: {data}\n\n"
 
 
+def segments_to_sse_events(
+    segments: Iterable[Segment],
+    transcription_info: TranscriptionInfo,
+    response_format: ResponseFormat,
+) -> Generator[str, None, None]:
+    for i, segment in enumerate(segments):
+        if response_format == "text":
+            data = segment.text
+        elif response_format == "json":
+            data = segments_to_json([segment])
+        elif response_format == "verbose_json":
+            data = segment_to_verbose_json(segment, transcription_info)
+        elif response_format == "vtt":
+            data = segments_to_vtt(segment, i)
+        elif response_format == "srt":
+            data = segments_to_srt(segment, i)
+        yield format_as_sse(data)
+
+
 def segments_to_streaming_response(
-    segments: Iterable[TranscriptionSegment],
+    segments: Iterable[Segment],
     transcription_info: TranscriptionInfo,
     response_format: ResponseFormat,
+    executor: Executor,
 ) -> StreamingResponse:
-    def segment_responses() -> Generator[str, None, None]:
-        for i, segment in enumerate(segments):
-            if response_format == "text":
-                data = segment.text
-            elif response_format == "json":
-                data = CreateTranscriptionResponseJson.from_segments([segment]).model_dump_json()
-            elif response_format == "verbose_json":
-                data = CreateTranscriptionResponseVerboseJson.from_segment(
-                    segment, transcription_info
-                ).model_dump_json()
-            elif response_format == "vtt":
-                data = segments_to_vtt(segment, i)
-            elif response_format == "srt":
-                data = segments_to_srt(segment, i)
-            yield format_as_sse(data)
-
-    return StreamingResponse(segment_responses(), media_type="text/event-stream")
+    """The segments are generated lazily by the model, so they get pulled on `executor` rather than on Starlette's default threadpool."""
+    events = segments_to_sse_events(segments, transcription_info, response_format)
+    return StreamingResponse(iterate_in_executor(executor, events), media_type="text/event-stream")
+
+
+def window_transcriber(
+    config: Config, model_manager: WhisperModelManager | RemoteWhisperModelManager, model: str
+) -> TranscribeWindow:
+    def transcribe_window(window: NDArray[np.float32], **kwargs) -> tuple[list[Segment], TranscriptionInfo]:
+        # NOTE: the model is only leased while a window is being transcribed, not while waiting for the next one
+        with model_manager.load_model(model) as whisper:
+            # NOTE: passed by `ChunkedTranscription`, which doesn't know which kind of model this is
+            speech_timestamps = kwargs.pop("speech_timestamps", None)
+            # NOTE: without `vad_filter`, batched pipelines refuse audio that's at least `chunk_length` long unless told where the speech is, which would be every window of `WindowedTranscription` but the last
+            window_is_chunk_long = len(window) >= BATCHED_CHUNK_SECONDS * SAMPLES_PER_SECOND
+            if speech_timestamps is None and not kwargs.get("vad_filter") and window_is_chunk_long:
+                speech_timestamps = [{"start": 0, "end": len(window)}]
+            segments, transcription_info = transcribe_speech(
+                whisper, window, speech_timestamps, **batched_mode_kwargs(whisper, config), **kwargs
+            )
+            return list(Segment.from_faster_whisper_segments(segments)), transcription_info
+
+    return transcribe_window
+
+
+class LeasedSegments[T]:
+    """Passes the segments through and releases the model lease held by `stack` once they've all been consumed, or they fail, or they're dropped (e.g. the client disconnected in the middle of a streamed response).
+
+    faster-whisper decodes the segments lazily, as they're iterated over, which for streamed responses only happens after `transcribe_audio` has returned. Releasing the lease when `transcribe` returns would hand the replica to another request (or let it get unloaded) while it's still in use.
+    """
+
+    def __init__(self, stack: ExitStack, segments: Iterable[T]) -> None:
+        self.stack = stack
+        self.segments = iter(segments)
+
+    def __iter__(self) -> Iterator[T]:
+        return self
+
+    def __next__(self) -> T:
+        try:
+            return next(self.segments)
+        except BaseException:
+            self.stack.close()
+            raise
+
+    def __del__(self) -> None:
+        self.stack.close()
+
+
+@dataclass(frozen=True)
+class _SilenceTranscriptionOptions:
+    word_timestamps: bool
+
+
+@dataclass(frozen=True)
+class SilenceTranscriptionInfo:
+    """Stands in for `TranscriptionInfo` when voice activity detection found no speech at all, so that Whisper doesn't get loaded (nor run) only to produce an empty transcript. Only has what's needed to build the responses.
+
+    `language` is the requested one, or `UNKNOWN_LANGUAGE` since there's no speech to detect it from.
+    """
+
+    language: str
+    duration: float
+    transcription_options: _SilenceTranscriptionOptions
+
+
+def silence_transcription_info(audio: NDArray[np.float32], params: dict[str, object]) -> TranscriptionInfo:
+    language = params.get("language")
+    info = SilenceTranscriptionInfo(
+        language=language if isinstance(language, str) else UNKNOWN_LANGUAGE,
+        duration=len(audio) / SAMPLES_PER_SECOND,
+        transcription_options=_SilenceTranscriptionOptions(word_timestamps=bool(params.get("word_timestamps"))),
+    )
+    return info  # pyright: ignore[reportReturnType]
+
+
+def vad_filter_options(config: Config) -> VadOptions:
+    """The options `vad_filter` would have used, which differ for batched pipelines."""
+    if config.whisper.use_batched_mode or config.whisper.dynamic_batching.enabled:
+        return batched_vad_options()
+    return VadOptions()
+
+
+def transcribe_audio(
+    config: Config,
+    model_manager: WhisperModelManager | RemoteWhisperModelManager,
+    transcription_cache: TranscriptionCache,
+    speech_probability_cache: SpeechProbabilityCache,
+    executors: WorkloadExecutors,
+    audio: NDArray[np.float32] | SpilledAudio,
+    model: str,
+    params: dict[str, object],
+    response_format: ResponseFormat,
+    *,
+    stream: bool,
+    chunking_strategy: ChunkingStrategy | None = None,
+    digest: str | None = None,
+) -> Response | StreamingResponse:
+    """Blocks while the model gets loaded and (unless `stream` is set) the audio gets transcribed, so it must be run on `executors.inference`. See `run_transcription`.
+
+    An identical transcription which is still in flight isn't waited for here, since it may need a thread of `executors.inference` to make progress. The audio gets transcribed without being cached instead.
+    With `vad_filter`, voice activity detection is run (or its result looked up in `speech_probability_cache`) before anything else. Audio without any speech gets an empty transcript without Whisper being loaded, and otherwise only the speech regions are passed to Whisper.
+    The same goes for `chunking_strategy="auto"`, where every chunk only gets its own speech regions transcribed.
+    """
+    if digest is None:
+        digest = audio.digest if isinstance(audio, SpilledAudio) else audio_digest(audio)
+    cache_key_params = cache_params(config, params, chunking_strategy)
+    with transcription_cache.lookup(digest, model, cache_key_params, wait=False) as cached:
+        if cached.result is not None:
+            return create_response(*cached.result, response_format, executors.inference, stream=stream)
+        if isinstance(audio, SpilledAudio):
+            transcription = WindowedTranscription(
+                window_transcriber(config, model_manager, model), audio.chunks(WINDOW_SECONDS), params
+            ).start()
+            assert transcription.info is not None
+            transcription_info = replace(transcription.info, duration=audio.duration)
+            segments = cached.record(transcription, transcription_info)
+            return create_response(segments, transcription_info, response_format, executors.inference, stream=stream)
+        speech_regions: list[dict[str, int]] | None = None
+        if params.get("vad_filter"):
+            speech_regions = speech_probability_cache.speech_timestamps(audio, vad_filter_options(config), digest)
+        if chunking_strategy == "auto" and (speech_regions is None or len(speech_regions) > 0):
+            max_chunk_duration = config.whisper.max_chunk_duration
+            # NOTE: the regions get transcribed as clips, which batched pipelines can't handle if they're longer than 30 seconds
+            speech_timestamps = speech_probability_cache.speech_timestamps(
+                audio, VadOptions(max_speech_duration_s=BATCHED_CHUNK_SECONDS), digest
+            )
+            chunks = split_at_silences(speech_timestamps, len(audio), max_chunk_duration * SAMPLES_PER_SECOND)
+            if len(chunks) > 0:
+                chunked_transcription = ChunkedTranscription(
+                    window_transcriber(config, model_manager, model),
+                    audio,
+                    chunks,
+                    params,
+                    executors.chunks,
+                    speech_timestamps,
+                ).start()
+                assert chunked_transcription.info is not None
+                segments = cached.record(chunked_transcription, chunked_transcription.info)
+                return create_response(
+                    segments, chunked_transcription.info, response_format, executors.inference, stream=stream
+                )
+            speech_regions = speech_timestamps
+        if speech_regions is not None and len(speech_regions) == 0:
+            logger.info("No speech detected, skipping the transcription")
+            transcription_info = silence_transcription_info(audio, params)
+            segments = cached.record([], transcription_info)
+            return create_response(segments, transcription_info, response_format, executors.inference, stream=stream)
+        with ExitStack() as stack:
+            whisper = stack.enter_context(model_manager.load_model(model))
+            fw_segments, transcription_info = transcribe_speech(
+                whisper, audio, speech_regions, **batched_mode_kwargs(whisper, config), **params
+            )
+            leased_segments = LeasedSegments(stack.pop_all(), fw_segments)
+        segments = cached.record(Segment.from_faster_whisper_segments(leased_segments), transcription_info)
+        return create_response(segments, transcription_info, response_format, executors.inference, stream=stream)
+
+
+async def run_transcription(
+    config: Config,
+    model_manager: WhisperModelManager | RemoteWhisperModelManager,
+    transcription_cache: TranscriptionCache,
+    speech_probability_cache: SpeechProbabilityCache,
+    executors: WorkloadExecutors,
+    audio: NDArray[np.float32] | SpilledAudio,
+    model: str,
+    params: dict[str, object],
+    response_format: ResponseFormat,
+    *,
+    stream: bool,
+    chunking_strategy: ChunkingStrategy | None = None,
+) -> Response | StreamingResponse:
+    """Run `transcribe_audio` on `executors.inference`, once an identical transcription which is in flight (if any) has finished, so that its result gets reused."""
+    if isinstance(audio, SpilledAudio):
+        digest = audio.digest
+    else:
+        digest = await run_in_executor(executors.decode, audio_digest, audio)
+    await transcription_cache.wait_for_in_flight(digest, model, cache_params(config, params, chunking_strategy))
+    return await run_in_executor(
+        executors.inference,
+        transcribe_audio,
+        config,
+        model_manager,
+        transcription_cache,
+        speech_probability_cache,
+        executors,
+        audio,
+        model,
+        params,
+        response_format,
+        stream=stream,
+        chunking_strategy=chunking_strategy,
+        digest=digest,
+    )
 
 
 @router.post(
     "/v1/audio/translations",
     response_model=str | CreateTranscriptionResponseJson | CreateTranscriptionResponseVerboseJson,
 )
-def translate_file(
+async def translate_file(
     config: ConfigDependency,
+    # NOTE: before `audio`, so that it gets resolved before the audio gets decoded
+    admission: WhisperAdmissionDependency,
     model_manager: ModelManagerDependency,
-    audio: AudioFileDependency,
+    transcription_cache: TranscriptionCacheDependency,
+    speech_probability_cache: SpeechProbabilityCacheDependency,
+    executors: ExecutorsDependency,
+    audio: TranscriptionAudioDependency,
     model: Annotated[ModelId, Form()],
     prompt: Annotated[str | None, Form()] = None,
     response_format: Annotated[ResponseFormat, Form()] = DEFAULT_RESPONSE_FORMAT,
     temperature: Annotated[float, Form()] = 0.0,
     stream: Annotated[bool, Form()] = False,
     vad_filter: Annotated[bool, Form()] = False,
+    decoding_profile: Annotated[str | None, Form()] = None,
 ) -> Response | StreamingResponse:
-    with model_manager.load_model(model) as whisper:
-        whisper_model = BatchedInferencePipeline(model=whisper) if config.whisper.use_batched_mode else whisper
-        segments, transcription_info = whisper_model.transcribe(
-            audio,
-            task="translate",
-            initial_prompt=prompt,
-            temperature=temperature,
-            vad_filter=vad_filter,
-        )
-        segments = TranscriptionSegment.from_faster_whisper_segments(segments)
-
-        if stream:
-            return segments_to_streaming_response(segments, transcription_info, response_format)
-        else:
-            return segments_to_response(segments, transcription_info, response_format)
+    params = {
+        "task": "translate",
+        "initial_prompt": prompt,
+        "temperature": temperature,
+        "vad_filter": vad_filter,
+        **decoding_profile_params(config, decoding_profile),
+    }
+    response = await run_transcription(
+        config,
+        model_manager,
+        transcription_cache,
+        speech_probability_cache,
+        executors,
+        audio,
+        model,
+        params,
+        response_format,
+        stream=stream,
+    )
+    return hold_admission_slot(admission, response)
 
 
 # HACK: Since Form() doesn't support `alias`, we need to use a workaround.
+# NOTE: `Request.form` returns the form FastAPI has already parsed for the `Form()` parameters, it doesn't get parsed again
 async def get_timestamp_granularities(request: Request) -> TimestampGranularities:
     form = await request.form()
     if form.get("timestamp_granularities[]") is None:
@@ -141,11 +425,16 @@ async def get_timestamp_granularities(request: Request) -> TimestampGranularitie
     "/v1/audio/transcriptions",
     response_model=str | CreateTranscriptionResponseJson | CreateTranscriptionResponseVerboseJson,
 )
-def transcribe_file(
+async def transcribe_file(
     config: ConfigDependency,
+    # NOTE: before `audio`, so that it gets resolved before the audio gets decoded
+    admission: WhisperAdmissionDependency,
     model_manager: ModelManagerDependency,
+    transcription_cache: TranscriptionCacheDependency,
+    speech_probability_cache: SpeechProbabilityCacheDependency,
+    executors: ExecutorsDependency,
     request: Request,
-    audio: AudioFileDependency,
+    audio: TranscriptionAudioDependency,
     model: Annotated[ModelId, Form()],
     language: Annotated[str | None, Form()] = None,
     prompt: Annotated[str | None, Form()] = None,
@@ -159,27 +448,119 @@ def transcribe_file(
     stream: Annotated[bool, Form()] = False,
     hotwords: Annotated[str | None, Form()] = None,
     vad_filter: Annotated[bool, Form()] = False,
+    chunking_strategy: Annotated[
+        ChunkingStrategy | None,
+        Form(
+            description="""When set to "auto", the audio is split into chunks at silences which get transcribed in parallel (see `whisper.max_chunk_duration`). Speeds up the transcription of long files when multiple replicas are available. Has no effect on files handled in the large file mode.""",
+        ),
+    ] = None,
+    decoding_profile: Annotated[
+        str | None,
+        Form(
+            description="""Name of the decoding profile (see `whisper.decoding_profiles`), a bundle of decoding options trading accuracy for speed. The defaults are `realtime` (greedy decoding without timestamp tokens), `balanced` and `accurate` (faster-whisper's defaults). Defaults to `whisper.default_decoding_profile`.""",
+        ),
+    ] = None,
 ) -> Response | StreamingResponse:
-    timestamp_granularities = asyncio.run(get_timestamp_granularities(request))
+    timestamp_granularities = await get_timestamp_granularities(request)
     if timestamp_granularities != DEFAULT_TIMESTAMP_GRANULARITIES and response_format != "verbose_json":
         logger.warning(
             "It only makes sense to provide `timestamp_granularities[]` when `response_format` is set to `verbose_json`. See https://platform.openai.com/docs/api-reference/audio/createTranscription#audio-createtranscription-timestamp_granularities."
         )
-    with model_manager.load_model(model) as whisper:
-        whisper_model = BatchedInferencePipeline(model=whisper) if config.whisper.use_batched_mode else whisper
-        segments, transcription_info = whisper_model.transcribe(
-            audio,
-            task="transcribe",
-            language=language,
-            initial_prompt=prompt,
-            word_timestamps="word" in timestamp_granularities,
-            temperature=temperature,
-            vad_filter=vad_filter,
-            hotwords=hotwords,
-        )
-        segments = TranscriptionSegment.from_faster_whisper_segments(segments)
+    params = {
+        "task": "transcribe",
+        "language": language,
+        "initial_prompt": prompt,
+        "word_timestamps": "word" in timestamp_granularities,
+        "temperature": temperature,
+        "vad_filter": vad_filter,
+        "hotwords": hotwords,
+        **decoding_profile_params(config, decoding_profile),
+    }
+    response = await run_transcription(
+        config,
+        model_manager,
+        transcription_cache,
+        speech_probability_cache,
+        executors,
+        audio,
+        model,
+        params,
+        response_format,
+        stream=stream,
+        chunking_strategy=chunking_strategy,
+    )
+    return hold_admission_slot(admission, response)
+
+
+# NOTE: unlike `/v1/audio/transcriptions`, the request body is the audio file itself (not a multipart form) and the parameters are passed in the query string. That's what allows reading the audio as it arrives
+@router.post(
+    "/v1/audio/transcriptions/upload-stream",
+    tags=["experimental"],
+    response_model=str | CreateTranscriptionResponseJson | CreateTranscriptionResponseVerboseJson,
+)
+async def transcribe_upload_stream(
+    config: ConfigDependency,
+    admission: WhisperUploadStreamAdmissionDependency,
+    model_manager: ModelManagerDependency,
+    executors: ExecutorsDependency,
+    request: Request,
+    model: Annotated[ModelId, Query()],
+    language: Annotated[str | None, Query()] = None,
+    prompt: Annotated[str | None, Query()] = None,
+    response_format: Annotated[ResponseFormat, Query()] = DEFAULT_RESPONSE_FORMAT,
+    temperature: Annotated[float, Query()] = 0.0,
+    timestamp_granularities: Annotated[
+        TimestampGranularities, Query(alias="timestamp_granularities[]")
+    ] = DEFAULT_TIMESTAMP_GRANULARITIES,
+    stream: Annotated[bool, Query()] = False,
+    hotwords: Annotated[str | None, Query()] = None,
+    vad_filter: Annotated[bool, Query()] = False,
+    decoding_profile: Annotated[str | None, Query()] = None,
+) -> Response | StreamingResponse:
+    """Transcribe an audio file while it's being uploaded.
 
-        if stream:
-            return segments_to_streaming_response(segments, transcription_info, response_format)
-        else:
-            return segments_to_response(segments, transcription_info, response_format)
+    The audio gets decoded as it arrives and every 30 seconds of it are transcribed as soon as they're available, so with `stream=true` the first segments are sent back before the upload has finished. The file has to be in a format which can be decoded front to back (e.g. WAV, MP3, OGG, FLAC or WebM, but not MP4/M4A files with the index at the end). Results aren't cached.
+    """
+    params = {
+        "task": "transcribe",
+        "language": language,
+        "initial_prompt": prompt,
+        "word_timestamps": "word" in timestamp_granularities,
+        "temperature": temperature,
+        "vad_filter": vad_filter,
+        "hotwords": hotwords,
+        **decoding_profile_params(config, decoding_profile),
+    }
+
+    upload = feed_upload(request)
+    transcription = WindowedTranscription(
+        window_transcriber(config, model_manager, model),
+        decode_audio_incrementally(upload),  # pyright: ignore[reportArgumentType]
+        params,
+    )
+    try:
+        await run_in_executor(executors.inference, transcription.start)
+    except av.error.InvalidDataError as e:
+        upload.abort()
+        raise HTTPException(
+            status_code=415,
+            detail="Failed to decode audio. The provided file type is not supported or can't be decoded while it's being uploaded.",
+        ) from e
+    except av.error.ValueError as e:
+        upload.abort()
+        raise HTTPException(status_code=400, detail="Failed to decode audio. The provided file is likely empty.") from e
+    except:
+        upload.abort()
+        raise
+    assert transcription.info is not None
+
+    if stream:
+        events = segments_to_sse_events(transcription, transcription.info, response_format)
+        return hold_admission_slot(
+            admission,
+            UploadStreamingResponse(
+                iterate_in_executor(executors.inference, events), upload=upload, media_type="text/event-stream"
+            ),
+        )
+    segments = await run_in_executor(executors.inference, list, transcription)
+    return segments_to_response(segments, transcription.info, response_format)
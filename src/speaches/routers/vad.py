@@ -3,25 +3,51 @@
 
 from __future__ import annotations
 
+import asyncio
+import io
+import json
 import logging
-from typing import TYPE_CHECKING, Annotated
+import tarfile
+from typing import TYPE_CHECKING, Annotated, BinaryIO, Literal
+import zipfile
 
 from fastapi import (
     APIRouter,
+    Depends,
     Form,
+    HTTPException,
+    Response,
+    UploadFile,
 )
-from faster_whisper.vad import VadOptions, get_speech_timestamps
+from fastapi.responses import StreamingResponse
+from faster_whisper.vad import VadOptions
 from pydantic import BaseModel
 
-from speaches.dependencies import AudioFileDependency  # noqa: TC001
+from speaches.audio import decode_audio_file
+from speaches.dependencies import (  # noqa: TC001 FastAPI resolves the dependencies at runtime
+    AudioFileDependency,
+    ExecutorsDependency,
+    SpeechProbabilityCacheDependency,
+)
+from speaches.executors import run_in_executor
+from speaches.model_aliases import ModelId  # noqa: TC001 FastAPI resolves the form fields at runtime
+from speaches.vad import WINDOW_SIZE_SAMPLES
 
 if TYPE_CHECKING:
-    from speaches.model_aliases import ModelId
+    from collections.abc import AsyncGenerator
+
+    import numpy as np
+    from numpy.typing import NDArray
+
+    from speaches.executors import WorkloadExecutors
+    from speaches.vad import SpeechProbabilityCache
 
-# NOTE: this should match the default value in `decode_audio` which gets called by `AudioFileDependency`
+# NOTE: this should match the sample rate of the audio returned by `AudioFileDependency`
 SAMPLE_RATE = 16000
 MS_SAMPLE_RATE = SAMPLE_RATE // 1000
 MODEL_ID = "silero_vad_v5"
+# NOTE: enough for the VAD model to get full batches (see `VadConfig.max_batch_size`) while further files are being decoded
+MAX_BATCH_FILES_IN_FLIGHT = 64
 
 
 logger = logging.getLogger(__name__)
@@ -34,20 +60,45 @@ class SpeechTimestamp(BaseModel):
     end: int
 
 
-def to_ms_speech_timestamps(speech_timestamps: list[SpeechTimestamp]) -> list[SpeechTimestamp]:
-    for i in range(len(speech_timestamps)):
-        speech_timestamps[i].start = speech_timestamps[i].start // MS_SAMPLE_RATE
-        speech_timestamps[i].end = speech_timestamps[i].end // MS_SAMPLE_RATE
-    return speech_timestamps
+type VadResponseFormat = Literal["json", "probabilities", "probabilities_f32"]
+
+
+class SpeechProbabilities(BaseModel):
+    """The `probabilities` response. `probabilities[i]` is the probability of speech in the audio from `i * window_size_samples` to `(i + 1) * window_size_samples` (at `sample_rate`), the last window being zero padded."""
+
+    sample_rate: int
+    window_size_samples: int
+    probabilities: list[float]
+
+
+def speech_timestamps_to_json(starts: NDArray[np.int64], ends: NDArray[np.int64]) -> str:
+    """Same as dumping a `list[SpeechTimestamp]` with the timestamps (in samples) converted to milliseconds."""
+    return (
+        "["
+        + ",".join(
+            f'{{"start":{start},"end":{end}}}'
+            for start, end in zip((starts // MS_SAMPLE_RATE).tolist(), (ends // MS_SAMPLE_RATE).tolist(), strict=True)
+        )
+        + "]"
+    )
+
+
+def speech_probabilities_response(probabilities: NDArray[np.float32], response_format: VadResponseFormat) -> Response:
+    if response_format == "probabilities_f32":
+        return Response(
+            content=probabilities.astype("<f4").tobytes(),
+            media_type="application/octet-stream",
+            headers={"X-Sample-Rate": str(SAMPLE_RATE), "X-Window-Size-Samples": str(WINDOW_SIZE_SAMPLES)},
+        )
+    return Response(
+        content=f'{{"sample_rate":{SAMPLE_RATE},"window_size_samples":{WINDOW_SIZE_SAMPLES},'
+        f'"probabilities":{json.dumps(probabilities.tolist())}}}',
+        media_type="application/json",
+    )
 
 
 # TODO: adapt parameter names from here https://platform.openai.com/docs/api-reference/realtime-sessions/create#realtime-sessions-create-turn_detection
-# TODO: use model manager
-# TODO: use CudaExecutionProvider
-@router.post("/v1/audio/speech/timestamps")
-def detect_speech_timestamps(
-    audio: AudioFileDependency,
-    model: Annotated[ModelId, Form()] = MODEL_ID,
+def vad_options_dependency(
     threshold: Annotated[
         float,
         Form(
@@ -91,9 +142,8 @@ def detect_speech_timestamps(
     speech_pad_ms: Annotated[
         int, Form(ge=0, description="""Final speech chunks are padded by speech_pad_ms each side""")
     ] = 0,
-) -> list[SpeechTimestamp]:
-    assert model == "silero_vad_v5", "Only 'silero_vad_v5' model is supported"
-    vad_options = VadOptions(
+) -> VadOptions:
+    return VadOptions(
         threshold=threshold,
         neg_threshold=neg_threshold,  # pyright: ignore[reportArgumentType]
         min_speech_duration_ms=min_speech_duration_ms,
@@ -101,10 +151,149 @@ def detect_speech_timestamps(
         min_silence_duration_ms=min_silence_duration_ms,
         speech_pad_ms=speech_pad_ms,
     )
-    speech_timestamps = to_ms_speech_timestamps(
-        [
-            SpeechTimestamp.model_validate(x)
-            for x in get_speech_timestamps(audio, vad_options=vad_options, sampling_rate=SAMPLE_RATE)
-        ]
+
+
+VadOptionsDependency = Annotated[VadOptions, Depends(vad_options_dependency)]
+
+
+@router.post(
+    "/v1/audio/speech/timestamps",
+    response_model=list[SpeechTimestamp],
+    responses={
+        200: {
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "anyOf": [
+                            {"type": "array", "items": SpeechTimestamp.model_json_schema()},
+                            SpeechProbabilities.model_json_schema(),
+                        ]
+                    }
+                },
+                "application/octet-stream": {},
+            }
+        }
+    },
+)
+async def detect_speech_timestamps(
+    speech_probability_cache: SpeechProbabilityCacheDependency,
+    executors: ExecutorsDependency,
+    audio: AudioFileDependency,
+    vad_options: VadOptionsDependency,
+    model: Annotated[ModelId, Form()] = MODEL_ID,
+    response_format: Annotated[
+        VadResponseFormat,
+        Form(
+            description="""`json` returns the speech timestamps (in milliseconds). `probabilities` returns the speech probability of every window of the audio instead (see `SpeechProbabilities`), and `probabilities_f32` returns them as little-endian 32-bit floats, with the sample rate and window size in the `X-Sample-Rate` and `X-Window-Size-Samples` headers. The VAD options don't apply to either of those.""",
+        ),
+    ] = "json",
+) -> Response:
+    assert model == "silero_vad_v5", "Only 'silero_vad_v5' model is supported"
+    # NOTE: the speech probabilities are shared with transcriptions of the same audio using `vad_filter` (see `speaches.vad`)
+    if response_format != "json":
+        probabilities = await run_in_executor(executors.vad, speech_probability_cache.probabilities, audio)
+        return speech_probabilities_response(probabilities, response_format)
+    starts, ends = await run_in_executor(
+        executors.vad, speech_probability_cache.speech_timestamp_arrays, audio, vad_options
+    )
+    return Response(content=speech_timestamps_to_json(starts, ends), media_type="application/json")
+
+
+class FileSpeechTimestamps(BaseModel):
+    """A line of the `/v1/audio/speech/timestamps/batch` response."""
+
+    index: int
+    """Position of the file in the request, counting the files of `archive` after `files`."""
+    filename: str | None
+    speech_timestamps: list[SpeechTimestamp] | None = None
+    error: str | None = None
+
+
+def read_archive(file: BinaryIO) -> list[tuple[str, bytes]]:
+    """Names and contents of the regular files in a ZIP or (optionally compressed) TAR archive, in archive order."""
+    if zipfile.is_zipfile(file):
+        with zipfile.ZipFile(file) as archive:
+            return [(info.filename, archive.read(info)) for info in archive.infolist() if not info.is_dir()]
+    file.seek(0)
+    try:
+        with tarfile.open(fileobj=file, mode="r:*") as archive:
+            return [
+                (member.name, archive.extractfile(member).read())  # pyright: ignore[reportOptionalMemberAccess]
+                for member in archive.getmembers()
+                if member.isfile()
+            ]
+    except tarfile.TarError as e:
+        raise HTTPException(status_code=400, detail="`archive` must be a ZIP or TAR file.") from e
+
+
+async def detect_file_speech_timestamps(
+    index: int,
+    filename: str | None,
+    data: bytes,
+    vad_options: VadOptions,
+    speech_probability_cache: SpeechProbabilityCache,
+    executors: WorkloadExecutors,
+) -> str:
+    """The `FileSpeechTimestamps` line of the file, as JSON."""
+    try:
+        audio = await run_in_executor(
+            executors.decode, decode_audio_file, io.BytesIO(data), process_pool=executors.decode_processes
+        )
+    except Exception as e:  # noqa: BLE001
+        logger.debug(f"Failed to decode file {index} ({filename}) of a batch: {e!r}")
+        return FileSpeechTimestamps(index=index, filename=filename, error="Failed to decode audio.").model_dump_json()
+    starts, ends = await run_in_executor(
+        executors.vad, speech_probability_cache.speech_timestamp_arrays, audio, vad_options
+    )
+    return (
+        f'{{"index":{index},"filename":{json.dumps(filename, ensure_ascii=False)},'
+        f'"speech_timestamps":{speech_timestamps_to_json(starts, ends)},"error":null}}'
     )
-    return speech_timestamps
+
+
+@router.post(
+    "/v1/audio/speech/timestamps/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def detect_batch_speech_timestamps(
+    speech_probability_cache: SpeechProbabilityCacheDependency,
+    executors: ExecutorsDependency,
+    vad_options: VadOptionsDependency,
+    files: Annotated[list[UploadFile], Form(description="Audio files.")] = [],
+    archive: Annotated[
+        UploadFile | None, Form(description="ZIP or TAR (optionally compressed) archive of audio files.")
+    ] = None,
+    model: Annotated[ModelId, Form()] = MODEL_ID,
+) -> StreamingResponse:
+    """Same as `/v1/audio/speech/timestamps` for many files at once.
+
+    The files are decoded in parallel and their audio is scored by the VAD model in batches. The response is newline delimited JSON with a `FileSpeechTimestamps` object per file, written as soon as the file is done, so the order of the lines doesn't match the order of the files (see `index`). A file which fails to decode gets a line with an `error` instead of failing the whole request.
+    """
+    assert model == "silero_vad_v5", "Only 'silero_vad_v5' model is supported"
+    # NOTE: the uploads get closed once this function returns, before the response is streamed, so their contents are read upfront
+    inputs = [(upload.filename, await upload.read()) for upload in files]
+    if archive is not None:
+        inputs.extend(await run_in_executor(executors.decode, read_archive, archive.file))
+    if len(inputs) == 0:
+        raise HTTPException(status_code=400, detail="At least one file (or a non-empty `archive`) is required.")
+
+    async def stream() -> AsyncGenerator[str, None]:
+        in_flight = asyncio.Semaphore(MAX_BATCH_FILES_IN_FLIGHT)
+
+        async def detect(index: int, filename: str | None, data: bytes) -> str:
+            async with in_flight:
+                return await detect_file_speech_timestamps(
+                    index, filename, data, vad_options, speech_probability_cache, executors
+                )
+
+        tasks = [asyncio.create_task(detect(index, *input_)) for index, input_ in enumerate(inputs)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task + "\n"
+        finally:
+            # the client has gone away
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -0,0 +1,183 @@
+"""Internal representation of transcription segments, and their serialization into the response formats.
+
+`TranscriptionSegment` and `TranscriptionWord` (from `speaches.api_types`) describe the responses, but building (and validating) a Pydantic model per segment and per word, only to dump them right away, is a noticeable fraction of the inference time when transcribing long files with word timestamps. `Segment` is a slotted dataclass whose words are stored as parallel arrays (`Words`), and the response formats are written from those directly. The output parses to the same JSON as dumping the `speaches.api_types` models (only the formatting of some floats, e.g. `1e-05` rather than `1e-5`, may differ).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+import math
+from typing import TYPE_CHECKING, Literal
+
+import numpy as np
+
+from speaches.text_utils import segments_to_srt, segments_to_text, segments_to_vtt
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    import faster_whisper.transcribe
+    from faster_whisper.transcribe import TranscriptionInfo
+    from numpy.typing import NDArray
+
+# NOTE: `seek` is measured in feature frames, of which Whisper extracts 100 per second
+SEEK_FRAMES_PER_SECOND = 100
+
+# NOTE: the C implementation of `json.dumps(..., ensure_ascii=False)` for strings, which is how Pydantic serializes them as well
+_encode_str = json.encoder.encode_basestring
+
+
+@dataclass(slots=True)
+class Words:
+    """Words of a segment (see `TranscriptionWord`), with every attribute stored in its own array."""
+
+    start: NDArray[np.float64]
+    end: NDArray[np.float64]
+    word: list[str]
+    probability: NDArray[np.float64]
+
+    @classmethod
+    def from_faster_whisper_words(cls, words: list[faster_whisper.transcribe.Word]) -> Words:
+        return cls(
+            start=np.fromiter((word.start for word in words), dtype=np.float64, count=len(words)),
+            end=np.fromiter((word.end for word in words), dtype=np.float64, count=len(words)),
+            word=[word.word for word in words],
+            probability=np.fromiter((word.probability for word in words), dtype=np.float64, count=len(words)),
+        )
+
+    @classmethod
+    def concatenate(cls, words: Iterable[Words]) -> Words:
+        words = list(words)
+        return cls(
+            start=np.concatenate([w.start for w in words]) if words else np.empty(0),
+            end=np.concatenate([w.end for w in words]) if words else np.empty(0),
+            word=[word for w in words for word in w.word],
+            probability=np.concatenate([w.probability for w in words]) if words else np.empty(0),
+        )
+
+    def __len__(self) -> int:
+        return len(self.word)
+
+    def offset(self, seconds: float) -> None:
+        self.start += seconds
+        self.end += seconds
+
+    def to_json(self) -> str:
+        return (
+            "["
+            + ",".join(
+                f'{{"start":{start!r},"end":{end!r},"word":{_encode_str(word)},"probability":{probability!r}}}'
+                for start, end, word, probability in zip(
+                    self.start.tolist(), self.end.tolist(), self.word, self.probability.tolist(), strict=True
+                )
+            )
+            + "]"
+        )
+
+
+@dataclass(slots=True)
+class Segment:
+    """Same as `TranscriptionSegment`, see the module docstring."""
+
+    id: int
+    seek: int
+    start: float
+    end: float
+    text: str
+    tokens: list[int]
+    temperature: float
+    avg_logprob: float
+    compression_ratio: float
+    no_speech_prob: float
+    words: Words | None
+
+    @classmethod
+    def from_faster_whisper_segments(cls, segments: Iterable[faster_whisper.transcribe.Segment]) -> Iterable[Segment]:
+        for segment in segments:
+            yield cls(
+                id=segment.id,
+                seek=segment.seek,
+                start=segment.start,
+                end=segment.end,
+                text=segment.text,
+                tokens=segment.tokens,
+                temperature=segment.temperature or 0,  # FIX: hardcoded
+                avg_logprob=segment.avg_logprob,
+                compression_ratio=segment.compression_ratio,
+                no_speech_prob=segment.no_speech_prob,
+                words=Words.from_faster_whisper_words(segment.words) if segment.words is not None else None,
+            )
+
+    def offset(self, seconds: float) -> None:
+        self.seek += round(seconds * SEEK_FRAMES_PER_SECOND)
+        self.start += seconds
+        self.end += seconds
+        if self.words is not None:
+            self.words.offset(seconds)
+
+    def to_json(self) -> str:
+        return (
+            f'{{"id":{self.id},"seek":{self.seek},"start":{_float(self.start)},"end":{_float(self.end)},'
+            f'"text":{_encode_str(self.text)},"tokens":[{",".join(map(str, self.tokens))}],'
+            f'"temperature":{_float(self.temperature)},"avg_logprob":{_float(self.avg_logprob)},'
+            f'"compression_ratio":{_float(self.compression_ratio)},"no_speech_prob":{_float(self.no_speech_prob)},'
+            f'"words":{"null" if self.words is None else self.words.to_json()}}}'
+        )
+
+
+def _float(value: float) -> str:
+    # NOTE: Pydantic serializes infinity and NaN as `null`
+    return repr(float(value)) if math.isfinite(value) else "null"
+
+
+def segments_to_words(segments: Iterable[Segment]) -> Words:
+    words: list[Words] = []
+    for segment in segments:
+        # NOTE: a temporary "fix" for https://github.com/speaches-ai/speaches/issues/58.
+        # TODO: properly address the issue
+        assert segment.words is not None, (
+            "Segment must have words. If you are using an API ensure `timestamp_granularities[]=word` is set"
+        )
+        words.append(segment.words)
+    return Words.concatenate(words)
+
+
+def segments_to_json(segments: Iterable[Segment]) -> str:
+    """Same as `CreateTranscriptionResponseJson.from_segments(segments).model_dump_json()`."""
+    return f'{{"text":{_encode_str(segments_to_text(segments))}}}'
+
+
+def _verbose_json(language: str, duration: float, text: str, words: Words | None, segments: list[Segment]) -> str:
+    return (
+        f'{{"task":"transcribe","language":{_encode_str(language)},"duration":{_float(duration)},'
+        f'"text":{_encode_str(text)},"words":{"null" if words is None else words.to_json()},'
+        f'"segments":[{",".join(segment.to_json() for segment in segments)}]}}'
+    )
+
+
+def segments_to_verbose_json(segments: list[Segment], transcription_info: TranscriptionInfo) -> str:
+    """Same as `CreateTranscriptionResponseVerboseJson.from_segments(segments, transcription_info).model_dump_json()`."""
+    return _verbose_json(
+        language=transcription_info.language,
+        duration=transcription_info.duration,
+        text=segments_to_text(segments),
+        words=segments_to_words(segments) if transcription_info.transcription_options.word_timestamps else None,
+        segments=segments,
+    )
+
+
+def segment_to_verbose_json(segment: Segment, transcription_info: TranscriptionInfo) -> str:
+    """Same as `CreateTranscriptionResponseVerboseJson.from_segment(segment, transcription_info).model_dump_json()`."""
+    return _verbose_json(
+        language=transcription_info.language,
+        duration=segment.end - segment.start,
+        text=segment.text,
+        words=segment.words if transcription_info.transcription_options.word_timestamps else None,
+        segments=[segment],
+    )
+
+
+def segments_to_subtitles(segments: Iterable[Segment], response_format: Literal["srt", "vtt"]) -> str:
+    to_subtitle = segments_to_vtt if response_format == "vtt" else segments_to_srt
+    return "".join(to_subtitle(segment, i) for i, segment in enumerate(segments))
@@ -0,0 +1,116 @@
+"""Access to a request body while it's still being uploaded.
+
+`UploadPipe` is a blocking, read-only file-like object which gets fed with the chunks of the request body by `feed_upload` as they arrive, so that the upload can be decoded (and transcribed) on a worker thread without waiting for it to finish.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+if TYPE_CHECKING:
+    from fastapi import Request
+    from starlette.types import Receive
+
+logger = logging.getLogger(__name__)
+
+
+class UploadPipe:
+    def __init__(self) -> None:
+        self.received = 0
+        """Number of bytes of the request body received so far."""
+        self.finished = asyncio.Event()
+        """Set once the whole request body has been received or the client has disconnected."""
+        self.disconnected = False
+        self._chunks: deque[bytes] = deque()
+        self._closed = False
+        self._error: Exception | None = None
+        self._condition = threading.Condition()
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self, request: Request) -> None:
+        # NOTE: the reference to the task is kept so that it doesn't get garbage collected
+        self._task = asyncio.create_task(self._feed(request))
+
+    async def _feed(self, request: Request) -> None:
+        try:
+            async for chunk in request.stream():
+                if len(chunk) > 0:
+                    self.write(chunk)
+        except ClientDisconnect as e:
+            logger.info(f"Client disconnected after uploading {self.received} bytes")
+            self.disconnected = True
+            self.close(e)
+        except Exception as e:
+            logger.exception("Failed to receive the request body")
+            self.close(e)
+        else:
+            self.close()
+        finally:
+            self.finished.set()
+
+    def abort(self) -> None:
+        """Stop receiving the request body, e.g. because it turned out not to be decodable."""
+        if self._task is not None:
+            self._task.cancel()
+        self.close()
+
+    def write(self, data: bytes) -> None:
+        with self._condition:
+            self._chunks.append(data)
+            self.received += len(data)
+            self._condition.notify_all()
+
+    def close(self, error: Exception | None = None) -> None:
+        with self._condition:
+            self._closed = True
+            self._error = error
+            self._condition.notify_all()
+
+    def read(self, size: int = -1) -> bytes:
+        """Block until data is available. Returns `b""` once the whole body has been read, and raises if the upload didn't complete."""
+        with self._condition:
+            while len(self._chunks) == 0 and not self._closed:
+                self._condition.wait()
+            if len(self._chunks) == 0:
+                if self._error is not None:
+                    raise self._error
+                return b""
+            if size < 0:
+                data = b"".join(self._chunks)
+                self._chunks.clear()
+                return data
+            data = self._chunks.popleft()
+            if len(data) > size:
+                self._chunks.appendleft(data[size:])
+                data = data[:size]
+            return data
+
+
+def feed_upload(request: Request) -> UploadPipe:
+    """Start reading the body of `request` into an `UploadPipe` in the background."""
+    pipe = UploadPipe()
+    pipe.start(request)
+    return pipe
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """`StreamingResponse` which can be sent while the request body is still being received by `feed_upload`.
+
+    `StreamingResponse` listens for the client disconnecting by calling `receive`, which would take the chunks of the request body away from `feed_upload`. It only starts listening once the upload is finished instead.
+    """
+
+    def __init__(self, *args, upload: UploadPipe, **kwargs) -> None:  # noqa: ANN002
+        super().__init__(*args, **kwargs)
+        self.upload = upload
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await self.upload.finished.wait()
+        if not self.upload.disconnected:
+            await super().listen_for_disconnect(receive)
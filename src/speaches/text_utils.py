@@ -7,9 +7,10 @@ if TYPE_CHECKING:
     from collections.abc import AsyncGenerator, Iterable
 
     from speaches.api_types import TranscriptionSegment
+    from speaches.segments import Segment
 
 
-def segments_to_text(segments: Iterable[TranscriptionSegment]) -> str:
+def segments_to_text(segments: Iterable[Segment | TranscriptionSegment]) -> str:
     return "".join(segment.text for segment in segments).strip()
 
 
@@ -29,7 +30,7 @@ def vtt_format_timestamp(ts: float) -> str:
     return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}.{int(milliseconds):03d}"
 
 
-def segments_to_vtt(segment: TranscriptionSegment, i: int) -> str:
+def segments_to_vtt(segment: Segment | TranscriptionSegment, i: int) -> str:
     start = segment.start if i > 0 else 0.0
     result = f"{vtt_format_timestamp(start)} --> {vtt_format_timestamp(segment.end)}\n{segment.text}\n\n"
 
@@ -39,7 +40,7 @@ def segments_to_vtt(segment: TranscriptionSegment, i: int) -> str:
         return result
 
 
-def segments_to_srt(segment: TranscriptionSegment, i: int) -> str:
+def segments_to_srt(segment: Segment | TranscriptionSegment, i: int) -> str:
     return f"{i + 1}\n{srt_format_timestamp(segment.start)} --> {srt_format_timestamp(segment.end)}\n{segment.text}\n\n"
 
 
@@ -0,0 +1,314 @@
+"""Cache of transcription and translation results keyed by the content of the audio.
+
+The key is a hash of the decoded audio combined with the model ID and every parameter which affects the result, so the same recording gets a hit no matter how it was encoded or named. Results are kept in an in-memory LRU and optionally in a directory on disk, which survives restarts.
+Identical requests which arrive while the first one is still being transcribed wait for it instead of running the model again. The waiting happens on the event loop (see `TranscriptionCache.wait_for_in_flight`) rather than on a worker thread, since the first request may need those same threads to make progress (e.g. to produce the segments of a streamed response).
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+import contextlib
+import hashlib
+import json
+import logging
+import pickle
+import threading
+from typing import TYPE_CHECKING, Self
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from pathlib import Path
+    from types import TracebackType
+
+    from faster_whisper.transcribe import TranscriptionInfo
+    import numpy as np
+    from numpy.typing import NDArray
+
+    from speaches.segments import Segment
+
+logger = logging.getLogger(__name__)
+
+type CachedTranscription = tuple[list[Segment], TranscriptionInfo]
+# NOTE: part of the key so that entries persisted to disk in an older format (e.g. `api_types.TranscriptionSegment`) are not read back
+CACHE_FORMAT_VERSION = 2
+DISK_TRIM_TARGET = 0.9
+"""Fraction of `disk_max_size` that the results on disk get trimmed down to once they exceed it, so that the directory doesn't have to be scanned again on the very next write."""
+
+
+class TranscriptionAbandonedError(Exception):
+    pass
+
+
+def audio_digest(audio: NDArray[np.float32]) -> str:
+    return hashlib.blake2b(audio.data, digest_size=16).hexdigest()
+
+
+def transcription_cache_key(audio: NDArray[np.float32] | str, model_id: str, params: dict[str, object]) -> str:
+    digest = audio if isinstance(audio, str) else audio_digest(audio)
+    params_json = json.dumps({"model": model_id, "format": CACHE_FORMAT_VERSION, **params}, sort_keys=True, default=str)
+    params_digest = hashlib.blake2b(params_json.encode(), digest_size=16).hexdigest()
+    return f"{digest}-{params_digest}"
+
+
+class _Recorder:
+    """Passes the segments through and stores them in the cache once they've all been consumed. Abandons the entry if the segments aren't consumed to the end (e.g. the client disconnected in the middle of a streamed response)."""
+
+    def __init__(
+        self,
+        cache: TranscriptionCache,
+        key: str,
+        future: Future[CachedTranscription],
+        segments: Iterable[Segment],
+        transcription_info: TranscriptionInfo,
+    ) -> None:
+        self.cache = cache
+        self.key = key
+        self.future = future
+        self.segments = iter(segments)
+        self.transcription_info = transcription_info
+        self.collected: list[Segment] = []
+        self.finished = False
+
+    def __iter__(self) -> Self:
+        return self
+
+    def __next__(self) -> Segment:
+        try:
+            segment = next(self.segments)
+        except StopIteration:
+            self.finished = True
+            self.cache._complete(self.key, self.future, (self.collected, self.transcription_info))  # noqa: SLF001
+            raise
+        except BaseException as e:
+            self.finished = True
+            self.cache._abandon(self.key, self.future, e)  # noqa: SLF001
+            raise
+        self.collected.append(segment)
+        return segment
+
+    def __del__(self) -> None:
+        if not self.finished:
+            self.cache._abandon(  # noqa: SLF001
+                self.key, self.future, TranscriptionAbandonedError("The transcription wasn't consumed to the end")
+            )
+
+
+class CacheLookup:
+    """Outcome of `TranscriptionCache.lookup`.
+
+    `result` is set on a hit. Otherwise the caller is responsible for the transcription and must pass its segments through `record`, which is what stores them in the cache and hands them to identical requests waiting for this one.
+    """
+
+    def __init__(
+        self,
+        cache: TranscriptionCache,
+        key: str | None = None,
+        result: CachedTranscription | None = None,
+        future: Future[CachedTranscription] | None = None,
+    ) -> None:
+        self.cache = cache
+        self.key = key
+        self.result = result
+        self.future = future
+        self._recording = False
+
+    def record(self, segments: Iterable[Segment], transcription_info: TranscriptionInfo) -> Iterator[Segment]:
+        if self.future is None or self.key is None:
+            return iter(segments)
+        self._recording = True
+        return _Recorder(self.cache, self.key, self.future, segments, transcription_info)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, traceback: TracebackType | None
+    ) -> None:
+        if self.future is not None and self.key is not None and not self._recording:
+            self.cache._abandon(  # noqa: SLF001
+                self.key, self.future, exc or TranscriptionAbandonedError("The transcription was never started")
+            )
+
+
+class TranscriptionCache:
+    def __init__(self, max_entries: int, disk_dir: Path | None = None, disk_max_size: int | None = None) -> None:
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_size = disk_max_size
+        self.entries = OrderedDict[str, CachedTranscription]()
+        self.in_flight: dict[str, Future[CachedTranscription]] = {}
+        self.hits = 0
+        """Requests served from memory or disk, including `disk_hits`."""
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        """Requests which waited for an identical in-flight request instead of running the model. Those which waited in `wait_for_in_flight` are counted in `hits` as well."""
+        self._lock = threading.Lock()
+        self.disk_size = 0
+        """Total size (in bytes) of the results in `disk_dir`, kept up to date by the writes instead of scanning the directory every time."""
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self.disk_size = sum(size for _, size, _ in self._disk_files())
+            if self.disk_max_size is not None and self.disk_size > self.disk_max_size:
+                self._trim_disk()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or self.disk_dir is not None
+
+    def lookup(
+        self, audio: NDArray[np.float32] | str, model_id: str, params: dict[str, object], *, wait: bool = True
+    ) -> CacheLookup:
+        """Look for the result of transcribing `audio` with `model_id` and `params`. If an identical request is being transcribed, wait for it to finish, or with `wait=False`, return a lookup which doesn't record anything so that the caller transcribes the audio on its own.
+
+        `audio` may also be a digest computed beforehand (e.g. `SpilledAudio.digest`), for audio which isn't held in memory.
+        """
+        if not self.enabled:
+            return CacheLookup(self)
+        key = transcription_cache_key(audio, model_id, params)
+        while True:
+            with self._lock:
+                if key in self.entries:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return CacheLookup(self, key, result=self.entries[key])
+                future = self.in_flight.get(key)
+                if future is None:
+                    future = Future[CachedTranscription]()
+                    self.in_flight[key] = future
+                    break
+            if not wait:
+                logger.debug("An identical transcription is in flight, transcribing without waiting for it")
+                return CacheLookup(self)
+            try:
+                result = future.result()
+            except Exception as e:  # noqa: BLE001
+                # the first request failed or went away, try again (this request may become the one doing the work)
+                logger.debug(f"Identical in-flight transcription didn't finish ({e!r}), retrying")
+                continue
+            with self._lock:
+                self.coalesced += 1
+            return CacheLookup(self, key, result=result)
+
+        result = self._read_from_disk(key)
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+                self.disk_hits += 1
+            self._complete(key, future, result, write_to_disk=False)
+            return CacheLookup(self, key, result=result)
+        with self._lock:
+            self.misses += 1
+        return CacheLookup(self, key, future=future)
+
+    async def wait_for_in_flight(self, digest: str, model_id: str, params: dict[str, object]) -> None:
+        """Wait for an identical transcription which is in flight to finish (or fail), without tying up a thread, so that a following `lookup` finds its result."""
+        if not self.enabled:
+            return
+        key = transcription_cache_key(digest, model_id, params)
+        with self._lock:
+            future = self.in_flight.get(key)
+        if future is None:
+            return
+        # NOTE: shielded, since cancelling the wrapper (e.g. the client disconnected) would cancel `future` as well
+        with contextlib.suppress(Exception):
+            await asyncio.shield(asyncio.wrap_future(future))
+            with self._lock:
+                self.coalesced += 1
+
+    def _complete(
+        self, key: str, future: Future[CachedTranscription], result: CachedTranscription, *, write_to_disk: bool = True
+    ) -> None:
+        with self._lock:
+            if self.max_entries > 0:
+                self.entries[key] = result
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+        future.set_result(result)
+        if write_to_disk:
+            self._write_to_disk(key, result)
+
+    def _abandon(self, key: str, future: Future[CachedTranscription], exc: BaseException) -> None:
+        with self._lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+        if not future.done():
+            future.set_exception(exc if isinstance(exc, Exception) else TranscriptionAbandonedError(repr(exc)))
+
+    def _disk_path(self, key: str) -> Path:
+        assert self.disk_dir is not None
+        return self.disk_dir / f"{key}.pkl"
+
+    def _read_from_disk(self, key: str) -> CachedTranscription | None:
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        path.touch()  # the least recently used files get evicted first
+        try:
+            # NOTE: the directory is only ever written by this process
+            return pickle.loads(data)  # noqa: S301
+        except Exception:
+            logger.exception(f"Failed to read {path}, removing it")
+            path.unlink(missing_ok=True)
+            with self._lock:
+                self.disk_size -= len(data)
+            return None
+
+    def _write_to_disk(self, key: str, result: CachedTranscription) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        data = pickle.dumps(result)
+        try:
+            replaced_size = path.stat().st_size
+        except FileNotFoundError:
+            replaced_size = 0
+        try:
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+        except OSError:
+            logger.exception(f"Failed to write {path}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self.disk_size += len(data) - replaced_size
+        if self.disk_max_size is not None and self.disk_size > self.disk_max_size:
+            self._trim_disk()
+
+    def _disk_files(self) -> list[tuple[float, int, Path]]:
+        """`(mtime, size, path)` of every result in `disk_dir`."""
+        assert self.disk_dir is not None
+        files = []
+        for path in self.disk_dir.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _trim_disk(self) -> None:
+        """Remove the least recently used results until they take up `DISK_TRIM_TARGET` of `disk_max_size`. Only called once `disk_size` exceeds `disk_max_size`, since it has to scan the whole directory."""
+        if self.disk_dir is None or self.disk_max_size is None:
+            return
+        files = self._disk_files()
+        size = sum(file_size for _, file_size, _ in files)
+        if size > self.disk_max_size:
+            for _, file_size, path in sorted(files):
+                if size <= self.disk_max_size * DISK_TRIM_TARGET:
+                    break
+                path.unlink(missing_ok=True)
+                size -= file_size
+        with self._lock:
+            # NOTE: also corrects any drift, e.g. from files removed by something else
+            self.disk_size = size
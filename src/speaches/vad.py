@@ -0,0 +1,580 @@
+"""Voice activity detection shared by the speech timestamps endpoint, the transcription endpoints and realtime sessions.
+
+Silero VAD outputs the probability of every 512 samples (32ms) of audio containing speech. Running the model is the expensive part, while turning the probabilities into speech timestamps for a given set of `VadOptions` is cheap, so the probabilities are cached by a hash of the audio (see `SpeechProbabilityCache`). A client which requests the speech timestamps of a file and then transcribes it with `vad_filter=true` only has the model run once, even though the two use different options.
+
+The model (`SileroVadModel`) is loaded by `speaches.model_manager.VadModelManager` rather than through `faster_whisper.vad.get_vad_model`, so that its ONNX Runtime sessions can be configured (see `VadConfig`) and it gets unloaded like the other models. Concurrent callers have their audio scored together by a `VadBatchScheduler`.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+import logging
+import math
+from pathlib import Path
+import threading
+from typing import TYPE_CHECKING
+
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.transcribe import restore_speech_timestamps
+from faster_whisper.utils import get_assets_path
+from faster_whisper.vad import VadOptions, collect_chunks, merge_segments
+import numpy as np
+from onnxruntime import InferenceSession, SessionOptions
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.transcription_cache import audio_digest
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Sequence
+
+    from faster_whisper.transcribe import Segment, TranscriptionInfo
+    from numpy.typing import NDArray
+
+    from speaches.config import VadConfig
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = "silero_vad_v5"
+WINDOW_SIZE_SAMPLES = 512
+# NOTE: every window is scored together with the last samples of the window before it
+CONTEXT_SIZE_SAMPLES = 64
+STATE_SIZE = 128
+# NOTE: the number of windows per encoder run, same as `faster_whisper.vad.SileroVADModel`. Limits the memory used for long audio
+ENCODER_BATCH_SIZE = 10000
+# NOTE: the default `chunk_length` of `BatchedInferencePipeline.transcribe`, which every clip must fit into
+BATCHED_CHUNK_SECONDS = 30
+IDLE_TIMEOUT = 5.0
+ENUMERATION_CHUNK_WINDOWS = 1024
+
+
+class SileroVadModel:
+    """Silero VAD v5 as shipped with (and computed by) `faster_whisper.vad.SileroVADModel`, with configurable ONNX Runtime sessions and scoring of several audio streams at once.
+
+    The model is split in two: a stateless encoder which embeds each window, and a decoder which turns the embeddings into probabilities while carrying a state from one window to the next. The encoder runs over the windows of every stream in as few runs as possible, and the decoder runs once per window position for all of the streams.
+    """
+
+    def __init__(self, encoder_session: InferenceSession, decoder_session: InferenceSession) -> None:
+        self.encoder_session = encoder_session
+        self.decoder_session = decoder_session
+
+    @classmethod
+    def load(cls, config: VadConfig) -> SileroVadModel:
+        options = SessionOptions()
+        options.intra_op_num_threads = config.intra_op_num_threads
+        options.inter_op_num_threads = config.inter_op_num_threads
+        options.enable_cpu_mem_arena = False
+        options.log_severity_level = 4
+        assets_path = Path(get_assets_path())
+        return cls(
+            *(
+                InferenceSession(
+                    str(assets_path / f"silero_{part}_v5.onnx"),
+                    sess_options=options,
+                    providers=config.execution_providers,
+                )
+                for part in ("encoder", "decoder")
+            )
+        )
+
+    def speech_probabilities(self, audio: NDArray[np.float32]) -> NDArray[np.float32]:
+        """Speech probability of every `WINDOW_SIZE_SAMPLES` samples of `audio`, same as computed by `faster_whisper.vad.get_speech_timestamps`."""
+        return self.batch_speech_probabilities([audio])[0]
+
+    def batch_speech_probabilities(self, audios: Sequence[NDArray[np.float32]]) -> list[NDArray[np.float32]]:
+        """Same as `speech_probabilities` of each of `audios`, computed together.
+
+        The streams are sorted from longest to shortest so that the decoder only runs on the streams which haven't ended yet.
+        """
+        if len(audios) == 0:
+            return []
+        # NOTE: a whole window of padding is added when the length is already a multiple of the window size, same as `get_speech_timestamps`
+        window_counts = np.array([len(audio) // WINDOW_SIZE_SAMPLES + 1 for audio in audios])
+        order = np.argsort(-window_counts, kind="stable")
+        window_counts = window_counts[order]
+        max_windows = int(window_counts[0])
+
+        windows = np.zeros((len(audios), max_windows, CONTEXT_SIZE_SAMPLES + WINDOW_SIZE_SAMPLES), dtype=np.float32)
+        for i, (index, count) in enumerate(zip(order.tolist(), window_counts.tolist(), strict=True)):
+            padded = np.zeros(count * WINDOW_SIZE_SAMPLES, dtype=np.float32)
+            padded[: len(audios[index])] = audios[index]
+            # NOTE: `SileroVADModel` zeroes the end of the last window (as a side effect of taking the contexts from a view of the audio)
+            padded[-CONTEXT_SIZE_SAMPLES:] = 0
+            padded = padded.reshape(count, WINDOW_SIZE_SAMPLES)
+            windows[i, :count, CONTEXT_SIZE_SAMPLES:] = padded
+            windows[i, 1:count, :CONTEXT_SIZE_SAMPLES] = padded[:-1, -CONTEXT_SIZE_SAMPLES:]
+
+        is_window = np.arange(max_windows) < window_counts[:, None]
+        encoder_input = windows[is_window]
+        encoder_output = np.concatenate(
+            [
+                self.encoder_session.run(None, {"input": encoder_input[i : i + ENCODER_BATCH_SIZE]})[0]
+                for i in range(0, len(encoder_input), ENCODER_BATCH_SIZE)
+            ]
+        )
+        # NOTE: laid out by window position so that the decoder's input for each position is contiguous
+        embeddings = np.zeros((max_windows, len(audios), STATE_SIZE), dtype=np.float32)
+        embeddings.transpose(1, 0, 2)[is_window] = encoder_output.reshape(-1, STATE_SIZE)
+
+        probabilities = np.zeros((len(audios), max_windows), dtype=np.float32)
+        state = np.zeros((2, len(audios), STATE_SIZE), dtype=np.float32)
+        active = len(audios)
+        for position in range(max_windows):
+            while window_counts[active - 1] <= position:
+                active -= 1
+            output, state = self.decoder_session.run(
+                None, {"input": embeddings[position, :active], "state": np.ascontiguousarray(state[:, :active])}
+            )
+            probabilities[:active, position] = output.reshape(active)
+
+        results: list[NDArray[np.float32]] = [np.empty(0, dtype=np.float32)] * len(audios)
+        for i, (index, count) in enumerate(zip(order.tolist(), window_counts.tolist(), strict=True)):
+            results[index] = probabilities[i, :count]
+        return results
+
+
+@dataclass(eq=False)
+class VadBatchItem:
+    audio: NDArray[np.float32]
+    length_class: int
+    future: Future[NDArray[np.float32]] = field(default_factory=Future)
+
+
+class VadBatchScheduler:
+    """Scores the audio submitted by concurrent callers with `SileroVadModel.batch_speech_probabilities` on a dedicated thread.
+
+    Audio submitted while a batch is running gets queued, and the next batch is formed around the oldest queued audio out of up to `max_batch_size` streams of a similar length (within a factor of two), so that little of the batch is padding. Batches never wait to be filled, so a caller without company gets its audio scored right away.
+    The thread exits after being idle for `IDLE_TIMEOUT` seconds and gets started again by the next submission, so an unloaded model isn't kept alive by its scheduler.
+    """
+
+    def __init__(self, model: SileroVadModel, max_batch_size: int) -> None:
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.batched_streams = 0
+        self._queue: deque[VadBatchItem] = deque()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def average_batch_size(self) -> float:
+        return self.batched_streams / self.batches if self.batches > 0 else 0.0
+
+    def submit(self, audio: NDArray[np.float32]) -> Future[NDArray[np.float32]]:
+        item = VadBatchItem(audio, (len(audio) // WINDOW_SIZE_SAMPLES + 1).bit_length())
+        with self._condition:
+            self._queue.append(item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="vad-batch-scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return item.future
+
+    def speech_probabilities(self, audio: NDArray[np.float32]) -> NDArray[np.float32]:
+        return self.submit(audio).result()
+
+    def _next_batch(self) -> list[VadBatchItem] | None:
+        """Block until something is queued. Returns `None` if nothing was submitted for `IDLE_TIMEOUT` seconds, in which case the caller must exit."""
+        with self._condition:
+            while len(self._queue) == 0:
+                if not self._condition.wait(IDLE_TIMEOUT) and len(self._queue) == 0:
+                    self._thread = None
+                    return None
+            head = self._queue[0]
+            batch = [item for item in self._queue if item.length_class == head.length_class][: self.max_batch_size]
+            batched = set(map(id, batch))
+            self._queue = deque(item for item in self._queue if id(item) not in batched)
+            return batch
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            if len(batch) == 0:
+                continue
+            try:
+                results = self.model.batch_speech_probabilities([item.audio for item in batch])
+            except Exception as e:
+                logger.exception(f"Failed to run voice activity detection on a batch of {len(batch)} streams")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_streams += len(batch)
+            for item, result in zip(batch, results, strict=True):
+                item.future.set_result(result)
+
+
+@dataclass(frozen=True, slots=True)
+class SegmentationParameters:
+    """`VadOptions` converted to samples, the same way as in `faster_whisper.vad.get_speech_timestamps`."""
+
+    threshold: float
+    neg_threshold: float
+    min_speech_samples: float
+    speech_pad_samples: float
+    max_speech_samples: float
+    min_silence_samples: float
+    min_silence_samples_at_max_speech: float
+
+    @classmethod
+    def from_vad_options(cls, vad_options: VadOptions) -> SegmentationParameters:
+        speech_pad_samples = SAMPLES_PER_SECOND * vad_options.speech_pad_ms / 1000
+        return cls(
+            threshold=vad_options.threshold,
+            neg_threshold=vad_options.neg_threshold
+            if vad_options.neg_threshold is not None
+            else max(vad_options.threshold - 0.15, 0.01),
+            min_speech_samples=SAMPLES_PER_SECOND * vad_options.min_speech_duration_ms / 1000,
+            speech_pad_samples=speech_pad_samples,
+            max_speech_samples=SAMPLES_PER_SECOND * vad_options.max_speech_duration_s
+            - WINDOW_SIZE_SAMPLES
+            - 2 * speech_pad_samples,
+            min_silence_samples=SAMPLES_PER_SECOND * vad_options.min_silence_duration_ms / 1000,
+            min_silence_samples_at_max_speech=SAMPLES_PER_SECOND * 98 / 1000,
+        )
+
+
+def segment_speech_frames(  # noqa: C901, PLR0912, PLR0915
+    probabilities: NDArray[np.float32],
+    audio_length_samples: int,
+    parameters: SegmentationParameters,
+    first_window: int = 0,
+    *,
+    until_silence: bool = False,
+) -> tuple[list[dict[str, int]], int]:
+    """The per-window state machine of `faster_whisper.vad.get_speech_timestamps` (which in turn follows Silero VAD's), kept as close as possible to the original. Returns the unpadded speech regions.
+
+    Starts at `first_window` with no speech in progress. With `until_silence`, it stops once the speech in progress has ended and returns the window at which that happened as well (otherwise the number of windows).
+    """
+    # NOTE: looked up once, since this runs for every window
+    threshold, neg_threshold = parameters.threshold, parameters.neg_threshold
+    max_speech_samples, min_silence_samples = parameters.max_speech_samples, parameters.min_silence_samples
+    min_silence_samples_at_max_speech = parameters.min_silence_samples_at_max_speech
+    triggered = False
+    speeches: list[dict[str, int]] = []
+    current_speech: dict[str, int] = {}
+    # to save potential segment end (and tolerate some silence)
+    temp_end = 0
+    # to save potential segment limits in case of maximum segment size reached
+    prev_end = next_start = 0
+
+    # NOTE: the probabilities are converted to Python floats a chunk at a time, since with `until_silence` this may stop long before the end
+    chunk_size = ENUMERATION_CHUNK_WINDOWS if until_silence else max(len(probabilities), 1)
+    for chunk_start in range(first_window, len(probabilities), chunk_size):
+        for i, speech_prob in enumerate(
+            probabilities[chunk_start : chunk_start + chunk_size].tolist(), start=chunk_start
+        ):
+            window_start = WINDOW_SIZE_SAMPLES * i
+            if speech_prob >= threshold and temp_end:
+                temp_end = 0
+                if next_start < prev_end:
+                    next_start = window_start
+
+            if speech_prob >= threshold and not triggered:
+                triggered = True
+                current_speech["start"] = window_start
+                continue
+
+            if triggered and window_start - current_speech["start"] > max_speech_samples:
+                if prev_end:
+                    current_speech["end"] = prev_end
+                    speeches.append(current_speech)
+                    current_speech = {}
+                    # previously reached silence (< neg_thres) and is still not speech (< thres)
+                    if next_start < prev_end:
+                        triggered = False
+                    else:
+                        current_speech["start"] = next_start
+                    prev_end = next_start = temp_end = 0
+                else:
+                    current_speech["end"] = window_start
+                    speeches.append(current_speech)
+                    current_speech = {}
+                    prev_end = next_start = temp_end = 0
+                    triggered = False
+                    if until_silence:
+                        return speeches, i
+                    continue
+
+            if speech_prob < neg_threshold and triggered:
+                if not temp_end:
+                    temp_end = window_start
+                # condition to avoid cutting in very short silence
+                if window_start - temp_end > min_silence_samples_at_max_speech:
+                    prev_end = temp_end
+                if window_start - temp_end < min_silence_samples:
+                    continue
+                current_speech["end"] = temp_end
+                if current_speech["end"] - current_speech["start"] > parameters.min_speech_samples:
+                    speeches.append(current_speech)
+                current_speech = {}
+                prev_end = next_start = temp_end = 0
+                triggered = False
+
+            if until_silence and not triggered:
+                return speeches, i
+
+    if current_speech and audio_length_samples - current_speech["start"] > parameters.min_speech_samples:
+        current_speech["end"] = audio_length_samples
+        speeches.append(current_speech)
+    return speeches, len(probabilities)
+
+
+def _first_at_or_after(mask: NDArray[np.bool_]) -> NDArray[np.int64]:
+    """Index of the first `True` at or after each position, or `len(mask)` if there's none. Has an extra element for the position `len(mask)`."""
+    indices = np.where(mask, np.arange(len(mask)), len(mask))
+    return np.append(np.minimum.accumulate(indices[::-1])[::-1], len(mask))
+
+
+def _last_at_or_before(mask: NDArray[np.bool_]) -> NDArray[np.int64]:
+    """Index of the last `True` at or before each position, or -1 if there's none."""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+
+def segment_speech(
+    probabilities: NDArray[np.float32], audio_length_samples: int, parameters: SegmentationParameters
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Vectorized `segment_speech_frames`. Returns the starts and ends (in samples) of the unpadded speech regions.
+
+    Between two windows at or above `threshold`, speech in progress ends at the first window below `neg_threshold` if there's one at least `min_silence_samples` after it (windows in between the two thresholds don't interrupt the silence). So the regions are the runs of speech windows separated by such gaps, which are found with cumulative minimums and maximums over the windows rather than by stepping through them.
+    Regions which would exceed `max_speech_samples` get split by `segment_speech_frames` (which is where the splitting depends on the history of every window), starting from the beginning of the region.
+    """
+    if parameters.neg_threshold >= parameters.threshold:
+        # NOTE: a window can then count as both speech and silence, which only the original handles
+        speeches, _ = segment_speech_frames(probabilities, audio_length_samples, parameters)
+        return _to_arrays(speeches)
+    window_count = len(probabilities)
+    speech_windows = np.flatnonzero(probabilities >= parameters.threshold)
+    if len(speech_windows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    silence = probabilities < parameters.neg_threshold
+    first_silence = _first_at_or_after(silence)
+    last_silence = _last_at_or_before(silence)
+
+    # the gap following each speech window ends right before the next speech window (or at the last window)
+    gap_last_windows = np.append(speech_windows[1:], window_count) - 1
+    gap_first_silence = first_silence[speech_windows + 1]
+    gap_last_silence = last_silence[gap_last_windows]
+    min_silence_windows = math.ceil(parameters.min_silence_samples / WINDOW_SIZE_SAMPLES)
+    ends_speech = (gap_first_silence <= gap_last_silence) & (
+        gap_last_silence - gap_first_silence >= min_silence_windows
+    )
+    # the window at which the end of the speech gets noticed, which is where it can no longer be split
+    gap_end_windows = np.where(
+        ends_speech,
+        first_silence[np.minimum(gap_first_silence + min_silence_windows, window_count)],
+        window_count - 1,
+    )
+    ending_gap = _first_at_or_after(ends_speech)
+
+    # a region starts at the first speech window and after every gap which ends speech
+    region_firsts = np.append(0, np.flatnonzero(ends_speech[:-1]) + 1)
+    region_gaps = np.minimum(ending_gap[region_firsts], len(speech_windows) - 1)
+    region_start_windows = speech_windows[region_firsts]
+    region_ends = np.where(
+        ends_speech[region_gaps], WINDOW_SIZE_SAMPLES * gap_first_silence[region_gaps], audio_length_samples
+    )
+    too_long_regions = np.flatnonzero(
+        WINDOW_SIZE_SAMPLES * (gap_end_windows[region_gaps] - region_start_windows) > parameters.max_speech_samples
+    )
+    if 2 * len(too_long_regions) > len(region_firsts):
+        # NOTE: stepping through every window is faster than switching back and forth for every other region
+        speeches, _ = segment_speech_frames(probabilities, audio_length_samples, parameters)
+        return _to_arrays(speeches)
+
+    starts: list[NDArray[np.int64]] = []
+    ends: list[NDArray[np.int64]] = []
+
+    def add(region_starts: NDArray[np.int64], region_ends: NDArray[np.int64]) -> None:
+        kept = region_ends - region_starts > parameters.min_speech_samples
+        starts.append(region_starts[kept])
+        ends.append(region_ends[kept])
+
+    speech_index = 0
+    while speech_index < len(speech_windows):
+        region = int(np.searchsorted(region_firsts, speech_index, side="right")) - 1
+        if region_firsts[region] == speech_index:
+            # whole regions, up to the next one which needs to be split
+            next_too_long = int(np.searchsorted(too_long_regions, region))
+            split = (
+                int(too_long_regions[next_too_long]) if next_too_long < len(too_long_regions) else len(region_firsts)
+            )
+            add(WINDOW_SIZE_SAMPLES * region_start_windows[region:split], region_ends[region:split])
+            if split == len(region_firsts):
+                break
+            first_window = int(region_start_windows[split])
+        else:
+            # the rest of a region whose beginning got split off
+            first_window = int(speech_windows[speech_index])
+            if WINDOW_SIZE_SAMPLES * (gap_end_windows[region_gaps[region]] - first_window) <= (
+                parameters.max_speech_samples
+            ):
+                add(np.array([WINDOW_SIZE_SAMPLES * first_window]), region_ends[region : region + 1])
+                speech_index = (
+                    int(region_firsts[region + 1]) if region + 1 < len(region_firsts) else len(speech_windows)
+                )
+                continue
+        speeches, stopped_at = segment_speech_frames(
+            probabilities, audio_length_samples, parameters, first_window, until_silence=True
+        )
+        split_starts, split_ends = _to_arrays(speeches)
+        starts.append(split_starts)
+        ends.append(split_ends)
+        speech_index = int(np.searchsorted(speech_windows, stopped_at, side="right"))
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def _to_arrays(speeches: list[dict[str, int]]) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    return (
+        np.array([speech["start"] for speech in speeches], dtype=np.int64),
+        np.array([speech["end"] for speech in speeches], dtype=np.int64),
+    )
+
+
+def pad_speech(
+    starts: NDArray[np.int64], ends: NDArray[np.int64], audio_length_samples: int, speech_pad_samples: float
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Pad the speech regions by `speech_pad_samples`, or by half of the silence in between two regions if it's shorter than twice that, same as `faster_whisper.vad.get_speech_timestamps`."""
+    if len(starts) == 0:
+        return starts, ends
+    silences = starts[1:] - ends[:-1]
+    short = silences < 2 * speech_pad_samples
+    padded_starts = np.empty_like(starts)
+    padded_ends = np.empty_like(ends)
+    padded_starts[0] = max(0, starts[0] - speech_pad_samples)
+    padded_starts[1:] = np.where(
+        short,
+        np.maximum(0, starts[1:] - silences // 2),
+        np.maximum(0, starts[1:] - speech_pad_samples).astype(np.int64),
+    )
+    padded_ends[:-1] = np.where(
+        short,
+        ends[:-1] + silences // 2,
+        np.minimum(audio_length_samples, ends[:-1] + speech_pad_samples).astype(np.int64),
+    )
+    padded_ends[-1] = min(audio_length_samples, ends[-1] + speech_pad_samples)
+    return padded_starts, padded_ends
+
+
+def speech_timestamp_arrays(
+    probabilities: NDArray[np.float32], audio_length_samples: int, vad_options: VadOptions
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """Starts and ends (in samples) of the speech in audio, given its speech probabilities (see `SileroVadModel.speech_probabilities`). Same result as `faster_whisper.vad.get_speech_timestamps`."""
+    parameters = SegmentationParameters.from_vad_options(vad_options)
+    starts, ends = segment_speech(probabilities, audio_length_samples, parameters)
+    return pad_speech(starts, ends, audio_length_samples, parameters.speech_pad_samples)
+
+
+def speech_timestamps(
+    probabilities: NDArray[np.float32], audio_length_samples: int, vad_options: VadOptions
+) -> list[dict[str, int]]:
+    """Same as `speech_timestamp_arrays`, in the format returned by `faster_whisper.vad.get_speech_timestamps`."""
+    starts, ends = speech_timestamp_arrays(probabilities, audio_length_samples, vad_options)
+    return [{"start": start, "end": end} for start, end in zip(starts.tolist(), ends.tolist(), strict=True)]
+
+
+class SpeechProbabilityCache:
+    """Caches the speech probabilities of audio (as computed by `compute`, see `SileroVadModel.speech_probabilities`) keyed by a hash of the audio. A request for audio whose probabilities are being computed waits for them instead of running the model again.
+
+    The probabilities take up about 450KB per hour of audio.
+    """
+
+    def __init__(self, max_entries: int, compute: Callable[[NDArray[np.float32]], NDArray[np.float32]]) -> None:
+        self.max_entries = max_entries
+        self.compute = compute
+        self.entries: OrderedDict[str, NDArray[np.float32]] = OrderedDict()
+        self.in_flight: dict[str, Future[NDArray[np.float32]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def probabilities(self, audio: NDArray[np.float32], digest: str | None = None) -> NDArray[np.float32]:
+        """`digest` may be passed if it has already been computed (see `audio_digest`)."""
+        if self.max_entries == 0:
+            return self.compute(audio)
+        key = digest if digest is not None else audio_digest(audio)
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            future = self.in_flight.get(key)
+            if future is None:
+                future = Future()
+                self.in_flight[key] = future
+                self.misses += 1
+                computing = True
+            else:
+                self.hits += 1
+                computing = False
+        if not computing:
+            try:
+                return future.result()
+            except Exception as e:  # noqa: BLE001
+                logger.debug(f"Identical in-flight voice activity detection failed ({e!r}), running it again")
+                return self.compute(audio)
+        try:
+            probabilities = self.compute(audio)
+        except BaseException as e:
+            with self._lock:
+                del self.in_flight[key]
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError(repr(e)))
+            raise
+        with self._lock:
+            self.entries[key] = probabilities
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            del self.in_flight[key]
+        future.set_result(probabilities)
+        return probabilities
+
+    def speech_timestamps(
+        self, audio: NDArray[np.float32], vad_options: VadOptions, digest: str | None = None
+    ) -> list[dict[str, int]]:
+        return speech_timestamps(self.probabilities(audio, digest), len(audio), vad_options)
+
+    def speech_timestamp_arrays(
+        self, audio: NDArray[np.float32], vad_options: VadOptions, digest: str | None = None
+    ) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+        return speech_timestamp_arrays(self.probabilities(audio, digest), len(audio), vad_options)
+
+
+def merge_speech_timestamps(speech_timestamps: list[dict[str, int]], max_samples: int) -> list[dict[str, int]]:
+    """Merge consecutive speech regions (and the silences between them) as long as the result isn't longer than `max_samples`."""
+    merged: list[dict[str, int]] = []
+    for speech in speech_timestamps:
+        if merged and speech["end"] - merged[-1]["start"] <= max_samples:
+            merged[-1]["end"] = speech["end"]
+        else:
+            merged.append({"start": speech["start"], "end": speech["end"]})
+    return merged
+
+
+def batched_vad_options() -> VadOptions:
+    """The options `BatchedInferencePipeline.transcribe` runs voice activity detection with for `vad_filter` (given the default `chunk_length`)."""
+    return VadOptions(max_speech_duration_s=BATCHED_CHUNK_SECONDS, min_silence_duration_ms=160)
+
+
+def transcribe_speech(
+    model: object, audio: NDArray[np.float32], speech_timestamps: list[dict[str, int]] | None, **kwargs
+) -> tuple[Iterable[Segment], TranscriptionInfo]:
+    """`model.transcribe(audio, **kwargs)`, except that only the given speech regions get transcribed, instead of voice activity detection being run by the model (`vad_filter`). Without `speech_timestamps`, `audio` is transcribed as is.
+
+    `WhisperModel` is given the speech concatenated, the same way as its own `vad_filter` does it so that every 30 second window is full of speech, and the timestamps of the segments are mapped back onto `audio`. Batched pipelines transcribe each region as a single chunk, so neighbouring regions get merged into chunks of up to `BATCHED_CHUNK_SECONDS`, the same way as the pipeline merges the regions found by its own `vad_filter`, and passed as `clip_timestamps`. Proxies pass the regions on to the model host, which calls this with the actual model.
+    """
+    if speech_timestamps is None:
+        return model.transcribe(audio, **kwargs)  # pyright: ignore[reportAttributeAccessIssue]
+    kwargs["vad_filter"] = False
+    if isinstance(model, WhisperModel):
+        audio_chunks, _ = collect_chunks(audio, speech_timestamps)
+        segments, transcription_info = model.transcribe(np.concatenate(audio_chunks), **kwargs)
+        transcription_info = replace(
+            transcription_info, duration=len(audio) / SAMPLES_PER_SECOND, duration_after_vad=transcription_info.duration
+        )
+        return restore_speech_timestamps(segments, speech_timestamps, SAMPLES_PER_SECOND), transcription_info
+    if isinstance(model, BatchedInferencePipeline):
+        # NOTE: `merge_segments` modifies the regions
+        clip_timestamps = merge_segments([dict(speech) for speech in speech_timestamps], batched_vad_options())
+        return model.transcribe(audio, clip_timestamps=clip_timestamps, **kwargs)
+    return model.transcribe(audio, speech_timestamps=speech_timestamps, **kwargs)  # pyright: ignore[reportAttributeAccessIssue]
@@ -0,0 +1,139 @@
+"""Transcription of audio which isn't available all at once, one window at a time.
+
+Whisper looks at 30 seconds of audio at a time, so a window is transcribed as soon as that much audio has arrived, without waiting for the rest. A window is likely to end in the middle of a segment, so the last segment of every window but the final one is discarded and the audio from its start onwards is transcribed again as the beginning of the next window. Segment IDs, timestamps and `seek` are shifted to be relative to the start of the whole audio.
+"""
+
+from __future__ import annotations
+
+from dataclasses import replace
+import logging
+from typing import TYPE_CHECKING, Any, Self
+
+import numpy as np
+
+from speaches.config import SAMPLES_PER_SECOND
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+    from faster_whisper.transcribe import TranscriptionInfo
+    from numpy.typing import NDArray
+
+    from speaches.segments import Segment
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 30
+
+type TranscribeWindow = Callable[..., tuple[list[Segment], TranscriptionInfo]]
+"""Transcribes a single window. Called with the audio of the window and the keyword arguments of `WhisperModel.transcribe`."""
+
+
+class WindowedTranscription:
+    """Iterator over the segments of `chunks`, which get pulled from lazily as windows are transcribed.
+
+    `start` has to be called first. It transcribes the first window, after which `info` is available (e.g. the detected language, which is then used for every following window). `info.duration` gets updated to the duration of the whole audio once every segment has been consumed.
+    """
+
+    def __init__(
+        self,
+        transcribe_window: TranscribeWindow,
+        chunks: Iterable[NDArray[np.float32]],
+        params: dict[str, Any],
+        window_seconds: int = WINDOW_SECONDS,
+    ) -> None:
+        self.transcribe_window = transcribe_window
+        self.chunks = iter(chunks)
+        self.params = params
+        self.window_size = window_seconds * SAMPLES_PER_SECOND
+        self.info: TranscriptionInfo | None = None
+        self.windows = 0
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._buffer_start = 0
+        """Offset (in samples) of `_buffer` from the start of the audio."""
+        self._exhausted = False
+        self._finished = False
+        self._segment_id = 0
+        self._previous_text: str | None = None
+        self._pending: Iterator[Segment] = iter(())
+
+    def _fill_buffer(self) -> None:
+        chunks = [self._buffer]
+        buffered = len(self._buffer)
+        while buffered < self.window_size and not self._exhausted:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self._exhausted = True
+                break
+            chunks.append(chunk)
+            buffered += len(chunk)
+        self._buffer = np.concatenate(chunks)
+
+    def _window_params(self) -> dict[str, Any]:
+        params = dict(self.params)
+        if self.info is not None:
+            params["language"] = self.info.language
+        # carry the context over like `WhisperModel.transcribe` does between its own 30 second windows, which keeps the caller's prompt in front of it (until the prompt gets too long and is cut from the start)
+        if self._previous_text is not None and params.get("condition_on_previous_text", True):
+            params["initial_prompt"] = f"{params.get('initial_prompt') or ''}{self._previous_text}"
+        return params
+
+    def _finish(self) -> None:
+        assert self.info is not None
+        self._finished = True
+        self.info = replace(self.info, duration=self._buffer_start / SAMPLES_PER_SECOND)
+
+    def _transcribe_next_window(self) -> list[Segment]:
+        self._fill_buffer()
+        window = self._buffer[: self.window_size]
+        final = self._exhausted and len(self._buffer) <= self.window_size
+        if len(window) == 0 and self.info is not None:
+            # the previous window ended exactly where the audio did
+            self._finish()
+            return []
+        segments, info = self.transcribe_window(window, **self._window_params())
+        self.windows += 1
+        if self.info is None:
+            self.info = info
+
+        consumed = len(window)
+        if not final and len(segments) > 1:
+            # the last segment was probably cut off by the end of the window
+            last_segment_start = round(segments[-1].start * SAMPLES_PER_SECOND)
+            if 0 < last_segment_start < consumed:
+                consumed = last_segment_start
+                segments = segments[:-1]
+        window_start = self._buffer_start / SAMPLES_PER_SECOND
+        for segment in segments:
+            self._segment_id += 1
+            segment.id = self._segment_id
+            segment.offset(window_start)
+        if len(segments) > 0:
+            self._previous_text = "".join(segment.text for segment in segments)
+
+        self._buffer = self._buffer[consumed:]
+        self._buffer_start += consumed
+        if final:
+            self._finish()
+        logger.debug(
+            f"Transcribed a window of {len(window) / SAMPLES_PER_SECOND:.1f}s starting at {window_start:.1f}s into {len(segments)} segments"
+        )
+        return segments
+
+    def start(self) -> Self:
+        self._pending = iter(self._transcribe_next_window())
+        return self
+
+    def __iter__(self) -> Self:
+        return self
+
+    def __next__(self) -> Segment:
+        assert self.info is not None, "`start` must be called first"
+        while True:
+            segment = next(self._pending, None)
+            if segment is not None:
+                return segment
+            if self._finished:
+                raise StopIteration
+            self._pending = iter(self._transcribe_next_window())
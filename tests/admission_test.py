@@ -0,0 +1,107 @@
+import asyncio
+from collections.abc import AsyncGenerator
+
+import pytest
+
+from speaches.admission import AdmissionController, QueueFullError, QueueTimeoutError
+from speaches.config import AdmissionConfig
+
+MODEL_ID = "Systran/faster-whisper-tiny.en"
+
+
+async def hold(controller: AdmissionController, order: list[int], i: int, release: asyncio.Event) -> None:
+    async with controller.admit(MODEL_ID):
+        order.append(i)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_queued_requests_are_admitted_in_order() -> None:
+    controller = AdmissionController(AdmissionConfig(max_concurrent_requests=1, max_queued_requests=3))
+    order: list[int] = []
+    release = asyncio.Event()
+    tasks = []
+    for i in range(4):
+        tasks.append(asyncio.create_task(hold(controller, order, i, release)))
+        await asyncio.sleep(0)
+    queue = controller.queues[MODEL_ID]
+    assert queue.active == 1
+    assert queue.queue_depth == 3
+    assert controller.in_flight[MODEL_ID] == 1
+    assert controller.is_saturated()
+
+    with pytest.raises(QueueFullError) as exc_info:
+        async with controller.admit(MODEL_ID):
+            pass
+    assert exc_info.value.retry_after >= 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == [0, 1, 2, 3]
+    assert queue.active == 0
+    assert MODEL_ID not in controller.in_flight
+    assert not controller.is_saturated()
+    assert queue.admitted == 4
+    assert queue.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_request_times_out_in_queue() -> None:
+    controller = AdmissionController(AdmissionConfig(max_concurrent_requests=1, max_queue_wait=0.1))
+    release = asyncio.Event()
+    task = asyncio.create_task(hold(controller, [], 0, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(QueueTimeoutError):
+        async with controller.admit(MODEL_ID):
+            pass
+    queue = controller.queues[MODEL_ID]
+    assert queue.timed_out == 1
+    assert queue.queue_depth == 0
+
+    release.set()
+    await task
+    assert queue.active == 0
+
+
+@pytest.mark.asyncio
+async def test_unlimited_by_default() -> None:
+    controller = AdmissionController(AdmissionConfig())
+    async with controller.admit(MODEL_ID):
+        assert controller.in_flight[MODEL_ID] == 1
+    assert controller.queues == {}
+
+
+@pytest.mark.asyncio
+async def test_held_slot_is_released_once_the_stream_is_done() -> None:
+    controller = AdmissionController(AdmissionConfig(max_concurrent_requests=1))
+
+    async def body() -> AsyncGenerator[str, None]:
+        yield "hello"
+        yield "world"
+
+    async with controller.admit(MODEL_ID) as slot:
+        slot.hold()
+        stream = slot.release_after(body())
+    queue = controller.queues[MODEL_ID]
+    assert queue.active == 1
+    assert controller.in_flight[MODEL_ID] == 1
+    assert [chunk async for chunk in stream] == ["hello", "world"]
+    assert queue.active == 0
+    assert MODEL_ID not in controller.in_flight
+
+    # e.g. the client disconnected before the response got sent
+    async with controller.admit(MODEL_ID) as slot:
+        slot.hold()
+        stream = slot.release_after(body())
+    assert queue.active == 1
+    del stream
+    await asyncio.sleep(0)
+    assert queue.active == 0
+
+    async with controller.admit(MODEL_ID) as slot:
+        slot.hold()
+        stream = slot.release_after(body())
+    assert await anext(stream) == "hello"
+    await stream.aclose()  # pyright: ignore[reportAttributeAccessIssue]
+    assert queue.active == 0
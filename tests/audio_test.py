@@ -0,0 +1,129 @@
+from collections.abc import Callable, Generator
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+import io
+from pathlib import Path
+import wave
+
+from faster_whisper.audio import decode_audio
+import numpy as np
+import pytest
+import soundfile as sf
+
+from speaches.audio import PcmFormat, SpilledAudio, decode_audio_file, resample, sniff_wav
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.executors import RestartingProcessPoolExecutor
+
+SHARED_MEMORY_DIR = Path("/dev/shm")  # noqa: S108
+
+
+def wav_bytes(pcm: np.ndarray, sample_rate: int, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pcm() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(-32768, 32767, SAMPLES_PER_SECOND * 2, dtype=np.int16)
+
+
+def test_wav_is_read_without_decoding(pcm: np.ndarray) -> None:
+    file = io.BytesIO(wav_bytes(pcm, SAMPLES_PER_SECOND))
+    assert sniff_wav(file) == PcmFormat(sample_rate=SAMPLES_PER_SECOND, size=len(pcm) * 2)
+    file.seek(0)
+    np.testing.assert_array_equal(decode_audio_file(file), pcm.astype(np.float32) / 32768.0)
+
+
+def test_stereo_wav_is_downmixed_and_resampled(pcm: np.ndarray) -> None:
+    # 48kHz stereo, with the right channel silent
+    stereo = np.stack([np.repeat(pcm, 3), np.zeros(len(pcm) * 3, dtype=np.int16)], axis=1)
+    audio = decode_audio_file(io.BytesIO(wav_bytes(stereo, 3 * SAMPLES_PER_SECOND, channels=2)))
+    np.testing.assert_allclose(audio, pcm.astype(np.float32) / 32768.0 / 2, atol=1e-7)
+
+
+def test_raw_pcm(pcm: np.ndarray) -> None:
+    audio = decode_audio_file(io.BytesIO(pcm.tobytes()), PcmFormat(sample_rate=8000))
+    assert len(audio) == len(pcm) * 2
+    np.testing.assert_array_equal(audio[::2], pcm.astype(np.float32) / 32768.0)
+
+
+def test_resample_interpolates_other_ratios() -> None:
+    audio = np.linspace(0, 1, 44100, endpoint=False, dtype=np.float32)
+    resampled = resample(audio, 44100, SAMPLES_PER_SECOND)
+    assert len(resampled) == SAMPLES_PER_SECOND
+    np.testing.assert_allclose(resampled, np.linspace(0, 1, SAMPLES_PER_SECOND, endpoint=False), atol=1e-6)
+
+
+def test_compressed_audio_is_not_sniffed() -> None:
+    file = io.BytesIO(b"ID3\x04\x00" + bytes(100))
+    assert sniff_wav(file) is None
+    assert file.tell() == 0
+
+
+def test_native_wav_is_spilled_without_decoding(pcm: np.ndarray) -> None:
+    spilled = SpilledAudio.decode(io.BytesIO(wav_bytes(pcm, SAMPLES_PER_SECOND)))
+    assert spilled.samples == len(pcm)
+    np.testing.assert_array_equal(np.concatenate(list(spilled.chunks(1))), pcm.astype(np.float32) / 32768.0)
+
+
+def test_spilled_audio_is_closed_along_with_unfinished_chunks(pcm: np.ndarray) -> None:
+    with SpilledAudio.decode(io.BytesIO(wav_bytes(pcm, SAMPLES_PER_SECOND))) as spilled:
+        chunks = spilled.chunks(1)
+        next(chunks)
+    assert spilled.file.closed
+    assert next(chunks, None) is None
+
+
+def flac_bytes(pcm: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    sf.write(buffer, pcm, SAMPLES_PER_SECOND, format="FLAC")
+    return buffer.getvalue()
+
+
+def shared_memory_blocks() -> set[str]:
+    return {path.name for path in SHARED_MEMORY_DIR.glob("speaches_*")}
+
+
+@pytest.fixture(scope="module")
+def process_pool() -> Generator[RestartingProcessPoolExecutor, None, None]:
+    process_pool = RestartingProcessPoolExecutor(1)
+    yield process_pool
+    process_pool.shutdown()
+
+
+class LosingResultsExecutor(Executor):
+    """Runs the calls on `process_pool` and then fails them as if the worker had died before returning."""
+
+    def __init__(self, process_pool: Executor) -> None:
+        self.process_pool = process_pool
+
+    def submit(self, fn: Callable[..., object], /, *args: object, **kwargs: object) -> Future:  # pyright: ignore[reportIncompatibleMethodOverride]
+        self.process_pool.submit(fn, *args, **kwargs).result()
+        future = Future()
+        future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        return future
+
+
+@pytest.mark.skipif(not SHARED_MEMORY_DIR.is_dir(), reason="requires POSIX shared memory")
+def test_compressed_audio_is_decoded_in_a_process(pcm: np.ndarray, process_pool: RestartingProcessPoolExecutor) -> None:
+    data = flac_bytes(pcm)
+    blocks = shared_memory_blocks()
+    audio = decode_audio_file(io.BytesIO(data), process_pool=process_pool)
+    np.testing.assert_array_equal(audio, decode_audio(io.BytesIO(data)))
+    assert shared_memory_blocks() == blocks
+
+
+@pytest.mark.skipif(not SHARED_MEMORY_DIR.is_dir(), reason="requires POSIX shared memory")
+def test_shared_memory_is_unlinked_if_the_worker_fails(
+    pcm: np.ndarray, process_pool: RestartingProcessPoolExecutor
+) -> None:
+    blocks = shared_memory_blocks()
+    with pytest.raises(BrokenProcessPool):
+        decode_audio_file(io.BytesIO(flac_bytes(pcm)), process_pool=LosingResultsExecutor(process_pool))
+    assert shared_memory_blocks() == blocks
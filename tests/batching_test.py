@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+from faster_whisper.transcribe import BatchedInferencePipeline
+
+from speaches.batching import BatchScheduler, DynamicBatchedInferencePipeline, SharedBatchedInferencePipeline
+
+MODEL = "Systran/faster-whisper-tiny.en"
+
+
+def test_concurrent_requests_are_batched_together() -> None:
+    model = WhisperModel(MODEL)
+    audio = decode_audio("audio.wav")
+    expected = [segment.text for segment in BatchedInferencePipeline(model=model).transcribe(audio)[0]]
+
+    scheduler = BatchScheduler(model, max_batch_size=8, max_wait=0.5)
+
+    def transcribe() -> list[str]:
+        segments, _ = DynamicBatchedInferencePipeline(model, scheduler).transcribe(audio)
+        return [segment.text for segment in segments]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: transcribe(), range(4)))
+    assert all(result == expected for result in results)
+    assert scheduler.average_batch_size > 1
+
+
+def test_shared_pipeline_keeps_word_alignment_per_request() -> None:
+    model = WhisperModel(MODEL)
+    audio = decode_audio("audio.wav")
+    segments, _ = BatchedInferencePipeline(model=model).transcribe(audio, word_timestamps=True, batch_size=1)
+    expected = [segment.words for segment in segments]
+
+    pipeline = SharedBatchedInferencePipeline(model)
+    first, _ = pipeline.transcribe(audio, word_timestamps=True, batch_size=1)
+    second, _ = pipeline.transcribe(audio, word_timestamps=True, batch_size=1)
+    # interleave the two requests
+    results = list(zip(first, second, strict=True))
+    assert [a.words for a, _ in results] == expected
+    assert [b.words for _, b in results] == expected
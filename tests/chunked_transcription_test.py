@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+from speaches.chunked_transcription import ChunkedTranscription, split_at_silences
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.segments import Segment, Words
+
+SECOND = SAMPLES_PER_SECOND
+
+
+@dataclass
+class Info:
+    language: str
+    duration: float
+
+
+def test_split_at_silences() -> None:
+    speech_timestamps = [
+        {"start": 0, "end": 40 * SECOND},
+        {"start": 50 * SECOND, "end": 90 * SECOND},
+        {"start": 100 * SECOND, "end": 140 * SECOND},
+        {"start": 142 * SECOND, "end": 150 * SECOND},
+    ]
+    chunks = split_at_silences(speech_timestamps, 160 * SECOND, 100 * SECOND)
+    # the audio is covered without gaps, and the cuts are placed in the middle of silences
+    assert chunks == [(0, 95 * SECOND), (95 * SECOND, 160 * SECOND)]
+    assert split_at_silences([], 160 * SECOND, 100 * SECOND) == []
+
+
+def test_long_silences_are_cut_out() -> None:
+    # the speech fits into a single chunk, the silence after it doesn't
+    speech_timestamps = [{"start": 0, "end": 10 * SECOND}, {"start": 100 * SECOND, "end": 110 * SECOND}]
+    assert split_at_silences(speech_timestamps, 500 * SECOND, 120 * SECOND) == [(0, 120 * SECOND)]
+    # the cut in the middle of the silence would leave both chunks too long
+    speech_timestamps = [{"start": 0, "end": 10 * SECOND}, {"start": 400 * SECOND, "end": 410 * SECOND}]
+    assert split_at_silences(speech_timestamps, 500 * SECOND, 120 * SECOND) == [
+        (0, 120 * SECOND),
+        (290 * SECOND, 410 * SECOND),
+    ]
+    # a single speech region longer than the maximum gets its own chunk
+    speech_timestamps = [{"start": 0, "end": 10 * SECOND}, {"start": 200 * SECOND, "end": 350 * SECOND}]
+    assert split_at_silences(speech_timestamps, 500 * SECOND, 120 * SECOND) == [
+        (0, 105 * SECOND),
+        (200 * SECOND, 350 * SECOND),
+    ]
+
+
+def test_chunks_only_transcribe_their_speech() -> None:
+    calls: list[dict[str, Any]] = []
+
+    def transcribe_chunk(chunk: NDArray[np.float32], **kwargs) -> tuple[list[Segment], Info]:
+        calls.append(kwargs)
+        return [], Info(language="en", duration=len(chunk) / SAMPLES_PER_SECOND)
+
+    audio = np.zeros(500 * SECOND, dtype=np.float32)
+    speech_timestamps = [{"start": 0, "end": 10 * SECOND}, {"start": 400 * SECOND, "end": 410 * SECOND}]
+    chunks = split_at_silences(speech_timestamps, len(audio), 120 * SECOND)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        transcription = ChunkedTranscription(
+            transcribe_chunk,  # pyright: ignore[reportArgumentType]
+            audio,
+            chunks,
+            {"language": "en"},
+            executor,
+            speech_timestamps,
+        ).start()
+        assert list(transcription) == []
+    # relative to the start of their chunk
+    assert [call["speech_timestamps"] for call in calls] == [
+        [{"start": 0, "end": 10 * SECOND}],
+        [{"start": 110 * SECOND, "end": 120 * SECOND}],
+    ]
+
+
+def test_chunks_are_stitched_in_order() -> None:
+    calls: list[dict[str, Any]] = []
+
+    def transcribe_chunk(chunk: NDArray[np.float32], **kwargs) -> tuple[list[Segment], Info]:
+        calls.append(kwargs)
+        duration = len(chunk) / SAMPLES_PER_SECOND
+        segments = [
+            Segment(
+                id=i + 1,
+                seek=0,
+                start=start,
+                end=start + 1.0,
+                text=f" {start}",
+                tokens=[],
+                temperature=0.0,
+                avg_logprob=0.0,
+                compression_ratio=0.0,
+                no_speech_prob=0.0,
+                words=Words(
+                    start=np.array([start]),
+                    end=np.array([start + 1.0]),
+                    word=[f" {start}"],
+                    probability=np.array([1.0]),
+                ),
+            )
+            for i, start in enumerate((0.0, duration / 2))
+        ]
+        return segments, Info(language="de", duration=duration)
+
+    audio = np.zeros(30 * SECOND, dtype=np.float32)
+    chunks = [(0, 10 * SECOND), (10 * SECOND, 20 * SECOND), (20 * SECOND, 30 * SECOND)]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        transcription = ChunkedTranscription(transcribe_chunk, audio, chunks, {"language": None}, executor).start()  # pyright: ignore[reportArgumentType]
+        segments = list(transcription)
+
+    assert [segment.id for segment in segments] == [1, 2, 3, 4, 5, 6]
+    assert [segment.start for segment in segments] == [0, 5, 10, 15, 20, 25]
+    assert [segment.words.start[0] for segment in segments if segment.words is not None] == [0, 5, 10, 15, 20, 25]
+    assert transcription.info is not None
+    assert transcription.info.duration == 30
+    # the language detected in the first chunk is used for the others
+    assert [call["language"] for call in calls] == [None, "de", "de"]
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from fastapi import HTTPException
+from httpx import AsyncClient
+import pytest
+
+from speaches.config import Config, DecodingProfile, WhisperConfig
+from speaches.routers.stt import decoding_profile_params
+
+
+def test_decoding_profile_params() -> None:
+    config = Config(whisper=WhisperConfig(default_decoding_profile="balanced"))
+    assert decoding_profile_params(config, None) == {
+        "beam_size": 2,
+        "best_of": 2,
+        "condition_on_previous_text": False,
+    }
+    assert decoding_profile_params(config, "realtime") == {
+        "beam_size": 1,
+        "best_of": 1,
+        "condition_on_previous_text": False,
+        "without_timestamps": True,
+        "compression_ratio_threshold": None,
+    }
+    with pytest.raises(HTTPException):
+        decoding_profile_params(config, "fastest")
+
+
+def test_unset_options_keep_the_model_defaults() -> None:
+    config = Config(
+        whisper=WhisperConfig(
+            decoding_profiles={"greedy": DecodingProfile.model_validate({"beam_size": 1})},
+            default_decoding_profile=None,
+        )
+    )
+    assert decoding_profile_params(config, None) == {}
+    assert decoding_profile_params(config, "greedy") == {"beam_size": 1}
+
+
+@pytest.mark.asyncio
+async def test_unknown_decoding_profile(aclient: AsyncClient) -> None:
+    res = await aclient.post(
+        "/v1/audio/transcriptions",
+        files={"file": ("audio.wav", Path("audio.wav").read_bytes(), "audio/wav")},
+        data={"model": "Systran/faster-whisper-tiny.en", "decoding_profile": "fastest"},
+    )
+    assert res.status_code == 400
@@ -0,0 +1,23 @@
+from collections.abc import Generator
+import threading
+
+import pytest
+
+from speaches.config import ExecutorConfig
+from speaches.executors import WorkloadExecutors, iterate_in_executor, run_in_executor
+
+
+def thread_names(count: int) -> Generator[str, None, None]:
+    for _ in range(count):
+        yield threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_work_runs_on_the_workload_executor() -> None:
+    executors = WorkloadExecutors(ExecutorConfig(decode_workers=1, inference_workers=1, vad_workers=1))
+    thread_name = await run_in_executor(executors.decode, lambda: threading.current_thread().name)
+    assert thread_name.startswith("decode")
+
+    names = [name async for name in iterate_in_executor(executors.inference, thread_names(3))]
+    assert len(names) == 3
+    assert all(name.startswith("inference") for name in names)
@@ -0,0 +1,43 @@
+from collections.abc import Generator
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+from faster_whisper.vad import VadOptions
+import numpy as np
+import pytest
+
+from speaches.inference_host import InferenceHostClient, RemoteWhisperModelManager
+
+MODEL = "Systran/faster-whisper-tiny.en"
+
+
+@pytest.fixture
+def client(tmp_path: Path) -> Generator[InferenceHostClient, None, None]:
+    socket_path = tmp_path / "inference-host.sock"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "speaches.inference_host"],
+        env={**os.environ, "INFERENCE_HOST_SOCKET": str(socket_path), "WHISPER__TTL": "0"},
+    )
+    deadline = time.monotonic() + 30
+    while not socket_path.exists() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    yield InferenceHostClient(str(socket_path))
+    process.terminate()
+    process.wait()
+
+
+def test_speech_timestamps_of_silence_are_empty(client: InferenceHostClient) -> None:
+    assert client.get_speech_timestamps(np.zeros(16000, dtype=np.float32), VadOptions()) == []
+
+
+def test_transcription_is_forwarded_to_inference_host(client: InferenceHostClient) -> None:
+    model_manager = RemoteWhisperModelManager(client)
+    with model_manager.load_model(MODEL) as whisper:
+        segments, transcription_info = whisper.transcribe(np.zeros(16000, dtype=np.float32))
+        assert transcription_info.duration == 1
+        list(segments)
+    with pytest.raises(KeyError):
+        model_manager.unload_model(MODEL)  # unloaded right after usage since the TTL is 0
@@ -0,0 +1,73 @@
+from collections.abc import Generator
+import os
+import time
+
+import pytest
+
+from speaches.model_host import ModelHost, ModelHostCrashedError
+
+
+def load_counter(start: int) -> dict[str, int]:
+    return {"start": start}
+
+
+def count(model: dict[str, int], n: int) -> Generator[int, None, None]:
+    yield from range(model["start"], model["start"] + n)
+
+
+def crash(_model: dict[str, int]) -> None:
+    os._exit(1)
+
+
+def hang(_model: dict[str, int]) -> None:
+    time.sleep(3600)
+
+
+HANDLERS = {"count": count, "crash": crash, "hang": hang}
+
+
+@pytest.fixture
+def host() -> Generator[ModelHost, None, None]:
+    host = ModelHost("counter", load_counter, (10,), HANDLERS, check_interval=0.1, hang_timeout=1)
+    yield host
+    host.close()
+
+
+def test_abandoned_stream_does_not_leak_into_next_request(host: ModelHost) -> None:
+    stream = host.call_stream("count", 1000)
+    assert next(stream) == 10
+    stream.close()
+    assert list(host.call_stream("count", 3)) == [10, 11, 12]
+
+
+def test_model_host_is_respawned_after_crash(host: ModelHost) -> None:
+    pid = host.pid
+    with pytest.raises(ModelHostCrashedError):
+        host.call("crash")
+    deadline = time.monotonic() + 30
+    while host.restarts == 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert host.restarts == 1
+    assert host.pid != pid
+    assert list(host.call_stream("count", 2)) == [10, 11]
+
+
+def test_hung_request_restarts_the_model_host(host: ModelHost) -> None:
+    pid = host.pid
+    with pytest.raises(ModelHostCrashedError):
+        host.call("hang")
+    deadline = time.monotonic() + 30
+    while host.restarts == 0 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert host.restarts == 1
+    assert host.pid != pid
+    assert list(host.call_stream("count", 2)) == [10, 11]
+
+
+def test_slow_consumer_or_idle_host_isnt_considered_hung(host: ModelHost) -> None:
+    stream = host.call_stream("count", 2)
+    assert next(stream) == 10
+    time.sleep(2 * host.hang_timeout)
+    assert list(stream) == [11]
+    time.sleep(2 * host.hang_timeout)
+    assert host.restarts == 0
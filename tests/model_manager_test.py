@@ -1,12 +1,25 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import threading
+import time
 
 import anyio
+import numpy as np
 import pytest
 
 from speaches.config import Config, WhisperConfig
+from speaches.model_manager import (
+    ModelReaper,
+    ModelResidencyController,
+    ModelWarmer,
+    SelfDisposingModel,
+    WhisperReplicaPool,
+)
 from tests.conftest import AclientFactory
 
 MODEL = "Systran/faster-whisper-tiny.en"
+MB = 1024**2
 
 
 @pytest.mark.asyncio
@@ -98,7 +111,8 @@ async def test_model_cant_be_loaded_twice(aclient_factory: AclientFactory) -> No
         res = await aclient.post(f"/api/ps/{MODEL}")
         assert res.status_code == 409
         res = (await aclient.get("/api/ps")).json()
-        assert len(res["models"]) == 1
+        assert res["models"] == [MODEL]
+        assert res["running_models"][0]["state"] == "loaded"
 
 
 @pytest.mark.asyncio
@@ -115,3 +129,152 @@ async def test_model_is_unloaded_after_request_when_ttl_is_zero(aclient_factory:
         )
         res = (await aclient.get("/api/ps")).json()
         assert len(res["models"]) == 0
+
+
+def test_least_recently_used_idle_model_is_evicted_when_over_memory_budget() -> None:
+    residency_controller = ModelResidencyController(memory_budget=300 * MB, pinned_model_ids=["pinned"])
+    models = {
+        model_id: SelfDisposingModel(
+            model_id,
+            load_fn=lambda: np.ones(128 * MB, dtype=np.uint8),  # `np.ones` touches every page
+            ttl=-1,
+            residency_controller=residency_controller,
+        )
+        for model_id in ["pinned", "first", "second"]
+    }
+    for model in models.values():
+        with model:
+            pass
+    # loading "second" should have pushed the footprint over the budget, evicting "first" and keeping "pinned"
+    assert models["pinned"].model is not None
+    assert models["first"].model is None
+    assert models["second"].model is not None
+    assert residency_controller.used_memory <= 300 * MB
+
+
+def test_concurrent_requests_share_a_single_load() -> None:
+    load_count = 0
+
+    def load_fn() -> object:
+        nonlocal load_count
+        load_count += 1
+        time.sleep(0.5)
+        return object()
+
+    model = SelfDisposingModel("slow", load_fn=load_fn, ttl=-1)
+
+    def use_model() -> object:
+        with model as loaded_model:
+            return loaded_model
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(use_model) for _ in range(8)]
+        time.sleep(0.1)
+        assert model.state == "loading"
+        loading_elapsed = model.loading_elapsed
+        assert loading_elapsed is not None and loading_elapsed > 0
+        loaded_models = {id(future.result()) for future in futures}
+    assert load_count == 1
+    assert len(loaded_models) == 1
+    assert model.state == "loaded"
+    assert model.ref_count == 0
+
+
+def test_replica_pool_scales_up_to_max_replicas_under_concurrent_load() -> None:
+    max_replicas = 3
+    pool = WhisperReplicaPool(
+        "replicated",
+        max_replicas=max_replicas,
+        create_replica=lambda: SelfDisposingModel("replicated", load_fn=object, ttl=-1),
+    )
+    in_use = 0
+    peak_in_use = 0
+    lock = threading.Lock()
+
+    def use_model() -> None:
+        nonlocal in_use, peak_in_use
+        with pool.lease():
+            with lock:
+                in_use += 1
+                peak_in_use = max(peak_in_use, in_use)
+            time.sleep(0.2)
+            with lock:
+                in_use -= 1
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        for future in [executor.submit(use_model) for _ in range(10)]:
+            future.result()
+    assert peak_in_use == max_replicas
+    assert len(pool.replicas) == max_replicas
+    assert len(pool.busy_replicas) == 0
+    assert pool.queue_depth == 0
+
+
+def test_replica_pool_shares_replicas_up_to_max_leases_per_replica() -> None:
+    pool = WhisperReplicaPool(
+        "shared",
+        max_replicas=2,
+        create_replica=lambda: SelfDisposingModel("shared", load_fn=object, ttl=-1),
+        max_leases_per_replica=3,
+    )
+    leases = [pool.lease() for _ in range(4)]
+    models = [lease.__enter__() for lease in leases]
+    assert len(pool.replicas) == 2
+    assert models[0] is models[1] is models[2]
+    assert models[3] is not models[0]
+    for lease in leases:
+        lease.__exit__(None, None, None)
+    assert len(pool.busy_replicas) == 0
+
+
+def test_reaper_unloads_model_after_ttl_and_cancels_on_reuse() -> None:
+    reaper = ModelReaper()
+    model = SelfDisposingModel("reaped", load_fn=object, ttl=1, reaper=reaper)
+    with model:
+        pass
+    assert (reaper.scheduled, reaper.cancelled, reaper.executed) == (1, 0, 0)
+    time.sleep(0.5)
+    with model:  # using the model should push back the unload
+        pass
+    assert (reaper.scheduled, reaper.cancelled, reaper.executed) == (2, 1, 0)
+    time.sleep(0.7)  # the first deadline has passed by now
+    assert model.state == "loaded"
+    time.sleep(0.6)
+    assert model.state == "unloaded"
+    assert (reaper.scheduled, reaper.cancelled, reaper.executed) == (2, 1, 1)
+
+
+def test_model_with_zero_ttl_is_unloaded_without_holding_its_lock() -> None:
+    held_during_callback: list[bool] = []
+
+    def model_unloaded_callback(_model_id: str) -> None:
+        # the model manager's lock gets acquired here, which must not happen while holding the model's lock
+        held_during_callback.append(model.rlock._is_owned())  # pyright: ignore[reportAttributeAccessIssue]  # noqa: SLF001
+
+    model = SelfDisposingModel("unloaded", load_fn=object, ttl=0, model_unloaded_callback=model_unloaded_callback)
+    with model:
+        pass
+    assert model.state == "unloaded"
+    assert held_during_callback == [False]
+
+
+def test_warmer_evicts_least_recently_warmed_model_and_releases_loaded_models(tmp_path: Path) -> None:
+    def list_files(model_id: str) -> list[Path]:
+        path = tmp_path / model_id
+        if not path.exists():
+            path.write_bytes(b"\0" * MB)
+        return [path]
+
+    warmer = ModelWarmer(budget=2 * MB, list_files=list_files)
+    assert warmer.warm("first")
+    assert warmer.warm("second")
+    assert not warmer.warm("third", evict=False)
+    assert warmer.warm("third")
+    assert list(warmer.list_warm_models()) == ["second", "third"]
+    assert warmer.used == 2 * MB
+
+    warmer.record_load("second")
+    warmer.record_load("first")
+    warmer.record_load("first")
+    assert list(warmer.list_warm_models()) == ["third"]
+    assert warmer.predict(exclude=["first"]) == ["second"]
@@ -0,0 +1,41 @@
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+
+from speaches.config import Config, VadConfig, WhisperConfig
+from speaches.main import create_app
+from speaches.model_manager import KokoroModelManager, PiperModelManager, VadModelManager, WhisperModelManager
+from speaches.preload import ModelPreloader, parse_preload_model_id
+
+MODEL = "Systran/faster-whisper-tiny.en"
+
+
+def test_parse_preload_model_id() -> None:
+    assert parse_preload_model_id(MODEL) == ("whisper", MODEL)
+    assert parse_preload_model_id("hexgrad/Kokoro-82M/af") == ("kokoro", "af")
+    assert parse_preload_model_id("rhasspy/piper-voices/en_US-amy-medium") == ("piper", "en_US-amy-medium")
+    assert parse_preload_model_id("silero_vad_v5") == ("vad", "silero_vad_v5")
+
+
+def test_preloaded_models_are_loaded_and_warmed_up() -> None:
+    model_manager = WhisperModelManager(WhisperConfig(ttl=-1))
+    preloader = ModelPreloader(
+        [MODEL, "silero_vad_v5", "speaches-ai/does-not-exist"],
+        model_manager,
+        PiperModelManager(ttl=-1),
+        KokoroModelManager(ttl=-1),
+        VadModelManager(VadConfig()),
+    )
+    preloader.run()
+    assert preloader.ready.is_set()
+    assert set(preloader.timings) == {MODEL, "silero_vad_v5"}
+    assert set(preloader.failures) == {"speaches-ai/does-not-exist"}
+    assert model_manager.loaded_models[MODEL].state == "loaded"
+
+
+def test_preloader_is_started_once_the_app_starts(mocker: MockerFixture) -> None:
+    mocker.patch("speaches.main.get_config", return_value=Config(enable_ui=False))
+    preloader = mocker.patch("speaches.main.get_model_preloader").return_value
+    app = create_app()
+    preloader.start.assert_not_called()
+    with TestClient(app):
+        preloader.start.assert_called_once()
@@ -0,0 +1,91 @@
+import json
+from types import SimpleNamespace
+
+from faster_whisper.transcribe import Segment as FasterWhisperSegment
+from faster_whisper.transcribe import Word
+import pytest
+
+from speaches.api_types import (
+    CreateTranscriptionResponseJson,
+    CreateTranscriptionResponseVerboseJson,
+    TranscriptionSegment,
+)
+from speaches.segments import (
+    Segment,
+    segment_to_verbose_json,
+    segments_to_json,
+    segments_to_subtitles,
+    segments_to_verbose_json,
+)
+from speaches.text_utils import segments_to_srt, segments_to_vtt
+
+
+def faster_whisper_segments(*, word_timestamps: bool) -> list[FasterWhisperSegment]:
+    texts = [' Hello "world",', " naïve café\n", " 日本語"]
+    return [
+        FasterWhisperSegment(
+            id=i + 1,
+            seek=i * 300,
+            start=i * 3.0,
+            end=i * 3.0 + 2.5,
+            text=text,
+            tokens=[50364 + i, 1234],
+            avg_logprob=-0.25,
+            compression_ratio=1.1,
+            no_speech_prob=0.01,
+            words=[
+                Word(start=i * 3.0 + j * 0.1, end=i * 3.0 + j * 0.1 + 0.05, word=word, probability=0.9)
+                for j, word in enumerate(text.split(" "))
+            ]
+            if word_timestamps
+            else None,
+            temperature=0.0,
+        )
+        for i, text in enumerate(texts)
+    ]
+
+
+@pytest.mark.parametrize("word_timestamps", [True, False])
+def test_serialization_matches_api_types(word_timestamps: bool) -> None:
+    info = SimpleNamespace(
+        language="en", duration=9.0, transcription_options=SimpleNamespace(word_timestamps=word_timestamps)
+    )
+    segments = list(Segment.from_faster_whisper_segments(faster_whisper_segments(word_timestamps=word_timestamps)))
+    models = list(
+        TranscriptionSegment.from_faster_whisper_segments(faster_whisper_segments(word_timestamps=word_timestamps))
+    )
+
+    assert json.loads(segments_to_json(segments)) == json.loads(
+        CreateTranscriptionResponseJson.from_segments(models).model_dump_json()
+    )
+    assert json.loads(segments_to_verbose_json(segments, info)) == json.loads(  # pyright: ignore[reportArgumentType]
+        CreateTranscriptionResponseVerboseJson.from_segments(models, info).model_dump_json()  # pyright: ignore[reportArgumentType]
+    )
+    assert json.loads(segment_to_verbose_json(segments[1], info)) == json.loads(  # pyright: ignore[reportArgumentType]
+        CreateTranscriptionResponseVerboseJson.from_segment(models[1], info).model_dump_json()  # pyright: ignore[reportArgumentType]
+    )
+    assert segments_to_subtitles(segments, "srt") == "".join(segments_to_srt(s, i) for i, s in enumerate(models))
+    assert segments_to_subtitles(segments, "vtt") == "".join(segments_to_vtt(s, i) for i, s in enumerate(models))
+
+
+def test_offset() -> None:
+    (segment, *_) = Segment.from_faster_whisper_segments(faster_whisper_segments(word_timestamps=True))
+    segment.offset(30.0)
+    assert (segment.seek, segment.start, segment.end) == (3000, 30.0, 32.5)
+    assert segment.words is not None
+    assert segment.words.start.tolist() == [30.0, 30.1, 30.2]
+
+
+def test_offset_matches_api_types() -> None:
+    (segment, *_) = Segment.from_faster_whisper_segments(faster_whisper_segments(word_timestamps=True))
+    (model, *_) = TranscriptionSegment.from_faster_whisper_segments(faster_whisper_segments(word_timestamps=True))
+    segment.offset(30.0)
+    model.offset(30.0)
+    assert json.loads(segments_to_json([segment])) == json.loads(
+        CreateTranscriptionResponseJson.from_segments([model]).model_dump_json()
+    )
+    assert segment.words is not None
+    assert model.words is not None
+    assert (segment.seek, segment.start, segment.end) == (model.seek, model.start, model.end)
+    assert segment.words.start.tolist() == [word.start for word in model.words]
+    assert segment.words.end.tolist() == [word.end for word in model.words]
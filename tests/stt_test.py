@@ -0,0 +1,325 @@
+import asyncio
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import io
+from types import SimpleNamespace
+import wave
+
+from faster_whisper import WhisperModel
+from faster_whisper.transcribe import BatchedInferencePipeline
+from faster_whisper.transcribe import Segment as FasterWhisperSegment
+from httpx import ASGITransport, AsyncClient
+import numpy as np
+import pytest
+from pytest_mock import MockerFixture
+
+from speaches.audio import SpilledAudio
+from speaches.config import Config, LargeFileConfig, WhisperConfig
+from speaches.dependencies import get_config, get_model_manager, get_speech_probability_cache
+from speaches.main import create_app
+from speaches.routers.stt import UNKNOWN_LANGUAGE, run_transcription, transcribe_audio, window_transcriber
+from speaches.transcription_cache import TranscriptionCache
+from speaches.vad import WINDOW_SIZE_SAMPLES, SpeechProbabilityCache
+from speaches.windowed_transcription import WindowedTranscription
+
+MODEL = "Systran/faster-whisper-tiny.en"
+SECOND = 16000
+AUDIO = np.zeros(SECOND, dtype=np.float32)
+
+
+def fw_segment(i: int) -> FasterWhisperSegment:
+    return FasterWhisperSegment(
+        id=i + 1,
+        seek=0,
+        start=float(i),
+        end=i + 1.0,
+        text=f" segment {i}",
+        tokens=[],
+        avg_logprob=-0.1,
+        compression_ratio=1.0,
+        no_speech_prob=0.0,
+        words=None,
+        temperature=0.0,
+    )
+
+
+@dataclass
+class Info:
+    language: str
+    duration: float
+    duration_after_vad: float | None = None
+    transcription_options: object = field(default_factory=lambda: SimpleNamespace(word_timestamps=False))
+
+
+class FakeWhisper(WhisperModel):
+    def __init__(self) -> None:
+        self.leased = False
+        self.decoded_while_released = False
+        self.calls: list[dict[str, object]] = []
+        self.audio_durations: list[float] = []
+
+    def transcribe(  # pyright: ignore[reportIncompatibleMethodOverride]
+        self, audio: np.ndarray, **kwargs: object
+    ) -> tuple[Generator[FasterWhisperSegment], object]:
+        self.calls.append(kwargs)
+        self.audio_durations.append(len(audio) / SECOND)
+
+        def segments() -> Generator[FasterWhisperSegment]:
+            for i in range(3):
+                self.decoded_while_released |= not self.leased
+                yield fw_segment(i)
+
+        return segments(), Info(language="en", duration=len(audio) / SECOND)
+
+
+class FakeBatchedPipeline(BatchedInferencePipeline):
+    """Fails like `BatchedInferencePipeline.transcribe` does when given 30 seconds or more of audio without knowing where the speech is."""
+
+    def __init__(self) -> None:
+        self.leased = False
+        self.clip_timestamps: list[list[dict[str, int]]] = []
+
+    def transcribe(  # pyright: ignore[reportIncompatibleMethodOverride]
+        self,
+        audio: np.ndarray,
+        *,
+        vad_filter: bool = True,
+        clip_timestamps: list[dict[str, int]] | None = None,
+        chunk_length: int = 30,
+        **_kwargs: object,
+    ) -> tuple[Generator[FasterWhisperSegment], object]:
+        if not vad_filter and not clip_timestamps:
+            if len(audio) >= chunk_length * SECOND:
+                message = "No clip timestamps found. Set 'vad_filter' to True or provide 'clip_timestamps'."
+                raise RuntimeError(message)
+            clip_timestamps = [{"start": 0, "end": len(audio)}]
+        assert clip_timestamps is not None
+        # NOTE: `merge_segments` adds the regions that make up every clip
+        self.clip_timestamps.append([{"start": clip["start"], "end": clip["end"]} for clip in clip_timestamps])
+        segments = (fw_segment(i) for i in range(len(clip_timestamps)))
+        return segments, Info(language="en", duration=len(audio) / SECOND)
+
+
+def speech_probabilities(duration: int, speech: list[tuple[int, int]]) -> np.ndarray:
+    """Speech probabilities (see `SpeechProbabilityCache`) of `duration` seconds of audio with speech within the `(start, end)` seconds of `speech`."""
+    probabilities = np.zeros(duration * SECOND // WINDOW_SIZE_SAMPLES, dtype=np.float32)
+    for start, end in speech:
+        probabilities[start * SECOND // WINDOW_SIZE_SAMPLES : end * SECOND // WINDOW_SIZE_SAMPLES] = 1
+    return probabilities
+
+
+class FakeModelManager:
+    def __init__(self, whisper: FakeWhisper | FakeBatchedPipeline | None = None) -> None:
+        self.whisper = whisper or FakeWhisper()
+        self.loads = 0
+
+    @contextmanager
+    def load_model(self, _model_id: str) -> Generator[FakeWhisper | FakeBatchedPipeline]:
+        self.loads += 1
+        self.whisper.leased = True
+        try:
+            yield self.whisper
+        finally:
+            self.whisper.leased = False
+
+
+@pytest.mark.asyncio
+async def test_streamed_transcription_holds_the_model_until_the_segments_are_consumed() -> None:
+    model_manager = FakeModelManager()
+    with ThreadPoolExecutor(max_workers=1) as inference:
+        response = transcribe_audio(
+            Config(),
+            model_manager,  # pyright: ignore[reportArgumentType]
+            TranscriptionCache(max_entries=1),
+            SpeechProbabilityCache(max_entries=0, compute=lambda _: np.zeros(0, dtype=np.float32)),
+            SimpleNamespace(inference=inference),  # pyright: ignore[reportArgumentType]
+            AUDIO,
+            MODEL,
+            {"task": "transcribe"},
+            "text",
+            stream=True,
+        )
+        assert model_manager.whisper.leased
+        events = [event async for event in response.body_iterator]  # pyright: ignore[reportAttributeAccessIssue]
+    assert events == [f"data:  segment {i}\n\n" for i in range(3)]
+    assert not model_manager.whisper.leased
+    assert not model_manager.whisper.decoded_while_released
+
+
+def test_abandoned_stream_releases_the_model() -> None:
+    model_manager = FakeModelManager()
+    with ThreadPoolExecutor(max_workers=1) as inference:
+        response = transcribe_audio(
+            Config(),
+            model_manager,  # pyright: ignore[reportArgumentType]
+            TranscriptionCache(max_entries=1),
+            SpeechProbabilityCache(max_entries=0, compute=lambda _: np.zeros(0, dtype=np.float32)),
+            SimpleNamespace(inference=inference),  # pyright: ignore[reportArgumentType]
+            AUDIO,
+            MODEL,
+            {"task": "transcribe"},
+            "text",
+            stream=True,
+        )
+        assert model_manager.whisper.leased
+        del response
+    assert not model_manager.whisper.leased
+
+
+@pytest.mark.asyncio
+async def test_identical_streamed_requests_dont_deadlock() -> None:
+    model_manager = FakeModelManager()
+    transcription_cache = TranscriptionCache(max_entries=1)
+    speech_probability_cache = SpeechProbabilityCache(max_entries=0, compute=lambda _: np.zeros(0, dtype=np.float32))
+    # a single inference thread, which the first request needs to produce its segments
+    with ThreadPoolExecutor(max_workers=1) as inference, ThreadPoolExecutor(max_workers=1) as decode:
+        executors = SimpleNamespace(inference=inference, decode=decode)
+
+        async def transcribe() -> list[str]:
+            response = await run_transcription(
+                Config(),
+                model_manager,  # pyright: ignore[reportArgumentType]
+                transcription_cache,
+                speech_probability_cache,
+                executors,  # pyright: ignore[reportArgumentType]
+                AUDIO,
+                MODEL,
+                {"task": "transcribe"},
+                "text",
+                stream=True,
+            )
+            return [event async for event in response.body_iterator]  # pyright: ignore[reportAttributeAccessIssue]
+
+        results = await asyncio.wait_for(asyncio.gather(*(transcribe() for _ in range(3))), timeout=10)
+    assert all(result == results[0] for result in results)
+    assert model_manager.loads == 1
+    assert transcription_cache.misses == 1
+
+
+def test_chunks_pass_their_speech_to_batched_pipelines() -> None:
+    model_manager = FakeModelManager(FakeBatchedPipeline())
+    probabilities = speech_probabilities(500, [(0, 10), (400, 410), (420, 470)])
+    with ThreadPoolExecutor(max_workers=1) as inference, ThreadPoolExecutor(max_workers=2) as chunks:
+        response = transcribe_audio(
+            Config(),
+            model_manager,  # pyright: ignore[reportArgumentType]
+            TranscriptionCache(max_entries=1),
+            SpeechProbabilityCache(max_entries=0, compute=lambda _: probabilities),
+            SimpleNamespace(inference=inference, chunks=chunks),  # pyright: ignore[reportArgumentType]
+            np.zeros(500 * SECOND, dtype=np.float32),
+            MODEL,
+            {"task": "transcribe", "language": "en"},
+            "text",
+            stream=False,
+            chunking_strategy="auto",
+        )
+    assert isinstance(model_manager.whisper, FakeBatchedPipeline)
+    # both chunks are longer than 30 seconds and only have their speech transcribed, in clips of at most 30 seconds
+    first_chunk, second_chunk = model_manager.whisper.clip_timestamps
+    assert len(first_chunk) == 1
+    assert 9 * SECOND < first_chunk[0]["end"] - first_chunk[0]["start"] < 11 * SECOND
+    assert len(second_chunk) > 1
+    assert all(clip["end"] - clip["start"] <= 30 * SECOND for clip in second_chunk)
+    assert response.status_code == 200
+
+
+def test_windows_are_transcribed_by_batched_pipelines() -> None:
+    model_manager = FakeModelManager(FakeBatchedPipeline())
+    chunks = (np.zeros(5 * SECOND, dtype=np.float32) for _ in range(15))
+    transcription = WindowedTranscription(
+        window_transcriber(Config(), model_manager, MODEL),  # pyright: ignore[reportArgumentType]
+        chunks,
+        {"task": "transcribe", "vad_filter": False},
+    ).start()
+    segments = list(transcription)
+    assert isinstance(model_manager.whisper, FakeBatchedPipeline)
+    # two full windows and the remaining 15 seconds
+    assert model_manager.whisper.clip_timestamps == [
+        [{"start": 0, "end": 30 * SECOND}],
+        [{"start": 0, "end": 30 * SECOND}],
+        [{"start": 0, "end": 15 * SECOND}],
+    ]
+    assert [segment.start for segment in segments] == [0, 30, 60]
+
+
+def wav_file(audio: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SECOND)
+        f.writeframes((audio * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+@contextmanager
+def fake_app_client(
+    mocker: MockerFixture, model_manager: FakeModelManager, probabilities: np.ndarray, config: Config | None = None
+) -> Generator[AsyncClient]:
+    if config is None:
+        config = Config(whisper=WhisperConfig(ttl=0), enable_ui=False)
+    mocker.patch("speaches.dependencies.get_config", return_value=config)
+    mocker.patch("speaches.main.get_config", return_value=config)
+    app = create_app()
+    app.dependency_overrides[get_config] = lambda: config
+    app.dependency_overrides[get_model_manager] = lambda: model_manager
+    speech_probability_cache = SpeechProbabilityCache(max_entries=0, compute=lambda _: probabilities)
+    app.dependency_overrides[get_speech_probability_cache] = lambda: speech_probability_cache
+    yield AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.mark.asyncio
+async def test_audio_without_speech_isnt_transcribed(mocker: MockerFixture) -> None:
+    model_manager = FakeModelManager()
+    with fake_app_client(mocker, model_manager, speech_probabilities(10, [])) as aclient:
+        res = await aclient.post(
+            "/v1/audio/transcriptions",
+            files={"file": ("audio.wav", wav_file(np.zeros(10 * SECOND, dtype=np.float32)), "audio/wav")},
+            data={"model": MODEL, "vad_filter": "true", "response_format": "verbose_json"},
+        )
+    assert res.status_code == 200
+    assert res.json()["text"] == ""
+    assert res.json()["segments"] == []
+    # the language can't be detected without speech
+    assert res.json()["language"] == UNKNOWN_LANGUAGE
+    assert model_manager.loads == 0
+
+
+@pytest.mark.asyncio
+async def test_only_the_speech_is_transcribed(mocker: MockerFixture) -> None:
+    model_manager = FakeModelManager()
+    with fake_app_client(mocker, model_manager, speech_probabilities(40, [(5, 10), (25, 30)])) as aclient:
+        res = await aclient.post(
+            "/v1/audio/transcriptions",
+            files={"file": ("audio.wav", wav_file(np.zeros(40 * SECOND, dtype=np.float32)), "audio/wav")},
+            data={"model": MODEL, "vad_filter": "true", "response_format": "verbose_json"},
+        )
+    assert res.status_code == 200
+    assert model_manager.loads == 1
+    (call,) = model_manager.whisper.calls
+    assert call["vad_filter"] is False
+    # only the two speech regions, padded by `VadOptions.speech_pad_ms`, are transcribed as one
+    (audio_duration,) = model_manager.whisper.audio_durations
+    assert 10 < audio_duration < 12
+    # and the timestamps point back into the whole audio
+    starts = [segment["start"] for segment in res.json()["segments"]]
+    for start, expected in zip(starts, (5, 6, 7), strict=True):
+        assert abs(start - expected) < 0.5
+
+
+@pytest.mark.asyncio
+async def test_spilled_audio_is_closed_once_the_response_has_been_streamed(mocker: MockerFixture) -> None:
+    model_manager = FakeModelManager()
+    close = mocker.spy(SpilledAudio, "close")
+    config = Config(whisper=WhisperConfig(ttl=0), large_file=LargeFileConfig(min_upload_size=0), enable_ui=False)
+    with fake_app_client(mocker, model_manager, speech_probabilities(5, []), config) as aclient:
+        res = await aclient.post(
+            "/v1/audio/transcriptions",
+            files={"file": ("audio.wav", wav_file(np.zeros(5 * SECOND, dtype=np.float32)), "audio/wav")},
+            data={"model": MODEL, "stream": "true"},
+        )
+    assert res.status_code == 200
+    assert "segment 2" in res.text
+    close.assert_called_once()
@@ -0,0 +1,106 @@
+import asyncio
+from collections.abc import Generator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import threading
+
+import numpy as np
+import pytest
+from pytest_mock import MockerFixture
+
+from speaches.transcription_cache import TranscriptionCache, audio_digest
+
+MODEL = "Systran/faster-whisper-tiny.en"
+AUDIO = np.linspace(-1, 1, 16000, dtype=np.float32)
+PARAMS = {"task": "transcribe", "language": "en", "temperature": 0.0}
+
+
+def transcribe(cache: TranscriptionCache, segments: list[str], started: threading.Event | None = None) -> list[str]:
+    def generate() -> Generator[str, None, None]:
+        if started is not None:
+            started.wait()
+        yield from segments
+
+    with cache.lookup(AUDIO, MODEL, PARAMS) as cached:
+        if cached.result is not None:
+            return cached.result[0]  # pyright: ignore[reportReturnType]
+        return list(cached.record(generate(), None))  # pyright: ignore[reportArgumentType]
+
+
+def test_repeated_request_is_served_from_memory() -> None:
+    cache = TranscriptionCache(max_entries=1)
+    assert transcribe(cache, ["hello", "world"]) == ["hello", "world"]
+    assert transcribe(cache, ["not", "used"]) == ["hello", "world"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    with cache.lookup(AUDIO, MODEL, {**PARAMS, "temperature": 0.2}) as cached:
+        assert cached.result is None
+
+
+def test_identical_concurrent_requests_share_one_transcription() -> None:
+    cache = TranscriptionCache(max_entries=1)
+    started = threading.Event()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(transcribe, cache, ["hello"], started)
+        while len(cache.in_flight) == 0:
+            pass
+        others = [executor.submit(transcribe, cache, ["not", "used"]) for _ in range(3)]
+        started.set()
+        assert first.result() == ["hello"]
+        assert all(other.result() == ["hello"] for other in others)
+    # requests arriving after the first one has finished are plain hits
+    assert cache.misses == 1
+    assert cache.coalesced + cache.hits == 3
+
+
+@pytest.mark.asyncio
+async def test_waiting_for_an_in_flight_transcription_doesnt_block_a_thread() -> None:
+    cache = TranscriptionCache(max_entries=1)
+    leader = cache.lookup(AUDIO, MODEL, PARAMS)
+    segments = leader.record(iter(["hello", "world"]), None)  # pyright: ignore[reportArgumentType]
+    # without waiting, an identical request transcribes on its own and doesn't get recorded
+    with cache.lookup(AUDIO, MODEL, PARAMS, wait=False) as cached:
+        assert cached.result is None
+        assert list(cached.record(iter(["hello"]), None)) == ["hello"]  # pyright: ignore[reportArgumentType]
+
+    waiter = asyncio.create_task(cache.wait_for_in_flight(audio_digest(AUDIO), MODEL, PARAMS))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    assert list(segments) == ["hello", "world"]
+    await asyncio.wait_for(waiter, timeout=1)
+    with cache.lookup(AUDIO, MODEL, PARAMS, wait=False) as cached:
+        assert cached.result is not None
+        assert cached.result[0] == ["hello", "world"]
+    assert (cache.misses, cache.coalesced) == (1, 1)
+
+
+def test_abandoned_transcription_is_not_cached() -> None:
+    cache = TranscriptionCache(max_entries=1)
+    with cache.lookup(AUDIO, MODEL, PARAMS) as cached:
+        segments = cached.record(iter(["hello", "world"]), None)  # pyright: ignore[reportArgumentType]
+        next(segments)
+    del segments
+    assert len(cache.in_flight) == 0
+    assert transcribe(cache, ["hello", "world"]) == ["hello", "world"]
+    assert cache.misses == 2
+
+
+def test_results_survive_restarts_on_disk(tmp_path: Path) -> None:
+    transcribe(TranscriptionCache(max_entries=0, disk_dir=tmp_path), ["hello"])
+    cache = TranscriptionCache(max_entries=0, disk_dir=tmp_path)
+    assert transcribe(cache, ["not", "used"]) == ["hello"]
+    assert cache.disk_hits == 1
+
+
+def test_disk_is_only_scanned_once_it_exceeds_its_max_size(tmp_path: Path, mocker: MockerFixture) -> None:
+    transcribe(TranscriptionCache(max_entries=0, disk_dir=tmp_path), ["hello"])
+    entry_size = sum(path.stat().st_size for path in tmp_path.glob("*.pkl"))
+    cache = TranscriptionCache(max_entries=0, disk_dir=tmp_path, disk_max_size=int(entry_size * 4.5))
+    assert cache.disk_size == entry_size
+    trim_disk = mocker.spy(cache, "_trim_disk")
+    for temperature in range(1, 10):
+        with cache.lookup(AUDIO, MODEL, {**PARAMS, "temperature": temperature / 10}) as cached:
+            list(cached.record(iter(["hello"]), None))  # pyright: ignore[reportArgumentType]
+    assert trim_disk.call_count < 9
+    assert cache.disk_size == sum(path.stat().st_size for path in tmp_path.glob("*.pkl"))
+    assert cache.disk_size <= entry_size * 4.5
@@ -1,13 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
 from pathlib import Path
+import threading
+import zipfile
 
 import anyio
+from faster_whisper import BatchedInferencePipeline
+from faster_whisper.audio import decode_audio
+import faster_whisper.vad
+from faster_whisper.vad import VadOptions, get_speech_timestamps, get_vad_model, merge_segments
 from httpx import AsyncClient
+import numpy as np
 import pytest
 
-from speaches.routers.vad import SpeechTimestamp
+from speaches.config import VadConfig
+from speaches.routers.vad import FileSpeechTimestamps, SpeechProbabilities, SpeechTimestamp
+from speaches.vad import (
+    SileroVadModel,
+    SpeechProbabilityCache,
+    VadBatchScheduler,
+    batched_vad_options,
+    merge_speech_timestamps,
+    speech_timestamps,
+    transcribe_speech,
+)
 
 FILE_PATH = "audio.wav"
 ENDPOINT = "/v1/audio/speech/timestamps"
+BATCH_ENDPOINT = "/v1/audio/speech/timestamps/batch"
 
 
 @pytest.mark.asyncio
@@ -22,4 +42,145 @@ async def test_speech_timestamps_basic(aclient: AsyncClient) -> None:
     assert len(speech_timestamps) == 1
 
 
+@pytest.mark.asyncio
+async def test_speech_probabilities_response_formats(aclient: AsyncClient) -> None:
+    data = Path(FILE_PATH).read_bytes()
+    files = {"file": ("audio.wav", data, "audio/wav")}
+    res = await aclient.post(ENDPOINT, files=files, data={"response_format": "probabilities"})
+    res.raise_for_status()
+    probabilities = SpeechProbabilities.model_validate_json(res.text)
+    res = await aclient.post(ENDPOINT, files=files, data={"response_format": "probabilities_f32"})
+    res.raise_for_status()
+    assert res.headers["x-window-size-samples"] == str(probabilities.window_size_samples)
+    np.testing.assert_array_equal(np.frombuffer(res.content, dtype="<f4"), probabilities.probabilities)
+
+
+@pytest.mark.asyncio
+async def test_batch_speech_timestamps(aclient: AsyncClient) -> None:
+    data = Path(FILE_PATH).read_bytes()
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as f:
+        f.writestr("clips/audio.wav", data)
+        f.writestr("clips/notes.txt", b"not audio")
+    res = await aclient.post(
+        BATCH_ENDPOINT,
+        files=[
+            ("files", ("first.wav", data, "audio/wav")),
+            ("files", ("second.wav", data, "audio/wav")),
+            ("archive", ("clips.zip", archive.getvalue(), "application/zip")),
+        ],
+    )
+    res.raise_for_status()
+    assert res.headers["content-type"] == "application/x-ndjson"
+    results = sorted(
+        (FileSpeechTimestamps.model_validate_json(line) for line in res.text.splitlines()), key=lambda x: x.index
+    )
+    assert [result.filename for result in results] == ["first.wav", "second.wav", "clips/audio.wav", "clips/notes.txt"]
+    for result in results[:3]:
+        assert result.speech_timestamps is not None
+        assert len(result.speech_timestamps) == 1
+    assert results[3].error is not None
+
+
+@pytest.mark.parametrize(
+    "vad_options",
+    [
+        VadOptions(),
+        VadOptions(threshold=0.3, min_silence_duration_ms=100, speech_pad_ms=100),
+        VadOptions(max_speech_duration_s=2),
+    ],
+)
+def test_speech_timestamps_match_faster_whisper(vad_options: VadOptions) -> None:
+    audio = decode_audio(FILE_PATH)
+    probabilities = SileroVadModel.load(VadConfig()).speech_probabilities(audio)
+    assert speech_timestamps(probabilities, len(audio), vad_options) == get_speech_timestamps(audio, vad_options)
+
+
+@pytest.mark.parametrize(
+    "vad_options",
+    [
+        VadOptions(),
+        VadOptions(threshold=0.5, neg_threshold=0.5, min_silence_duration_ms=0, speech_pad_ms=0),
+        VadOptions(min_speech_duration_ms=500, min_silence_duration_ms=300, speech_pad_ms=200),
+        VadOptions(max_speech_duration_s=3),
+        VadOptions(max_speech_duration_s=1, min_silence_duration_ms=50),
+    ],
+)
+def test_speech_timestamps_match_faster_whisper_on_random_probabilities(
+    vad_options: VadOptions, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    rng = np.random.default_rng(0)
+    # alternating runs of (noisy) speech and silence, from a single window up to a few seconds
+    run_lengths = rng.integers(1, 150, size=400)
+    levels = np.resize([0.9, 0.1], len(run_lengths))
+    probabilities = np.clip(np.repeat(levels, run_lengths) + rng.normal(0, 0.2, run_lengths.sum()), 0, 1)
+    probabilities = probabilities.astype(np.float32)
+    audio = np.zeros(len(probabilities) * 512 - 100, dtype=np.float32)
+    monkeypatch.setattr(faster_whisper.vad, "get_vad_model", lambda: lambda _: probabilities[np.newaxis])
+    assert speech_timestamps(probabilities, len(audio), vad_options) == get_speech_timestamps(audio, vad_options)
+
+
+def test_batched_speech_probabilities_match_individual_streams() -> None:
+    model = SileroVadModel.load(VadConfig())
+    audio = decode_audio(FILE_PATH)
+    # lengths which are (and aren't) a multiple of the window size, and shorter than the context
+    audios = [audio[:16000], audio, audio[4096:12288], audio[:40]]
+    batched = model.batch_speech_probabilities(audios)
+    for stream, probabilities in zip(audios, batched, strict=True):
+        expected = get_vad_model()(np.pad(stream, (0, 512 - len(stream) % 512)).reshape(1, -1)).reshape(-1)
+        np.testing.assert_allclose(probabilities, expected, atol=1e-5)
+
+    scheduler = VadBatchScheduler(model, max_batch_size=4)
+    with ThreadPoolExecutor(max_workers=len(audios)) as executor:
+        scheduled = list(executor.map(scheduler.speech_probabilities, audios))
+    for probabilities, expected in zip(scheduled, batched, strict=True):
+        np.testing.assert_allclose(probabilities, expected, atol=1e-5)
+
+
+def test_speech_probabilities_are_computed_once_per_audio() -> None:
+    calls = 0
+    started = threading.Event()
+
+    def compute(audio: np.ndarray) -> np.ndarray:
+        nonlocal calls
+        calls += 1
+        started.wait()
+        return np.ones(len(audio) // 512 + 1, dtype=np.float32)
+
+    cache = SpeechProbabilityCache(max_entries=1, compute=compute)
+    audio = np.zeros(16000, dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(cache.speech_timestamps, audio, VadOptions()) for _ in range(4)]
+        started.set()
+        assert all(future.result() == [{"start": 0, "end": 16000}] for future in futures)
+    cache.speech_timestamps(audio, VadOptions(threshold=0.9, speech_pad_ms=0))
+    assert calls == 1
+    assert (cache.hits, cache.misses) == (4, 1)
+
+    cache.probabilities(np.ones(16000, dtype=np.float32))
+    cache.probabilities(audio)
+    assert calls == 3
+
+
+def test_merge_speech_timestamps() -> None:
+    speech = [{"start": 0, "end": 100}, {"start": 200, "end": 300}, {"start": 900, "end": 1000}]
+    assert merge_speech_timestamps(speech, 500) == [{"start": 0, "end": 300}, {"start": 900, "end": 1000}]
+    assert merge_speech_timestamps(speech, 50) == speech
+
+
+def test_batched_pipelines_get_clips_merged_like_their_own_vad_filter() -> None:
+    second = 16000
+    # padded regions can overlap, which `merge_segments` undoes in place
+    speech = [{"start": i * 5 * second, "end": (i * 5 + 6) * second} for i in range(10)]
+    pipeline = BatchedInferencePipeline.__new__(BatchedInferencePipeline)
+    calls: list[dict[str, object]] = []
+    pipeline.transcribe = lambda _audio, **kwargs: calls.append(kwargs)  # pyright: ignore[reportAttributeAccessIssue]
+    transcribe_speech(pipeline, np.zeros(60 * second, dtype=np.float32), speech)
+    (kwargs,) = calls
+    assert kwargs["vad_filter"] is False
+    assert kwargs["clip_timestamps"] == merge_segments([dict(x) for x in speech], batched_vad_options())
+    assert all(clip["end"] - clip["start"] <= 30 * second for clip in kwargs["clip_timestamps"])  # pyright: ignore[reportIndexIssue, reportAttributeAccessIssue]
+    assert speech[1] == {"start": 5 * second, "end": 11 * second}
+
+
 # TODO: add more tests
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.segments import Segment
+from speaches.windowed_transcription import WindowedTranscription
+
+SEGMENT_SECONDS = 10
+
+
+@dataclass
+class Info:
+    language: str
+    duration: float
+
+
+class FakeWhisper:
+    """Splits every window into `SEGMENT_SECONDS` long segments."""
+
+    def __init__(self) -> None:
+        self.calls: list[dict[str, Any]] = []
+
+    def __call__(self, window: NDArray[np.float32], **kwargs) -> tuple[list[Segment], Info]:
+        self.calls.append(kwargs)
+        duration = len(window) / SAMPLES_PER_SECOND
+        starts = range(0, int(np.ceil(duration)), SEGMENT_SECONDS)
+        segments = [
+            Segment(
+                id=i + 1,
+                seek=0,
+                start=start,
+                end=min(start + SEGMENT_SECONDS, duration),
+                text=f" {start}",
+                tokens=[],
+                temperature=0.0,
+                avg_logprob=0.0,
+                compression_ratio=0.0,
+                no_speech_prob=0.0,
+                words=None,
+            )
+            for i, start in enumerate(starts)
+        ]
+        return segments, Info(language="en", duration=duration)
+
+
+def one_second_chunks(seconds: int) -> list[NDArray[np.float32]]:
+    return [np.zeros(SAMPLES_PER_SECOND, dtype=np.float32) for _ in range(seconds)]
+
+
+def test_windows_are_transcribed_as_audio_arrives() -> None:
+    whisper = FakeWhisper()
+    transcription = WindowedTranscription(whisper, one_second_chunks(65), {"language": None})  # pyright: ignore[reportArgumentType]
+    chunks = transcription.chunks
+    transcription.start()
+    # only the first window has been read
+    assert len(list(chunks)) == 35
+
+    transcription = WindowedTranscription(whisper, one_second_chunks(65), {"language": None}).start()  # pyright: ignore[reportArgumentType]
+    segments = list(transcription)
+    # the last segment of every window but the final one gets transcribed again as part of the next window
+    assert [segment.start for segment in segments] == [0, 10, 20, 30, 40, 50, 60]
+    assert [segment.id for segment in segments] == [1, 2, 3, 4, 5, 6, 7]
+    assert segments[-1].end == 65
+    assert segments[2].seek == 20 * 100
+    assert transcription.windows == 3
+    assert transcription.info is not None
+    assert transcription.info.duration == 65
+    # the language detected in the first window and the text kept from the previous window are used for the next one
+    assert whisper.calls[-1]["language"] == "en"
+    assert whisper.calls[-1]["initial_prompt"] == " 0 10"
+
+
+def test_initial_prompt_is_kept_in_front_of_the_previous_window() -> None:
+    whisper = FakeWhisper()
+    params = {"language": None, "initial_prompt": "Speaches."}
+    list(WindowedTranscription(whisper, one_second_chunks(65), params).start())  # pyright: ignore[reportArgumentType]
+    assert whisper.calls[0]["initial_prompt"] == "Speaches."
+    assert whisper.calls[-1]["initial_prompt"] == "Speaches. 0 10"